@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+# Packs every frame of every valid RSI into pre-built atlas pages, plus an index mapping
+# (rsi, state, direction, frame) to a rectangle on a page.
+#
+# Output is deterministic: the same input tree always produces byte-identical pages and index,
+# regardless of the number of worker processes.
+#
+# RSIs are named by their path starting at the name of the directory they were found in,
+# so RSIs in Resources/Textures get the same names as their resource paths on the client (Textures/foo.rsi).
+
+import argparse
+import hashlib
+import json
+import os
+import validate_rsis
+from concurrent.futures import ProcessPoolExecutor
+from rsi_atlas import load_rsi_geometry, pack_rects
+from typing import Any, Dict, List, Optional, Tuple
+
+INDEX_VERSION = 1
+INDEX_FILE = "atlas.json"
+DEFAULT_PAGE_SIZE = 4096
+
+# (rsi name, state name, direction, frame index within direction)
+FrameKey = Tuple[str, str, int, int]
+
+
+class RsiFrames:
+    """
+    Result of loading a single RSI in a worker process.
+    """
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.errors: List[str] = []
+        self.skipped_reason: Optional[str] = None
+        self.frame_size = (0, 0)
+        # Frame keys in sheet order, with the sheet cell they come from and a digest of their pixels.
+        self.frames: List[Tuple[FrameKey, int, bytes]] = []
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("bake_rsi_atlas.py", description="Packs all valid RSIs into pre-built atlas pages with a frame index.")
+    parser.add_argument("directories", nargs="+", help="Directories to look for RSIs in")
+    parser.add_argument("-o", "--output", required=True, help="Directory to write atlas pages and index to")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help=f"Maximum atlas page width and height (default {DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--no-dedupe", action="store_true", help="Give every frame its own rectangle, even if identical to another frame")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    rsis: List[Tuple[str, str]] = []
+    for dir in args.directories:
+        for rsi in validate_rsis.find_rsis(dir):
+            rsis.append((os.path.join(os.path.basename(os.path.normpath(dir)), os.path.relpath(rsi, dir)).replace(os.sep, "/"), rsi))
+
+    # Everything that ends up in the output is ordered by RSI name, never by discovery or completion order.
+    rsis.sort()
+
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker) as executor:
+        loaded: List[RsiFrames] = list(executor.map(load_rsi_frames, *zip(*rsis), chunksize=16)) if rsis else []
+
+        failed = 0
+        for rsi in loaded:
+            for error in rsi.errors:
+                print(f"{rsi.path}: {error}")
+            if rsi.errors:
+                failed += 1
+
+        baked = [rsi for rsi in loaded if not rsi.errors and rsi.skipped_reason is None]
+        skipped = [rsi for rsi in loaded if rsi.skipped_reason is not None]
+
+        index, page_jobs = layout(baked, args.page_size, not args.no_dedupe)
+
+        os.makedirs(args.output, exist_ok=True)
+        remove_stale_pages(args.output, len(page_jobs))
+
+        page_files = list(executor.map(compose_page, [args.output] * len(page_jobs), range(len(page_jobs)), page_jobs))
+
+    for page, file in zip(index["pages"], page_files):
+        page["file"] = file
+
+    index["skipped"] = {rsi.name: rsi.skipped_reason for rsi in skipped}
+
+    write_index(os.path.join(args.output, INDEX_FILE), index)
+
+    frame_count = sum(len(rsi.frames) for rsi in baked)
+    print(f"Baked {frame_count} frames from {len(baked)} RSIs into {len(page_jobs)} page(s) "
+          f"({index['unique_frames']} unique frames)")
+    if skipped:
+        print(f"Skipped {len(skipped)} RSI(s) that the client doesn't put in the shared atlas")
+    if failed:
+        print(f"{failed} RSI(s) failed validation and were left out")
+
+    return 1 if failed else 0
+
+
+def init_worker():
+    global worker_schema
+    worker_schema = validate_rsis.load_schema()
+
+
+def load_rsi_frames(name: str, path: str) -> RsiFrames:
+    from PIL import Image
+
+    result = RsiFrames(name, path)
+
+    rsi_errors = validate_rsis.check_rsi_cached(path, worker_schema, None)
+    if rsi_errors:
+        result.errors = [e.message for e in rsi_errors]
+        # Don't let the error list grow for the lifetime of the worker.
+        validate_rsis.errors.clear()
+        return result
+
+    geometry = load_rsi_geometry(path)
+    if not geometry.meta_atlas:
+        result.skipped_reason = "metaAtlas disabled or non-default load parameters"
+        return result
+
+    frame_w, frame_h = geometry.frame_size
+    result.frame_size = geometry.frame_size
+
+    meta_json = validate_rsis.read_json(os.path.join(path, "meta.json"))
+    for state in meta_json["states"]:
+        state_name: str = state["name"]
+        directions: int = state.get("directions", 1)
+        delays: List[List[float]] = state.get("delays", [[1]] * directions)
+
+        with Image.open(os.path.join(path, f"{state_name}.png")) as image:
+            sheet = image.convert("RGBA")
+
+        columns = sheet.width // frame_w
+
+        # Frames are stored one direction after another, see RSIResource.FoldDelays.
+        cell = 0
+        for direction, direction_delays in enumerate(delays):
+            for frame in range(len(direction_delays)):
+                x = (cell % columns) * frame_w
+                y = (cell // columns) * frame_h
+                digest = hashlib.sha256(sheet.crop((x, y, x + frame_w, y + frame_h)).tobytes()).digest()
+                result.frames.append(((name, state_name, direction, frame), cell, digest))
+                cell += 1
+
+    return result
+
+
+def layout(rsis: List[RsiFrames], page_size: int, dedupe: bool) -> Tuple[Dict[str, Any], List[List[Tuple[str, str, int, int, int, int, int]]]]:
+    """
+    Packs all frames. Returns the index and, for every page, the list of blits needed to compose it:
+    (rsi path, state, sheet cell, frame width, frame height, x, y).
+    """
+
+    # Unique frames in first-seen order. Deduplication has to account for frame size, not just pixel data.
+    rects: List[Tuple[int, int]] = []
+    sources: List[Tuple[str, str, int]] = []
+    rect_of: Dict[Tuple[int, int, bytes], int] = {}
+    frame_rects: List[Tuple[FrameKey, int]] = []
+
+    for rsi in rsis:
+        for key, cell, digest in rsi.frames:
+            dedupe_key = (rsi.frame_size[0], rsi.frame_size[1], digest)
+            rect = rect_of.get(dedupe_key) if dedupe else None
+            if rect is None:
+                rect = len(rects)
+                rects.append(rsi.frame_size)
+                sources.append((rsi.path, key[1], cell))
+                if dedupe:
+                    rect_of[dedupe_key] = rect
+
+            frame_rects.append((key, rect))
+
+    packing = pack_rects(rects, page_size)
+
+    page_jobs: List[List[Tuple[str, str, int, int, int, int, int]]] = [[] for _ in packing.page_sizes]
+    for (path, state, cell), (w, h), placement in zip(sources, rects, packing.placements):
+        page_jobs[placement.page].append((path, state, cell, w, h, placement.x, placement.y))
+
+    index_rsis: Dict[str, Any] = {}
+    for (rsi_name, state, direction, frame), rect in frame_rects:
+        w, h = rects[rect]
+        placement = packing.placements[rect]
+        entry = index_rsis.setdefault(rsi_name, {"size": [w, h], "states": {}})
+        directions = entry["states"].setdefault(state, [])
+        while len(directions) <= direction:
+            directions.append([])
+        directions[direction].append([placement.page, placement.x, placement.y])
+
+    index = {
+        "version": INDEX_VERSION,
+        "page_size": page_size,
+        "unique_frames": len(rects),
+        "pages": [{"width": w, "height": h} for w, h in packing.page_sizes],
+        "rsis": index_rsis,
+    }
+
+    return index, page_jobs
+
+
+def compose_page(output: str, page: int, blits: List[Tuple[str, str, int, int, int, int, int]]) -> str:
+    from PIL import Image
+
+    width = max(x + w for _, _, _, w, _, x, _ in blits)
+    height = max(y + h for _, _, _, _, h, _, y in blits)
+    atlas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+
+    sheets: Dict[Tuple[str, str], Image.Image] = {}
+    for path, state, cell, w, h, x, y in blits:
+        sheet = sheets.get((path, state))
+        if sheet is None:
+            with Image.open(os.path.join(path, f"{state}.png")) as image:
+                sheet = image.convert("RGBA")
+            sheets[(path, state)] = sheet
+
+        columns = sheet.width // w
+        src_x = (cell % columns) * w
+        src_y = (cell // columns) * h
+        atlas.paste(sheet.crop((src_x, src_y, src_x + w, src_y + h)), (x, y))
+
+    file = f"atlas_{page}.png"
+    # Write-then-rename so an interrupted run never leaves a truncated page behind.
+    # Pillow doesn't put timestamps or anything else environment-dependent in PNGs, so this is deterministic.
+    tmp_path = os.path.join(output, file + ".tmp")
+    atlas.save(tmp_path, format="PNG", compress_level=9)
+    os.replace(tmp_path, os.path.join(output, file))
+    return file
+
+
+def remove_stale_pages(output: str, page_count: int):
+    for name in os.listdir(output):
+        if not (name.startswith("atlas_") and name.endswith(".png")):
+            continue
+
+        number = name[len("atlas_"):-len(".png")]
+        if number.isdigit() and int(number) >= page_count:
+            os.remove(os.path.join(output, name))
+
+
+def write_index(path: str, index: Dict[str, Any]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        json.dump(index, f, sort_keys=True, separators=(",", ":"))
+
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+# Round-trip check and benchmark for the binary map cache (mapfile_binary.py).
+#
+# Every map is converted, decoded back and compared against yaml.safe_load of the original
+# (with unknown tags kept, see TaggedLoader).
+# Any difference is reported and makes the script exit with a non-zero status.
+# Then load time and peak RSS are measured, each in a fresh process, for:
+# - yaml.safe_load of the map,
+# - decoding the whole cache file back into the same structure,
+# - a typical query on the cache (entity count per prototype and component type histogram).
+#
+# Unix only, peak RSS comes from /proc or getrusage.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+from mapfile_binary import MapCache, cache_path_for, convert
+from mapfile_stream import Tagged
+from typing import Any, Dict, Iterator
+from validate_mapfile import find_map_files
+
+try:
+    from yaml import CSafeLoader as BaseLoader
+except ImportError:
+    from yaml import SafeLoader as BaseLoader
+
+MODES = ["yaml", "cache-full", "cache-query"]
+
+
+class TaggedLoader(BaseLoader):
+    """
+    yaml.safe_load, except that values with unknown tags (!type:...) are wrapped in a Tagged
+    like mapfile_stream.py does with keep_tags, instead of failing. The cache has to keep those.
+    """
+
+
+def construct_tagged(loader: TaggedLoader, suffix: str, node: yaml.Node) -> Any:
+    if isinstance(node, yaml.MappingNode):
+        value = loader.construct_mapping(node, deep=True)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        tag = loader.resolve(yaml.ScalarNode, node.value, (not node.style, True))
+        value = loader.yaml_constructors[tag](loader, node)
+    return Tagged(node.tag, value)
+
+
+TaggedLoader.add_multi_constructor("!", construct_tagged)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("bench_map_cache.py", description="Checks the binary map cache against the YAML and benchmarks loading both.")
+    parser.add_argument("paths", nargs="*", help="Map files, or directories to look for .yml map files in")
+    parser.add_argument("--repeat", type=int, default=3, help="Benchmark repetitions, best one is reported")
+    parser.add_argument("--no-bench", action="store_true", help="Only run the round-trip check")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(*args.child)
+        return 0
+
+    if not args.paths:
+        parser.error("no map files given")
+
+    files = find_map_files(args.paths)
+    mismatches = 0
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for path in files:
+            cache_path = cache_path_for(path, cache_dir)
+            start = time.perf_counter()
+            convert(path, cache_path)
+            convert_time = time.perf_counter() - start
+
+            with open(path, "rb") as f:
+                expected = yaml.load(f, Loader=TaggedLoader)
+            with MapCache(cache_path) as cache:
+                actual = cache.to_dict()
+
+            differences = list(diff(expected, actual, ""))
+            mismatches += bool(differences)
+            for difference in differences[:10]:
+                print(f"MISMATCH {path}: {difference}")
+
+            yaml_size = os.path.getsize(path)
+            cache_size = os.path.getsize(cache_path)
+            print(f"{path}: {yaml_size} -> {cache_size} bytes ({cache_size / yaml_size:.1%}), converted in {convert_time:.2f}s")
+
+            if args.no_bench:
+                continue
+
+            for mode in MODES:
+                target = path if mode == "yaml" else cache_path
+                runs = [measure(mode, target) for _ in range(args.repeat)]
+                best_time = min(r["time"] for r in runs)
+                best_rss = min(r["rss"] for r in runs)
+                print(f"  {mode:<12} {best_time * 1000:>10.1f} ms {best_rss / (1024 * 1024):>10.1f} MiB peak RSS increase")
+
+    print(f"Checked {len(files)} maps, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+def diff(expected: Any, actual: Any, path: str) -> Iterator[str]:
+    if type(expected) != type(actual):
+        yield f"{path or '(root)'}: expected {expected!r}, got {actual!r}"
+    elif isinstance(expected, dict):
+        for key in expected.keys() | actual.keys():
+            if key not in actual:
+                yield f"{path}.{key}: missing"
+            elif key not in expected:
+                yield f"{path}.{key}: unexpected"
+            else:
+                yield from diff(expected[key], actual[key], f"{path}.{key}")
+    elif isinstance(expected, Tagged):
+        if expected.tag != actual.tag:
+            yield f"{path or '(root)'}: expected tag {expected.tag}, got {actual.tag}"
+        yield from diff(expected.value, actual.value, path)
+    elif isinstance(expected, list):
+        if len(expected) != len(actual):
+            yield f"{path}: expected {len(expected)} items, got {len(actual)}"
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            yield from diff(e, a, f"{path}.{i}")
+    elif expected != actual:
+        yield f"{path or '(root)'}: expected {expected!r}, got {actual!r}"
+
+
+def measure(mode: str, path: str) -> Dict[str, float]:
+    output = subprocess.check_output([sys.executable, os.path.realpath(__file__), "--child", mode, path], text=True)
+    return json.loads(output)
+
+
+def run_child(mode: str, path: str):
+    rss_before = peak_rss()
+    start = time.perf_counter()
+
+    if mode == "yaml":
+        with open(path, "rb") as f:
+            result: Any = yaml.load(f, Loader=TaggedLoader)
+    else:
+        with MapCache(path) as cache:
+            if mode == "cache-full":
+                result = cache.to_dict()
+            else:
+                result = (cache.proto_counts(), cache.component_counts())
+
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"time": elapsed, "rss": peak_rss() - rss_before}))
+    del result
+
+
+def peak_rss() -> int:
+    # getrusage's peak is inherited from the parent process on Linux, which has had whole maps loaded by now.
+    # The per-process high water mark doesn't have that problem.
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+if __name__ == "__main__":
+    exit(main())
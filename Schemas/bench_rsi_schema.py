@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+# Differential check and micro-benchmark for the compiled rsi.json fast path (fast_schema.py).
+#
+# Every meta.json found in the given directories (plus the examples in rsi.json itself) is checked against both
+# the compiled check and jsonschema's Draft7Validator, along with a set of mutated copies of each
+# (removed keys, values of the wrong type, ...).
+# Any disagreement is reported and makes the script exit with a non-zero status.
+
+import argparse
+import copy
+import json
+import os
+import timeit
+from fast_schema import compile_schema
+from glob import iglob
+from typing import Any, Iterator, List, Tuple
+
+# Values swapped in for every value in a meta.json to produce mutations.
+REPLACEMENT_VALUES = [
+    None,
+    True,
+    False,
+    0,
+    1,
+    4,
+    8,
+    1.0,
+    4.0,
+    1.5,
+    -1,
+    "",
+    "CC-BY-SA-3.0",
+    "MIT",
+    [],
+    [[]],
+    [[0.1, "x"]],
+    {},
+    {"name": "x"},
+]
+
+def main() -> int:
+    parser = argparse.ArgumentParser("bench_rsi_schema.py", description="Compares the compiled rsi.json check against Draft7Validator and times both.")
+    parser.add_argument("directories", nargs="+", help="Directories to look for RSIs in")
+    parser.add_argument("--no-mutations", action="store_true", help="Only check the meta.json files as they are on disk")
+    parser.add_argument("--repeat", type=int, default=5, help="Benchmark repetitions, best one is reported")
+
+    args = parser.parse_args()
+
+    from jsonschema import Draft7Validator
+
+    base_path = os.path.dirname(os.path.realpath(__file__))
+    with open(os.path.join(base_path, "rsi.json"), "r", encoding="utf-8") as f:
+        schema_json = json.load(f)
+
+    validator = Draft7Validator(schema_json)
+    fast_check = compile_schema(schema_json)
+
+    corpus = load_corpus(args.directories)
+    print(f"Loaded {len(corpus)} meta.json files")
+
+    seeds = corpus + [(f"rsi.json example {i}", example) for i, example in enumerate(schema_json.get("examples", []))]
+
+    instances: List[Tuple[str, Any]] = []
+    for path, meta in seeds:
+        instances.append((path, meta))
+        if not args.no_mutations:
+            instances.extend((f"{path} ({desc})", mutated) for desc, mutated in mutations(meta))
+
+    mismatches = 0
+    valid = 0
+    for name, instance in instances:
+        expected = validator.is_valid(instance)
+        actual = fast_check(instance)
+        valid += expected
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH {name}: Draft7Validator says {expected}, compiled check says {actual}")
+
+    print(f"Checked {len(instances)} instances ({valid} valid), {mismatches} mismatches")
+
+    if corpus:
+        metas = [meta for _, meta in corpus]
+        slow = best_time(lambda: [list(validator.iter_errors(m)) for m in metas], args.repeat)
+        fast = best_time(lambda: [fast_check(m) for m in metas], args.repeat)
+        print(f"Draft7Validator.iter_errors: {slow / len(metas) * 1e6:.2f} us/file")
+        print(f"compiled check:              {fast / len(metas) * 1e6:.2f} us/file ({slow / fast:.1f}x)")
+
+    return 1 if mismatches else 0
+
+
+def load_corpus(directories: List[str]) -> List[Tuple[str, Any]]:
+    corpus = []
+    for dir in directories:
+        for rsi_rel in iglob("**/*.rsi", root_dir=dir, recursive=True):
+            meta_path = os.path.join(dir, rsi_rel, "meta.json")
+            try:
+                with open(meta_path, "r", encoding="utf-8-sig") as f:
+                    corpus.append((meta_path, json.load(f)))
+            except (OSError, ValueError):
+                # validate_rsis.py reports these, nothing to compare here.
+                continue
+
+    return corpus
+
+
+def mutations(meta: Any) -> Iterator[Tuple[str, Any]]:
+    for path in value_paths(meta):
+        for replacement in REPLACEMENT_VALUES:
+            if path:
+                mutated = copy.deepcopy(meta)
+                get_path(mutated, path[:-1])[path[-1]] = replacement
+            else:
+                mutated = replacement
+            yield f"{format_path(path)} = {replacement!r}", mutated
+
+        if path and isinstance(path[-1], str):
+            mutated = copy.deepcopy(meta)
+            del get_path(mutated, path[:-1])[path[-1]]
+            yield f"del {format_path(path)}", mutated
+
+
+def value_paths(value: Any, prefix: Tuple = ()) -> Iterator[Tuple]:
+    yield prefix
+    if isinstance(value, dict):
+        for key, sub in value.items():
+            yield from value_paths(sub, prefix + (key,))
+    elif isinstance(value, list):
+        for i, sub in enumerate(value):
+            yield from value_paths(sub, prefix + (i,))
+
+
+def get_path(value: Any, path: Tuple) -> Any:
+    for part in path:
+        value = value[part]
+    return value
+
+
+def format_path(path: Tuple) -> str:
+    return "$" + "".join(f"[{p}]" if isinstance(p, int) else f".{p}" for p in path)
+
+
+def best_time(func, repeat: int) -> float:
+    number = 10
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# Scaling benchmark for the asset validators, on synthetic corpora from generate_asset_corpus.py.
+#
+# For every corpus size, a fresh corpus is generated and every validator is run on it in its own process,
+# measuring wall time (including interpreter startup, like CI pays for it) and peak memory.
+# The items each validator flags are compared against the ones the generator broke on purpose,
+# so a speedup that stops catching errors shows up here too.
+#
+# Sizes are the number of RSIs and attribution files, and the total number of entities across all maps.
+#
+# Unix only. Two memory figures are reported:
+#   max/process  peak RSS of the largest single process, from wait4. On Linux ru_maxrss covers the process and its
+#                reaped descendants, but as the maximum of them, not the sum.
+#   total        peak combined PSS of the validator and all its worker processes, sampled from /proc.
+#                Linux only, and short spikes between samples are missed. PSS splits shared pages between the
+#                processes sharing them, so forked workers don't count the parent's memory again.
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from generate_asset_corpus import CorpusOptions, generate_corpus
+from typing import Any, Dict, List, Optional, Set
+
+DEFAULT_SIZES = "1000,10000,100000"
+DEFAULT_MAP_FILES = 10
+
+MEMORY_SAMPLE_INTERVAL = 0.05
+
+# Validator -> (script, corpus subdirectory or None for the whole tree, kinds of items it checks)
+VALIDATORS = {
+    "validate_rsis": ("validate_rsis.py", "Textures", ["rsi"]),
+    "validate_mapfile": ("validate_mapfile.py", "Maps", ["map"]),
+    "validate_rga": ("validate_rga.py", "Audio", ["attribution"]),
+    "validate_assets": ("validate_assets.py", None, ["rsi", "map", "attribution"]),
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("bench_validators.py", description="Benchmarks the asset validators on synthetic corpora of increasing size.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma separated corpus sizes (default {DEFAULT_SIZES})")
+    parser.add_argument("--validators", default=",".join(VALIDATORS), help="Comma separated validators to run (default all)")
+    parser.add_argument("--map-files", type=int, default=DEFAULT_MAP_FILES, help=f"Number of map files the entities are spread over (default {DEFAULT_MAP_FILES})")
+    parser.add_argument("--states", type=int, default=4, help="States per RSI (default 4)")
+    parser.add_argument("--broken", type=float, default=0.05, help="Fraction of items to break on purpose (default 0.05)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed (default 0)")
+    parser.add_argument("--work-dir", help="Generate corpora in this directory and keep them (default: temporary directories)")
+    parser.add_argument("--json", metavar="FILE", help="Also write all measurements to this file")
+
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    validators = args.validators.split(",")
+    for name in validators:
+        if name not in VALIDATORS:
+            parser.error(f"unknown validator {name}, expected one of {', '.join(VALIDATORS)}")
+
+    kinds = {kind for name in validators for kind in VALIDATORS[name][2]}
+    results: List[Dict[str, Any]] = []
+    missed = 0
+
+    for size in sizes:
+        corpus_dir = os.path.join(args.work_dir, f"corpus_{size}") if args.work_dir else tempfile.mkdtemp(prefix="asset_corpus_")
+        try:
+            options = CorpusOptions(seed=args.seed, states=args.states, broken=args.broken, map_entities=max(1, size // args.map_files))
+            start = time.perf_counter()
+            manifest = generate_corpus(corpus_dir, options,
+                                       size if "rsi" in kinds else 0,
+                                       args.map_files if "map" in kinds else 0,
+                                       size if "attribution" in kinds else 0)
+            print(f"Generated corpus of {size} in {time.perf_counter() - start:.1f}s")
+
+            for name in validators:
+                result = run_validator(name, corpus_dir, manifest, size)
+                results.append(result)
+                missed += result["missed"]
+                print(f"  {name:<18} {result['seconds']:>8.2f}s {result['items_per_second']:>10.0f} items/s "
+                      f"{result['peak_process_rss'] / (1024 * 1024):>8.1f} MiB max/process "
+                      + (f"{result['peak_total_pss'] / (1024 * 1024):>8.1f} MiB total  " if result["peak_total_pss"] is not None else " ")
+                      + f"flagged {result['flagged']}/{result['expected']} broken"
+                      + (f", {result['false_positives']} false positives" if result["false_positives"] else ""))
+        finally:
+            if not args.work_dir:
+                shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    print_scaling(results, validators)
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"sizes": sizes, "seed": args.seed, "results": results}, f, indent=1)
+
+    return 1 if missed else 0
+
+
+def run_validator(name: str, corpus_dir: str, manifest: Dict[str, Any], size: int) -> Dict[str, Any]:
+    script, subdir, kinds = VALIDATORS[name]
+    target = os.path.join(corpus_dir, subdir) if subdir is not None else corpus_dir
+    script_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), script)
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, script_path, target], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    sampler = MemorySampler(process.pid)
+    assert process.stdout is not None
+    output = process.stdout.read()
+    peak_total = sampler.stop()
+    # wait4 instead of wait, for the resource usage of this process (and its workers, see the top of the file).
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - start
+
+    expected: Set[str] = set()
+    for kind in kinds:
+        expected.update(os.path.normpath(p) for p in manifest["broken"][kind])
+
+    flagged_paths = flagged(output)
+    items = sum(size for _ in kinds)
+
+    return {
+        "validator": name,
+        "size": size,
+        "items": items,
+        "seconds": seconds,
+        "items_per_second": items / seconds,
+        # Kilobytes on Linux, bytes on macOS.
+        "peak_process_rss": usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024,
+        "peak_total_pss": peak_total,
+        "exit_code": process.returncode,
+        "expected": len(expected),
+        "flagged": len(expected & flagged_paths),
+        "missed": len(expected - flagged_paths),
+        "false_positives": len(flagged_paths - expected),
+    }
+
+
+class MemorySampler:
+    """
+    Samples the combined PSS of a process and all of its descendants on a background thread, until stopped.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak: Optional[int] = None
+        self.stopped = threading.Event()
+        # Needs smaps_rollup (Linux 4.14).
+        if os.path.exists(f"/proc/{pid}/smaps_rollup"):
+            self.thread: Optional[threading.Thread] = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        else:
+            self.thread = None
+
+    def run(self):
+        while True:
+            total = tree_pss(self.pid)
+            if self.peak is None or total > self.peak:
+                self.peak = total
+            if self.stopped.wait(MEMORY_SAMPLE_INTERVAL):
+                return
+
+    def stop(self) -> Optional[int]:
+        """
+        Returns the peak in bytes, None if it can't be measured on this platform.
+        """
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        return self.peak
+
+
+def tree_pss(pid: int) -> int:
+    total = 0
+    pending = [pid]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children", "r") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            # Exited while being looked at.
+            continue
+    return total
+
+
+def flagged(output: str) -> Set[str]:
+    """
+    Paths the validator reported errors for. Every validator prints errors as "path: message".
+    """
+
+    paths = set()
+    for line in output.splitlines():
+        path, sep, _ = line.partition(": ")
+        if sep and os.path.exists(path):
+            paths.add(os.path.normpath(path))
+    return paths
+
+
+def print_scaling(results: List[Dict[str, Any]], validators: List[str]):
+    """
+    Prints the scaling exponent between consecutive sizes: time ~ size^k, 1.0 is linear.
+    """
+
+    print("\nScaling (time ~ size^k):")
+    for name in validators:
+        runs = [r for r in results if r["validator"] == name]
+        steps: List[str] = []
+        previous: Optional[Dict[str, Any]] = None
+        for run in runs:
+            if previous is not None and run["size"] != previous["size"]:
+                k = math.log(run["seconds"] / previous["seconds"]) / math.log(run["size"] / previous["size"])
+                steps.append(f"{previous['size']}->{run['size']}: k={k:.2f}")
+            previous = run
+        print(f"  {name:<18} {', '.join(steps) or '(need at least two sizes)'}")
+
+
+if __name__ == "__main__":
+    exit(main())
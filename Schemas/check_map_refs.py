@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# Checks the cross-references of map files, which the mapfile.yml schema can't:
+# every uid is unique, every maps/grids/orphans/nullspace entry points at an existing entity,
+# and meta.entityCount matches the number of entities.
+#
+# Single streaming pass (see mapfile_stream.py), uids are tracked in a bitmap so memory stays
+# proportional to the highest uid rather than to the size of the map.
+
+import argparse
+import yaml
+from mapfile_stream import EntityRecord, HeaderValue, MapStreamError, iter_map
+from typing import Any, Dict, List, Set
+from validate_mapfile import find_map_files
+
+REFERENCE_KEYS = ["maps", "grids", "orphans", "nullspace"]
+
+# Maps number their entities densely starting at 1, anything above this goes into a set
+# instead of blowing up the bitmap.
+MAX_BITMAP_UID = 1 << 27
+
+
+class UidIndex:
+    def __init__(self):
+        self.bits = bytearray()
+        self.overflow: Set[int] = set()
+
+    def add(self, uid: int) -> bool:
+        """
+        Returns False if the uid was already present.
+        """
+
+        if uid < 0 or uid >= MAX_BITMAP_UID:
+            if uid in self.overflow:
+                return False
+            self.overflow.add(uid)
+            return True
+
+        byte, bit = uid >> 3, 1 << (uid & 7)
+        if byte >= len(self.bits):
+            # Grow geometrically so a dense map costs amortized O(1) per uid.
+            self.bits.extend(bytes(max(byte + 1, len(self.bits) * 2) - len(self.bits)))
+        elif self.bits[byte] & bit:
+            return False
+
+        self.bits[byte] |= bit
+        return True
+
+    def __contains__(self, uid: int) -> bool:
+        if uid < 0 or uid >= MAX_BITMAP_UID:
+            return uid in self.overflow
+
+        byte = uid >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (uid & 7)))
+
+
+def check_map(stream) -> List[str]:
+    errors: List[str] = []
+    uids = UidIndex()
+    references: Dict[str, Any] = {}
+    meta: Any = None
+    entity_count = 0
+
+    try:
+        for record in iter_map(stream):
+            if isinstance(record, HeaderValue):
+                if record.key == "meta":
+                    meta = record.value
+                elif record.key in REFERENCE_KEYS:
+                    references[record.key] = record.value
+                continue
+
+            if not isinstance(record, EntityRecord):
+                continue
+
+            entity_count += 1
+            uid = record.value.get("uid") if isinstance(record.value, dict) else None
+            if not is_uid(uid):
+                # Shape problems are validate_mapfile.py's job.
+                continue
+
+            if not uids.add(uid):
+                errors.append(f"duplicate uid {uid} (line {record.line}, proto {record.proto})")
+
+    except (MapStreamError, yaml.YAMLError) as e:
+        return [f"failed to parse: {e}"]
+
+    for key in REFERENCE_KEYS:
+        value = references.get(key)
+        if not isinstance(value, list):
+            continue
+
+        seen: Set[int] = set()
+        for i, uid in enumerate(value):
+            if not is_uid(uid):
+                continue
+            if uid not in uids:
+                errors.append(f"{key}.{i}: dangling reference to uid {uid}")
+            if uid in seen:
+                errors.append(f"{key}.{i}: uid {uid} listed more than once")
+            seen.add(uid)
+
+    expected = meta.get("entityCount") if isinstance(meta, dict) else None
+    if is_uid(expected) and expected != entity_count:
+        errors.append(f"meta.entityCount is {expected}, but the file contains {entity_count} entities")
+
+    return errors
+
+
+def is_uid(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("check_map_refs.py", description="Checks uid uniqueness and entity references of map files.")
+    parser.add_argument("paths", nargs="+", help="Map files, or directories to look for .yml map files in")
+
+    args = parser.parse_args()
+
+    failed = 0
+    for path in find_map_files(args.paths):
+        with open(path, "rb") as f:
+            errors = check_map(f)
+
+        for error in errors:
+            print(f"{path}: {error}")
+        if errors:
+            failed += 1
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
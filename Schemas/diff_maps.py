@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# Entity-level diff between two revisions of a map file, keyed by uid.
+# Reports added, removed and modified entities, with the components and fields that changed.
+#
+# Either side can be a file or a git revision of one (REV:path, anything `git show` accepts).
+# Both sides are streamed (see mapfile_stream.py): the first pass only keeps a small hash per uid,
+# full entities are only ever held for the ones that actually changed.
+# Component order within an entity isn't significant, neither is key order anywhere.
+# Tags are: changing a !type: is a change.
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import yaml
+from contextlib import contextmanager
+from mapfile_stream import EntityRecord, HeaderValue, MapStreamError, Tagged, iter_map
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+class MapSource:
+    def __init__(self, spec: str):
+        self.spec = spec
+        # Top-level keys other than entities, filled in while streaming entities.
+        self.header: Dict[Any, Any] = {}
+
+    @contextmanager
+    def open(self) -> Iterator[Any]:
+        if os.path.exists(self.spec) or ":" not in self.spec:
+            with open(self.spec, "rb") as f:
+                yield f
+            return
+
+        process = subprocess.Popen(["git", "show", self.spec], stdout=subprocess.PIPE)
+        assert process.stdout is not None
+        try:
+            yield process.stdout
+        finally:
+            process.stdout.close()
+            if process.wait() not in (0, -13):
+                # -13 is SIGPIPE from stopping early, anything else is a real failure.
+                raise MapStreamError(f"git show {self.spec} failed")
+
+    def entities(self) -> Iterator[Tuple[int, Any, Dict[str, Any]]]:
+        """
+        Yields (uid, proto, entity) for every entity with a valid uid.
+        """
+
+        with self.open() as stream:
+            for record in iter_map(stream, keep_tags=True):
+                if isinstance(record, HeaderValue):
+                    self.header[record.key] = record.value
+                elif isinstance(record, EntityRecord) and isinstance(record.value, dict):
+                    uid = record.value.get("uid")
+                    if isinstance(uid, int) and not isinstance(uid, bool):
+                        yield uid, record.proto, record.value
+
+
+class EntityChange:
+    def __init__(self, uid: int, old: Optional[Tuple[Any, Dict[str, Any]]], new: Optional[Tuple[Any, Dict[str, Any]]]):
+        self.uid = uid
+        # (proto, entity), None if the entity doesn't exist on that side.
+        self.old = old
+        self.new = new
+
+    @property
+    def kind(self) -> str:
+        if self.old is None:
+            return "added"
+        if self.new is None:
+            return "removed"
+        return "modified"
+
+    def details(self) -> List[str]:
+        """
+        Component level description of a modification.
+        """
+
+        assert self.old is not None and self.new is not None
+        old_proto, old = self.old
+        new_proto, new = self.new
+        lines = []
+        if old_proto != new_proto:
+            lines.append(f"proto: {old_proto} -> {new_proto}")
+
+        for key in sorted((old.keys() | new.keys()) - {"uid", "components"}, key=str):
+            if canonical(old.get(key)) != canonical(new.get(key)):
+                lines.append(f"{key}: {old.get(key)!r} -> {new.get(key)!r}")
+
+        old_components = components_by_type(old)
+        new_components = components_by_type(new)
+        for comp_type in sorted(old_components.keys() | new_components.keys(), key=str):
+            before = old_components.get(comp_type)
+            after = new_components.get(comp_type)
+            if before is None:
+                lines.append(f"+ {comp_type}")
+            elif after is None:
+                lines.append(f"- {comp_type}")
+            else:
+                for field in sorted(before.keys() | after.keys(), key=str):
+                    if canonical(before.get(field)) != canonical(after.get(field)):
+                        lines.append(f"~ {comp_type}.{field}: {before.get(field, '(unset)')!r} -> {after.get(field, '(unset)')!r}")
+
+        return lines
+
+    def to_json(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"uid": self.uid, "kind": self.kind}
+        side = self.new if self.new is not None else self.old
+        assert side is not None
+        result["proto"] = side[0]
+        if self.kind == "modified":
+            result["changes"] = self.details()
+        return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("diff_maps.py", description="Entity-level diff between two revisions of a map file.")
+    parser.add_argument("old", help="Old map file, or REV:path for a git revision")
+    parser.add_argument("new", help="New map file, or REV:path for a git revision")
+    parser.add_argument("--json", action="store_true", help="Print the diff as JSON")
+    parser.add_argument("--stat", action="store_true", help="Only print the number of added, removed and modified entities")
+
+    args = parser.parse_args()
+
+    try:
+        header_changes, changes = diff_maps(MapSource(args.old), MapSource(args.new))
+    except (MapStreamError, yaml.YAMLError, OSError) as e:
+        print(f"failed to read map: {e}")
+        return 2
+
+    counts = {kind: sum(1 for c in changes if c.kind == kind) for kind in ("added", "removed", "modified")}
+
+    if args.json:
+        print(json.dumps({"header": header_changes, "counts": counts, "entities": [c.to_json() for c in changes]}, indent=1, default=str))
+    else:
+        for line in header_changes:
+            print(line)
+
+        if not args.stat:
+            for change in changes:
+                side = change.new if change.new is not None else change.old
+                assert side is not None
+                print(f"{change.kind} {change.uid} ({side[0]})")
+                if change.kind == "modified":
+                    for line in change.details():
+                        print(f"    {line}")
+
+        print(f"{counts['added']} added, {counts['removed']} removed, {counts['modified']} modified")
+
+    return 1 if changes or header_changes else 0
+
+
+def diff_maps(old: MapSource, new: MapSource) -> Tuple[List[str], List[EntityChange]]:
+    # Pass 1: hash of every old entity.
+    old_hashes: Dict[int, int] = {}
+    for uid, proto, entity in old.entities():
+        if uid in old_hashes:
+            warn_duplicate(old, uid)
+        old_hashes[uid] = entity_hash(proto, entity)
+
+    # Pass 2: compare new entities, keeping only the ones that differ.
+    changes: Dict[int, EntityChange] = {}
+    seen: Set[int] = set()
+    for uid, proto, entity in new.entities():
+        if uid in seen:
+            warn_duplicate(new, uid)
+        seen.add(uid)
+        if old_hashes.get(uid) != entity_hash(proto, entity):
+            changes[uid] = EntityChange(uid, None, (proto, entity))
+
+    removed = old_hashes.keys() - seen
+    del old_hashes, seen
+
+    # Pass 3: pick up old versions of everything that changed or went away.
+    for uid, proto, entity in old.entities():
+        change = changes.get(uid)
+        if change is not None:
+            change.old = (proto, entity)
+        elif uid in removed:
+            changes[uid] = EntityChange(uid, (proto, entity), None)
+
+    header_changes = diff_headers(old.header, new.header)
+    return header_changes, sorted(changes.values(), key=lambda c: c.uid)
+
+
+def warn_duplicate(source: MapSource, uid: int):
+    print(f"{source.spec}: duplicate uid {uid}, diff for it will be wrong (see check_map_refs.py)", file=sys.stderr)
+
+
+def diff_headers(old: Dict[Any, Any], new: Dict[Any, Any]) -> List[str]:
+    lines = []
+    for key in sorted(old.keys() | new.keys(), key=str):
+        before = old.get(key)
+        after = new.get(key)
+        if canonical(before) == canonical(after):
+            continue
+
+        if isinstance(before, dict) and isinstance(after, dict):
+            for sub_key in sorted(before.keys() | after.keys(), key=str):
+                if canonical(before.get(sub_key)) != canonical(after.get(sub_key)):
+                    lines.append(f"{key}.{sub_key}: {before.get(sub_key)!r} -> {after.get(sub_key)!r}")
+        elif isinstance(before, list) and isinstance(after, list):
+            before_items = {canonical(v): v for v in before}
+            after_items = {canonical(v): v for v in after}
+            added = [repr(after_items[k]) for k in sorted(after_items.keys() - before_items.keys())]
+            removed = [repr(before_items[k]) for k in sorted(before_items.keys() - after_items.keys())]
+            lines.append(f"{key}: added [{', '.join(added)}], removed [{', '.join(removed)}]")
+        else:
+            lines.append(f"{key}: {before!r} -> {after!r}")
+
+    return lines
+
+
+def components_by_type(entity: Dict[str, Any]) -> Dict[Any, Dict[Any, Any]]:
+    result = {}
+    for component in entity.get("components") or []:
+        tag = None
+        if isinstance(component, Tagged):
+            tag, component = component.tag, component.value
+        if isinstance(component, dict):
+            fields = {k: v for k, v in component.items() if k != "type"}
+            if tag is not None:
+                fields["(tag)"] = tag
+            result[component.get("type")] = fields
+    return result
+
+
+def entity_hash(proto: Any, entity: Dict[str, Any]) -> int:
+    fields = {k: v for k, v in entity.items() if k != "components"}
+    components = sorted(canonical(c) for c in entity.get("components") or [])
+    text = canonical([proto, fields, components])
+    # 64 bits is plenty to tell revisions of the same uid apart.
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def canonical(value: Any) -> str:
+    """
+    Order-independent text form of a YAML value, equal for equal values.
+    """
+
+    if isinstance(value, dict):
+        return "{" + ",".join(sorted(f"{canonical(k)}:{canonical(v)}" for k, v in value.items())) + "}"
+    if isinstance(value, list):
+        return "[" + ",".join(canonical(v) for v in value) + "]"
+    if isinstance(value, Tagged):
+        return f"{value.tag}({canonical(value.value)})"
+    # Type name so that 1, 1.0, True and "1" all stay different.
+    return f"{type(value).__name__}:{value!r}"
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Compiles the (small) subset of JSON Schema draft 7 used by rsi.json into straight-line Python.
+# The generated check only answers "valid or not": callers should fall back to jsonschema's
+# Draft7Validator to get proper error messages when it says no.
+#
+# Anything outside the supported subset raises UnsupportedSchema at compile time,
+# so a schema change can never make this silently accept something Draft7Validator would reject.
+
+from typing import Any, Callable, Dict, List
+
+# Keywords that have no effect on validation.
+ANNOTATION_KEYWORDS = {
+    "$schema",
+    "$id",
+    "$comment",
+    "title",
+    "description",
+    "default",
+    "examples"
+}
+
+TYPE_CHECKS = {
+    "object": "type({v}) is dict",
+    "array": "type({v}) is list",
+    "string": "type({v}) is str",
+    "boolean": "type({v}) is bool",
+    "null": "{v} is None",
+    # JSON numbers only ever come out of the json module as int or float. bool is a subclass of int, exclude it.
+    "number": "(type({v}) is int or type({v}) is float)",
+    # Draft 7 considers floats with no fractional part to be integers.
+    "integer": "(type({v}) is int or (type({v}) is float and {v}.is_integer()))",
+}
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+def compile_schema(schema: Dict[str, Any]) -> Callable[[Any], bool]:
+    """
+    Compiles a schema into a function returning whether an instance is valid.
+    """
+
+    source = generate_source(schema)
+    namespace: Dict[str, Any] = {}
+    exec(compile(source, "<fast_schema>", "exec"), namespace)
+    return namespace["check"]
+
+
+def generate_source(schema: Dict[str, Any]) -> str:
+    emitter = _Emitter()
+    emitter.line("def check(v0):")
+    emitter.indent += 1
+    emitter.schema(schema, "v0")
+    emitter.line("return True")
+    return "\n".join(emitter.lines) + "\n"
+
+
+class _Emitter:
+    # additionalItems is a no-op when "items" is a single schema, which is the only form we support.
+    KEYWORDS = {"type", "enum", "required", "properties", "additionalProperties", "items", "additionalItems"}
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.indent = 0
+        self.var_count = 0
+
+    def line(self, text: str):
+        self.lines.append("    " * self.indent + text)
+
+    def new_var(self) -> str:
+        self.var_count += 1
+        return f"v{self.var_count}"
+
+    def fail_unless(self, condition: str):
+        self.line(f"if not ({condition}):")
+        self.line("    return False")
+
+    def schema(self, schema: Any, v: str):
+        if schema is True or schema == {}:
+            return
+
+        if not isinstance(schema, dict):
+            raise UnsupportedSchema(f"unsupported schema: {schema!r}")
+
+        for keyword in schema:
+            if keyword not in ANNOTATION_KEYWORDS and keyword not in _Emitter.KEYWORDS:
+                raise UnsupportedSchema(f"unsupported keyword: {keyword}")
+
+        type_name = schema.get("type")
+        if type_name is not None:
+            if isinstance(type_name, list):
+                self.fail_unless(" or ".join(type_check(t, v) for t in type_name))
+            else:
+                self.fail_unless(type_check(type_name, v))
+
+        if "enum" in schema:
+            self.enum(schema["enum"], v)
+
+        if any(k in schema for k in ("required", "properties", "additionalProperties")):
+            self.guarded(type_name, "object", v, lambda: self.object(schema, v))
+
+        if "items" in schema:
+            self.guarded(type_name, "array", v, lambda: self.items(schema["items"], v))
+
+    def guarded(self, type_name: Any, required_type: str, v: str, emit: Callable[[], None]):
+        # Object/array keywords are ignored for instances of other types, unless "type" already ruled those out.
+        if type_name == required_type:
+            emit()
+            return
+
+        self.line(f"if {type_check(required_type, v)}:")
+        self.indent += 1
+        start = len(self.lines)
+        emit()
+        if len(self.lines) == start:
+            self.line("pass")
+        self.indent -= 1
+
+    def object(self, schema: Dict[str, Any], v: str):
+        for name in schema.get("required", []):
+            self.fail_unless(f"{name!r} in {v}")
+
+        properties: Dict[str, Any] = schema.get("properties", {})
+        for name, sub_schema in properties.items():
+            if sub_schema is True or sub_schema == {}:
+                continue
+
+            sub_v = self.new_var()
+            self.line(f"if {name!r} in {v}:")
+            self.indent += 1
+            self.line(f"{sub_v} = {v}[{name!r}]")
+            self.schema(sub_schema, sub_v)
+            self.indent -= 1
+
+        additional = schema.get("additionalProperties", True)
+        if additional is True or additional == {}:
+            return
+
+        key = self.new_var()
+        known = repr(set(properties)) if properties else "()"
+        self.line(f"for {key} in {v}:")
+        self.indent += 1
+        self.line(f"if {key} in {known}:")
+        self.line("    continue")
+        if additional is False:
+            self.line("return False")
+        else:
+            sub_v = self.new_var()
+            self.line(f"{sub_v} = {v}[{key}]")
+            self.schema(additional, sub_v)
+        self.indent -= 1
+
+    def items(self, items: Any, v: str):
+        if isinstance(items, list):
+            raise UnsupportedSchema("tuple-form items are not supported")
+
+        if items is True or items == {}:
+            return
+
+        sub_v = self.new_var()
+        self.line(f"for {sub_v} in {v}:")
+        self.indent += 1
+        self.schema(items, sub_v)
+        self.indent -= 1
+
+    def enum(self, values: List[Any], v: str):
+        conditions = []
+        for value in values:
+            if isinstance(value, bool) or value is None:
+                conditions.append(f"{v} is {value!r}")
+            elif isinstance(value, str):
+                conditions.append(f"{v} == {value!r}")
+            elif isinstance(value, (int, float)):
+                # 1 and 1.0 compare equal in JSON, but True doesn't equal 1.
+                conditions.append(f"({TYPE_CHECKS['number'].format(v=v)} and {v} == {value!r})")
+            else:
+                raise UnsupportedSchema(f"unsupported enum value: {value!r}")
+
+        self.fail_unless(" or ".join(conditions) if conditions else "False")
+
+
+def type_check(type_name: str, v: str) -> str:
+    check = TYPE_CHECKS.get(type_name)
+    if check is None:
+        raise UnsupportedSchema(f"unsupported type: {type_name!r}")
+
+    return check.format(v=v)
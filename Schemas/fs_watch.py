@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# Minimal recursive directory watcher for the asset validation tools.
+# Uses inotify directly through ctypes on Linux so there's no extra dependency,
+# and falls back to polling file modification times everywhere else.
+
+import ctypes
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+# struct inotify_event, without the trailing name.
+EVENT_HEADER = struct.Struct("iIII")
+
+# Editors often save through several operations (write temp file, rename over, chmod...).
+# Wait for this long without new events before reporting a batch.
+DEFAULT_SETTLE_TIME = 0.02
+
+
+class Watcher(ABC):
+    @abstractmethod
+    def wait(self) -> Set[str]:
+        """
+        Blocks until something changes, returns the paths of changed files and directories.
+        An empty set means changes were missed (e.g. event queue overflow) and everything should be rescanned.
+        """
+
+    def close(self):
+        pass
+
+
+def create_watcher(roots: Iterable[str], settle_time: float = DEFAULT_SETTLE_TIME, poll_interval: float = 0.25) -> Watcher:
+    roots = list(roots)
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots, settle_time)
+        except OSError as e:
+            print(f"inotify unavailable ({e}), falling back to polling", file=sys.stderr)
+
+    return PollingWatcher(roots, poll_interval)
+
+
+class InotifyWatcher(Watcher):
+    def __init__(self, roots: List[str], settle_time: float):
+        self.settle_time = settle_time
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise_errno()
+
+        self.watches: Dict[int, str] = {}
+        for root in roots:
+            self.add_tree(root)
+
+    def add_tree(self, root: str):
+        for dir, _, _ in os.walk(root):
+            self.add_watch(dir)
+
+    def add_watch(self, dir: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir), WATCH_MASK)
+        if wd < 0:
+            raise_errno()
+
+        self.watches[wd] = dir
+
+    def wait(self) -> Set[str]:
+        changed: Set[str] = set()
+        overflow = False
+
+        # Block for the first event, then keep collecting until things settle down.
+        timeout: Optional[float] = None
+        while True:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+            if not readable:
+                break
+
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+
+            overflow |= self.handle_events(data, changed)
+            timeout = self.settle_time
+
+        return set() if overflow else changed
+
+    def handle_events(self, data: bytes, changed: Set[str]) -> bool:
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+
+            dir = self.watches.get(wd)
+            if dir is None:
+                continue
+
+            if mask & IN_IGNORED:
+                # Watched directory went away.
+                del self.watches[wd]
+                changed.add(dir)
+                continue
+
+            path = os.path.join(dir, os.fsdecode(name)) if name else dir
+            changed.add(path)
+
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # New directory: watch it too, and report anything that got put into it before the watch existed.
+                try:
+                    self.add_tree(path)
+                except OSError:
+                    continue
+
+                for sub_dir, _, files in os.walk(path):
+                    changed.update(os.path.join(sub_dir, f) for f in files)
+
+        return overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    def __init__(self, roots: List[str], interval: float):
+        self.roots = roots
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self) -> Dict[str, Tuple[int, int]]:
+        result: Dict[str, Tuple[int, int]] = {}
+        for root in self.roots:
+            for dir, _, files in os.walk(root):
+                for file in files:
+                    path = os.path.join(dir, file)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    result[path] = (stat.st_mtime_ns, stat.st_size)
+
+        return result
+
+    def wait(self) -> Set[str]:
+        while True:
+            time.sleep(self.interval)
+            snapshot = self.scan()
+            changed = {path for path in snapshot.keys() | self.snapshot.keys() if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+
+
+def raise_errno():
+    errno = ctypes.get_errno()
+    raise OSError(errno, os.strerror(errno))
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+# Generates a synthetic asset tree for benchmarking the validators: RSIs, map files and attribution files,
+# with a configurable fraction of deliberately broken samples.
+#
+# Generation is deterministic: the same arguments always produce the same tree, and every item only depends
+# on the seed and its own index, so a corpus of N items is the first N items of any bigger one.
+# Which items were broken (and how) is written to corpus.json in the output directory.
+#
+# Layout:
+#   Textures/Generated/<bucket>/<n>.rsi
+#   Maps/Generated/map_<n>.yml
+#   Audio/Generated/<bucket>/<n>/attributions.yml (plus the attributed files, empty)
+
+import argparse
+import io
+import json
+import math
+import os
+import random
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+# Items per directory, keeps directories at a realistic size.
+BUCKET_SIZE = 1000
+
+LICENSES = ["CC-BY-SA-3.0", "CC-BY-SA-4.0", "CC-BY-4.0", "CC0-1.0", "MIT"]
+# rsi.json has its own, shorter list.
+RSI_LICENSES = LICENSES[:-1]
+SOURCES = [
+    "https://github.com/space-wizards/space-station-14",
+    "https://github.com/tgstation/tgstation",
+    "https://github.com/ParadiseSS13/Paradise",
+    "https://github.com/goonstation/goonstation",
+    "NA",
+]
+COMPONENT_TYPES = ["Transform", "Physics", "Fixtures", "Sprite", "Anchorable", "Damageable", "Construction", "PowerNetwork"]
+
+RSI_BREAKAGES = ["schema", "sheet_size", "stray_png", "directions", "durations", "missing_png"]
+MAP_BREAKAGES = ["uid", "component_type", "format", "extra_key"]
+ATTRIBUTION_BREAKAGES = ["license", "source", "stale_file", "unattributed_file"]
+
+
+class CorpusOptions:
+    def __init__(self, seed: int = 0, states: int = 4, max_directions: int = 4, max_frames: int = 4, frame_size: int = 32,
+                 broken: float = 0.05, map_entities: int = 1000, attribution_files: int = 4):
+        self.seed = seed
+        self.states = states
+        self.max_directions = max_directions
+        self.max_frames = max_frames
+        self.frame_size = frame_size
+        self.broken = broken
+        self.map_entities = map_entities
+        self.attribution_files = attribution_files
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("generate_asset_corpus.py", description="Generates a deterministic synthetic asset tree for validator benchmarks.")
+    parser.add_argument("output", help="Directory to generate the corpus in")
+    parser.add_argument("--rsis", type=int, default=1000, help="Number of RSIs (default 1000)")
+    parser.add_argument("--maps", type=int, default=0, help="Number of map files (default 0)")
+    parser.add_argument("--map-entities", type=int, default=1000, help="Entities per map file (default 1000)")
+    parser.add_argument("--attributions", type=int, default=0, help="Number of attribution files (default 0)")
+    parser.add_argument("--attribution-files", type=int, default=4, help="Files attributed per attribution file (default 4)")
+    parser.add_argument("--states", type=int, default=4, help="States per RSI (default 4)")
+    parser.add_argument("--max-directions", type=int, choices=[1, 4, 8], default=4, help="Maximum directions per state (default 4)")
+    parser.add_argument("--max-frames", type=int, default=4, help="Maximum animation frames per direction (default 4)")
+    parser.add_argument("--frame-size", type=int, default=32, help="Frame width and height in pixels (default 32)")
+    parser.add_argument("--broken", type=float, default=0.05, help="Fraction of items to break on purpose (default 0.05)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default 0)")
+
+    args = parser.parse_args()
+
+    options = CorpusOptions(args.seed, args.states, args.max_directions, args.max_frames, args.frame_size,
+                            args.broken, args.map_entities, args.attribution_files)
+    manifest = generate_corpus(args.output, options, args.rsis, args.maps, args.attributions)
+    print(f"Generated {args.rsis} RSIs, {args.maps} maps and {args.attributions} attribution files, "
+          f"{sum(len(v) for v in manifest['broken'].values())} broken")
+    return 0
+
+
+def generate_corpus(output: str, options: CorpusOptions, rsis: int, maps: int, attributions: int) -> Dict[str, Any]:
+    """
+    Generates the corpus, returns the manifest (also written to corpus.json).
+    """
+
+    broken: Dict[str, Dict[str, str]] = {"rsi": {}, "map": {}, "attribution": {}}
+    images = ImageCache()
+
+    for i in range(rsis):
+        path = os.path.join(output, "Textures", "Generated", str(i // BUCKET_SIZE), f"{i}.rsi")
+        breakage = write_rsi(path, item_random(options, "rsi", i), options, images)
+        if breakage:
+            broken["rsi"][path] = breakage
+
+    for i in range(maps):
+        path = os.path.join(output, "Maps", "Generated", f"map_{i}.yml")
+        breakage = write_map(path, item_random(options, "map", i), options)
+        if breakage:
+            broken["map"][path] = breakage
+
+    for i in range(attributions):
+        path = os.path.join(output, "Audio", "Generated", str(i // BUCKET_SIZE), str(i), "attributions.yml")
+        breakage = write_attributions(path, item_random(options, "attribution", i), options)
+        if breakage:
+            broken["attribution"][path] = breakage
+
+    manifest = {
+        "seed": options.seed,
+        "counts": {"rsi": rsis, "map": maps, "map_entities": options.map_entities, "attribution": attributions},
+        "broken": broken,
+    }
+    with open(os.path.join(output, "corpus.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return manifest
+
+
+def item_random(options: CorpusOptions, kind: str, index: int) -> random.Random:
+    # Seeding from a string is stable across runs and Python versions.
+    return random.Random(f"{options.seed}/{kind}/{index}")
+
+
+def pick_breakage(rng: random.Random, options: CorpusOptions, kinds: List[str]) -> Optional[str]:
+    return rng.choice(kinds) if rng.random() < options.broken else None
+
+
+class ImageCache:
+    """
+    Encoded sprite sheets by size. Validators don't care about pixel contents,
+    so a handful of sheets get reused instead of encoding hundreds of thousands of PNGs.
+    """
+
+    def __init__(self):
+        self.sheets: Dict[Tuple[int, int, int], bytes] = {}
+
+    def get(self, width: int, height: int, variant: int) -> bytes:
+        key = (width, height, variant)
+        data = self.sheets.get(key)
+        if data is None:
+            from PIL import Image
+
+            rng = random.Random(f"{width}x{height}/{variant}")
+            image = Image.new("RGBA", (width, height))
+            image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256), rng.choice((0, 255))) for _ in range(width * height)])
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            data = self.sheets[key] = buffer.getvalue()
+        return data
+
+
+def write_rsi(path: str, rng: random.Random, options: CorpusOptions, images: ImageCache) -> Optional[str]:
+    breakage = pick_breakage(rng, options, RSI_BREAKAGES)
+    size = options.frame_size
+
+    states = []
+    sheets: Dict[str, Tuple[int, int]] = {}
+    for s in range(options.states):
+        name = f"state_{s}"
+        state: Dict[str, Any] = {"name": name}
+        directions = rng.choice([d for d in (1, 4, 8) if d <= options.max_directions])
+        frames = rng.randint(1, options.max_frames)
+        if directions != 1:
+            state["directions"] = directions
+        if frames > 1:
+            delay = round(rng.choice((0.1, 0.2, 0.3)), 1)
+            state["delays"] = [[delay] * frames for _ in range(directions)]
+        states.append(state)
+
+        # Same layout as RsiLoading: square-ish sheet, frames in rows.
+        total = directions * frames
+        columns = math.ceil(math.sqrt(total))
+        rows = math.ceil(total / columns)
+        sheets[name] = (columns * size, rows * size)
+
+    meta: Dict[str, Any] = {
+        "version": 1,
+        "license": rng.choice(RSI_LICENSES),
+        "copyright": "Generated by generate_asset_corpus.py",
+        "size": {"x": size, "y": size},
+        "states": states,
+    }
+
+    if breakage == "schema":
+        del meta["license"]
+    elif breakage == "sheet_size":
+        width, height = sheets["state_0"]
+        sheets["state_0"] = (width + 1, height)
+    elif breakage == "directions":
+        states[0]["directions"] = 4
+        states[0]["delays"] = [[0.1]]
+    elif breakage == "durations":
+        states[0]["directions"] = 4
+        states[0]["delays"] = [[0.1], [0.1], [0.1], [0.2]]
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, separators=(",", ":"))
+
+    for name, (width, height) in sheets.items():
+        if breakage == "missing_png" and name == "state_0":
+            continue
+        with open(os.path.join(path, f"{name}.png"), "wb") as f:
+            f.write(images.get(width, height, rng.randrange(4)))
+
+    if breakage == "stray_png":
+        with open(os.path.join(path, "stray.png"), "wb") as f:
+            f.write(images.get(size, size, 0))
+
+    return breakage
+
+
+def write_map(path: str, rng: random.Random, options: CorpusOptions) -> Optional[str]:
+    breakage = pick_breakage(rng, options, MAP_BREAKAGES)
+    broken_entity = rng.randrange(options.map_entities) if breakage in ("uid", "component_type") else -1
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("meta:\n")
+        if breakage != "format":
+            f.write("  format: 7\n")
+        f.write("  category: Map\n  engineVersion: 0.0.0\n  forkId: \"\"\n  forkVersion: \"\"\n")
+        f.write("  time: 01/01/2025 00:00:00\n  postmapinit: false\n")
+        f.write(f"  entityCount: {options.map_entities + 2}\n")
+        if breakage == "extra_key":
+            f.write("  generated: true\n")
+        f.write("maps:\n- 1\ngrids:\n- 2\norphans: []\nnullspace: []\n")
+        f.write("tilemap:\n  0: Space\n  1: FloorSteel\n  2: Plating\n")
+        f.write("entities:\n- proto: \"\"\n  entities:\n")
+        f.write("  - uid: 1\n    components:\n    - type: MetaData\n      name: map\n    - type: Map\n")
+        f.write("  - uid: 2\n    components:\n    - type: MetaData\n    - type: Transform\n      parent: 1\n    - type: MapGrid\n")
+
+        # Entities grouped by prototype, like the engine writes them.
+        uid = 3
+        remaining = options.map_entities
+        proto = 0
+        while remaining > 0:
+            count = min(remaining, rng.randint(1, 200))
+            f.write(f"- proto: GeneratedProto{proto}\n  entities:\n")
+            for _ in range(count):
+                index = uid - 3
+                f.write(f"  - uid: {'not_an_int' if index == broken_entity and breakage == 'uid' else uid}\n    components:\n")
+                f.write(f"    - type: Transform\n      pos: {rng.uniform(-100, 100):.3f},{rng.uniform(-100, 100):.3f}\n      parent: 2\n")
+                for comp_type in rng.sample(COMPONENT_TYPES[1:], rng.randint(0, 3)):
+                    f.write(f"    - type: {comp_type}\n      value: {rng.randrange(1000)}\n")
+                if index == broken_entity and breakage == "component_type":
+                    f.write("    - name: NoType\n")
+                if rng.random() < 0.01:
+                    f.write("    missingComponents:\n    - RemovedComponent\n")
+                uid += 1
+            remaining -= count
+            proto += 1
+
+    return breakage
+
+
+def write_attributions(path: str, rng: random.Random, options: CorpusOptions) -> Optional[str]:
+    breakage = pick_breakage(rng, options, ATTRIBUTION_BREAKAGES)
+    dir = os.path.dirname(path)
+    os.makedirs(dir, exist_ok=True)
+
+    files = [f"sound_{i}.ogg" for i in range(options.attribution_files)]
+    for file in files:
+        if breakage == "stale_file" and file == files[0]:
+            continue
+        open(os.path.join(dir, file), "wb").close()
+
+    if breakage == "unattributed_file":
+        open(os.path.join(dir, "unattributed.ogg"), "wb").close()
+
+    license = "Not-A-License" if breakage == "license" else rng.choice(LICENSES)
+    source = "not a url" if breakage == "source" else rng.choice(SOURCES)
+
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        write_attribution_entry(f, files[:len(files) // 2 or 1], license, source)
+        if len(files) > 1:
+            write_attribution_entry(f, files[len(files) // 2 or 1:], rng.choice(LICENSES), rng.choice(SOURCES))
+
+    return breakage
+
+
+def write_attribution_entry(f: TextIO, files: List[str], license: str, source: str):
+    f.write(f"- files: [{', '.join(json.dumps(file) for file in files)}]\n")
+    f.write(f"  license: \"{license}\"\n")
+    f.write("  copyright: \"Generated by generate_asset_corpus.py\"\n")
+    f.write(f"  source: \"{source}\"\n")
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+# Builds a compact index of map file contents: entity counts per prototype, component type histograms,
+# missingComponents occurrences and tilemap size, for every map.
+# Meant for tracking down which maps and prototypes are behind load time and memory regressions
+# without having to load the maps in a server.
+#
+# Maps are streamed (see mapfile_stream.py) in parallel, and results are cached by file content hash,
+# so re-running over a mostly unchanged tree only parses what changed.
+
+import argparse
+import hashlib
+import json
+import os
+import yaml
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from mapfile_stream import EntityRecord, HeaderValue, MapStreamError, iter_map
+from typing import Any, Dict, List, Optional, Set, Tuple
+from validate_mapfile import find_map_files
+
+INDEX_VERSION = 1
+CACHE_VERSION = 1
+
+MapStats = Dict[str, Any]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("map_stats.py", description="Indexes entity, prototype and component statistics of map files.")
+    parser.add_argument("paths", nargs="+", help="Map files, or directories to look for .yml map files in")
+    parser.add_argument("-o", "--output", help="Write the index as JSON to this file")
+    parser.add_argument("--cache", metavar="FILE", help="Cache per-map results in this file, keyed by file content hash")
+    parser.add_argument("--top", type=int, default=10, help="Number of maps and prototypes to list in the summary (default 10)")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    files = find_map_files(args.paths)
+    cache = StatsCache.load(args.cache) if args.cache is not None else None
+
+    with ProcessPoolExecutor(args.jobs) as executor:
+        hashes = list(executor.map(hash_file, files, chunksize=8))
+
+        stats: Dict[str, MapStats] = {}
+        misses: List[Tuple[str, str]] = []
+        for path, digest in zip(files, hashes):
+            cached = cache.get(digest) if cache is not None else None
+            if cached is not None:
+                stats[path] = cached
+            else:
+                misses.append((path, digest))
+
+        for (path, digest), result in zip(misses, executor.map(map_stats, [p for p, _ in misses], chunksize=1)):
+            result["hash"] = digest
+            stats[path] = result
+            if cache is not None and "error" not in result:
+                cache.store(digest, result)
+
+    if cache is not None:
+        cache.save(set(hashes))
+
+    failed = 0
+    for path, result in stats.items():
+        if "error" in result:
+            failed += 1
+            print(f"{path}: {result['error']}")
+
+    if args.output is not None:
+        write_index(args.output, stats)
+
+    print_summary(stats, args.top, len(files) - len(misses))
+    return 1 if failed else 0
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def map_stats(path: str) -> MapStats:
+    protos: Counter = Counter()
+    components: Counter = Counter()
+    missing: Counter = Counter()
+    entities = 0
+    tilemap = 0
+
+    try:
+        with open(path, "rb") as f:
+            for record in iter_map(f):
+                if isinstance(record, HeaderValue):
+                    if record.key == "tilemap" and isinstance(record.value, dict):
+                        tilemap = len(record.value)
+                    continue
+
+                if not isinstance(record, EntityRecord):
+                    continue
+
+                entities += 1
+                protos[str(record.proto or "")] += 1
+
+                entity = record.value
+                if not isinstance(entity, dict):
+                    continue
+
+                for component in entity.get("components") or []:
+                    if isinstance(component, dict) and "type" in component:
+                        components[str(component["type"])] += 1
+
+                for name in entity.get("missingComponents") or []:
+                    missing[str(name)] += 1
+
+    except (MapStreamError, yaml.YAMLError) as e:
+        return {"error": f"failed to parse: {e}"}
+
+    return {
+        "entities": entities,
+        "tilemap": tilemap,
+        "protos": dict(protos),
+        "components": dict(components),
+        "missingComponents": dict(missing),
+    }
+
+
+def print_summary(stats: Dict[str, MapStats], top: int, cached: int):
+    valid = {path: s for path, s in stats.items() if "error" not in s}
+    total_protos: Counter = Counter()
+    total_missing: Counter = Counter()
+    for s in valid.values():
+        total_protos.update(s["protos"])
+        total_missing.update(s["missingComponents"])
+
+    total_entities = sum(s["entities"] for s in valid.values())
+    print(f"{len(valid)} maps, {total_entities} entities, {len(total_protos)} prototypes ({cached} maps from cache)")
+
+    print("\nLargest maps:")
+    for path, s in sorted(valid.items(), key=lambda item: (-item[1]["entities"], item[0]))[:top]:
+        print(f"  {s['entities']:>9}  {path}")
+
+    print("\nMost placed prototypes:")
+    for proto, count in sorted(total_protos.items(), key=lambda item: (-item[1], item[0]))[:top]:
+        print(f"  {count:>9}  {proto or '(empty)'}")
+
+    if total_missing:
+        print("\nMissing components:")
+        for name, count in sorted(total_missing.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            print(f"  {count:>9}  {name}")
+
+
+def write_index(path: str, stats: Dict[str, MapStats]):
+    index = {
+        "version": INDEX_VERSION,
+        "maps": {os.path.normpath(p).replace(os.sep, "/"): s for p, s in stats.items()},
+    }
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        json.dump(index, f, sort_keys=True, separators=(",", ":"))
+
+    os.replace(tmp_path, path)
+
+
+class StatsCache:
+    """
+    Persistent per-map statistics, keyed by file content hash.
+    Entries for content that no longer exists are dropped on save.
+    """
+
+    def __init__(self, path: str, entries: Dict[str, MapStats]):
+        self.path = path
+        self.entries = entries
+        self.dirty = False
+
+    @staticmethod
+    def load(path: str) -> "StatsCache":
+        entries: Dict[str, MapStats] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                entries = data["maps"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            # Missing or corrupt cache, start fresh.
+            pass
+
+        return StatsCache(path, entries)
+
+    def get(self, digest: str) -> Optional[MapStats]:
+        return self.entries.get(digest)
+
+    def store(self, digest: str, stats: MapStats):
+        self.entries[digest] = stats
+        self.dirty = True
+
+    def save(self, live: Set[str]):
+        stale = self.entries.keys() - live
+        if not self.dirty and not stale:
+            return
+
+        for digest in stale:
+            del self.entries[digest]
+
+        data = {"version": CACHE_VERSION, "maps": self.entries}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, sort_keys=True, separators=(",", ":"))
+
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+
+# Compact binary cache for map files (see mapfile.yml), for analysis scripts that keep looking at the same maps.
+#
+# A cache file is a small header followed by sections, each 8-byte aligned:
+# - a string table holding every prototype and component type name once,
+# - integer columns: entity uids, the maps/grids/orphans/nullspace lists, prototype groups,
+#   and for every component its type (as a string table index),
+# - blobs for everything else (meta, tilemap, per-entity fields other than uid/components, component fields
+#   other than type), each located through an offset column, so any one of them can be decoded on its own.
+#
+# Blobs are encoded with marshal, which round-trips every plain YAML value (timestamps aside, maps don't use them)
+# and decodes in C. Tags like !type: are kept (as mapfile_stream.Tagged when decoded): marshal can't store those,
+# so they're written as (tag, value) tuples, which plain YAML values never contain. Blobs with any tags in them
+# are wrapped in a 1-tuple, so only those pay for turning the tuples back into Tagged.
+# MapCache memory-maps the file and only decodes what gets asked for.
+
+import argparse
+import array
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import sys
+import yaml
+from bisect import bisect_right
+from collections import Counter
+from mapfile_stream import EntityRecord, HeaderValue, MapStreamError, ProtoRecord, Tagged, iter_map
+from typing import Any, Dict, List, Optional
+from validate_mapfile import find_map_files
+
+MAGIC = b"SMAP"
+FORMAT_VERSION = 2
+MARSHAL_VERSION = 4
+CACHE_SUFFIX = ".mapcache"
+
+REFERENCE_KEYS = ["maps", "grids", "orphans", "nullspace"]
+
+# Section order in the file.
+SECTIONS = [
+    "string_offsets",  # u64[strings + 1]
+    "string_data",
+    "header",          # marshal: [top-level keys except entities and reference lists, reference keys present]
+    "maps",            # i64[]
+    "grids",           # i64[]
+    "orphans",         # i64[]
+    "nullspace",       # i64[]
+    "group_proto",     # u32[groups], string index
+    "group_start",     # u64[groups + 1], entity index
+    "uids",            # i64[entities]
+    "extra_offsets",   # u64[entities + 1], into extra_data
+    "extra_data",      # marshal: entity fields other than uid and components
+    "comp_start",      # u64[entities + 1], component index
+    "comp_type",       # u32[components], string index
+    "comp_offsets",    # u64[components + 1], into comp_data
+    "comp_data",       # marshal: component fields other than type
+]
+
+# magic, format version, marshal version, source size, source mtime (ns), then (offset, length) per section.
+FILE_HEADER = struct.Struct("<4sIIQQ")
+SECTION_ENTRY = struct.Struct("<QQ")
+ALIGNMENT = 8
+
+# array/memoryview typecodes for 8 and 4 byte integers.
+I64 = "q"
+U64 = "Q"
+U32 = "I"
+
+
+class MapCacheError(Exception):
+    pass
+
+
+def convert(yaml_path: str, cache_path: str):
+    """
+    Converts a map file into a cache file. The map has to match the shape of mapfile.yml,
+    anything else raises MapCacheError (run validate_mapfile.py to see what's wrong).
+    """
+
+    strings: Dict[str, int] = {}
+
+    def intern(value: Any, what: str, line: int) -> int:
+        if not isinstance(value, str):
+            raise MapCacheError(f"line {line}: {what} '{value}' is not a string")
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    header: Dict[Any, Any] = {}
+    references: Dict[str, array.array] = {}
+
+    group_proto = array.array(U32)
+    group_start = array.array(U64, [0])
+    uids = array.array(I64)
+    extra_offsets = array.array(U64, [0])
+    extra_data = bytearray()
+    comp_start = array.array(U64, [0])
+    comp_type = array.array(U32)
+    comp_offsets = array.array(U64, [0])
+    comp_data = bytearray()
+
+    stat = os.stat(yaml_path)
+    try:
+        with open(yaml_path, "rb") as f:
+            for record in iter_map(f, keep_tags=True):
+                if isinstance(record, HeaderValue):
+                    if record.key in REFERENCE_KEYS and record.value is not None:
+                        references[record.key] = int_array(record.value, record.key, record.line)
+                    elif record.key == "entities":
+                        raise MapCacheError(f"line {record.line}: entities is not a list")
+                    else:
+                        header[record.key] = record.value
+
+                elif isinstance(record, EntityRecord):
+                    entity = record.value
+                    if not isinstance(entity, dict):
+                        raise MapCacheError(f"line {record.line}: entity is not a mapping")
+
+                    uid = entity.get("uid")
+                    if not isinstance(uid, int) or isinstance(uid, bool):
+                        raise MapCacheError(f"line {record.line}: entity uid '{uid}' is not an int")
+                    uids.append(uid)
+
+                    components = entity.get("components")
+                    if not isinstance(components, list):
+                        raise MapCacheError(f"line {record.line}: entity {uid} has no components list")
+
+                    for component in components:
+                        if not isinstance(component, dict) or "type" not in component:
+                            raise MapCacheError(f"line {record.line}: entity {uid} has a component without a type")
+                        comp_type.append(intern(component["type"], "component type", record.line))
+                        fields = {k: v for k, v in component.items() if k != "type"}
+                        comp_data += dump_blob(fields, record.line)
+                        comp_offsets.append(len(comp_data))
+                    comp_start.append(len(comp_type))
+
+                    extra = {k: v for k, v in entity.items() if k != "uid" and k != "components"}
+                    if extra:
+                        extra_data += dump_blob(extra, record.line)
+                    extra_offsets.append(len(extra_data))
+
+                elif isinstance(record, ProtoRecord):
+                    fields = record.fields
+                    if not isinstance(fields, dict) or record.entity_count is None or fields.keys() - {"proto"}:
+                        raise MapCacheError(f"line {record.line}: prototype group must only have proto and an entities list")
+                    group_proto.append(intern(fields.get("proto"), "proto", record.line))
+                    group_start.append(len(uids))
+
+    except (MapStreamError, yaml.YAMLError) as e:
+        raise MapCacheError(f"failed to parse: {e}")
+
+    string_offsets = array.array(U64, [0])
+    string_data = bytearray()
+    for value in strings:
+        string_data += value.encode("utf-8")
+        string_offsets.append(len(string_data))
+
+    sections = {
+        "string_offsets": string_offsets,
+        "string_data": string_data,
+        "header": dump_blob([header, [key for key in REFERENCE_KEYS if key in references]], 0),
+        "group_proto": group_proto,
+        "group_start": group_start,
+        "uids": uids,
+        "extra_offsets": extra_offsets,
+        "extra_data": extra_data,
+        "comp_start": comp_start,
+        "comp_type": comp_type,
+        "comp_offsets": comp_offsets,
+        "comp_data": comp_data,
+    }
+    for key in REFERENCE_KEYS:
+        sections[key] = references.get(key, array.array(I64))
+
+    write_sections(cache_path, sections, stat)
+
+
+def int_array(value: Any, key: str, line: int) -> array.array:
+    if not isinstance(value, list) or any(not isinstance(v, int) or isinstance(v, bool) for v in value):
+        raise MapCacheError(f"line {line}: {key} is not a list of ints")
+    return array.array(I64, value)
+
+
+def dump_blob(value: Any, line: int) -> bytes:
+    encoded, tagged = encode_tags(value)
+    try:
+        return marshal.dumps((encoded,) if tagged else encoded, MARSHAL_VERSION)
+    except ValueError:
+        raise MapCacheError(f"line {line}: value can't be stored in the cache: {value!r}")
+
+
+def load_blob(data: memoryview) -> Any:
+    value = marshal.loads(data)
+    return decode_tags(value[0]) if isinstance(value, tuple) else value
+
+
+def encode_tags(value: Any) -> tuple:
+    """
+    value with every Tagged replaced by a (tag, value) tuple, and whether there were any.
+    """
+
+    if isinstance(value, Tagged):
+        inner, _ = encode_tags(value.value)
+        return (value.tag, inner), True
+
+    if isinstance(value, dict):
+        tagged = False
+        result = {}
+        for k, v in value.items():
+            k, key_tagged = encode_tags(k)
+            v, value_tagged = encode_tags(v)
+            result[k] = v
+            tagged = tagged or key_tagged or value_tagged
+        return (result, True) if tagged else (value, False)
+
+    if isinstance(value, list):
+        items = [encode_tags(v) for v in value]
+        return ([v for v, _ in items], True) if any(t for _, t in items) else (value, False)
+
+    return value, False
+
+
+def decode_tags(value: Any) -> Any:
+    if isinstance(value, tuple):
+        return Tagged(value[0], decode_tags(value[1]))
+    if isinstance(value, dict):
+        return {decode_tags(k): decode_tags(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_tags(v) for v in value]
+    return value
+
+
+def write_sections(path: str, sections: Dict[str, Any], stat: os.stat_result):
+    if sys.byteorder != "little":
+        # Columns are written straight out of arrays.
+        for value in sections.values():
+            if isinstance(value, array.array):
+                value.byteswap()
+
+    table_size = FILE_HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+    offset = align(table_size)
+    entries = []
+    for name in SECTIONS:
+        length = len(memoryview(sections[name]).cast("B"))
+        entries.append((offset, length))
+        offset = align(offset + length)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, MARSHAL_VERSION, stat.st_size, stat.st_mtime_ns))
+        for entry in entries:
+            f.write(SECTION_ENTRY.pack(*entry))
+
+        for name, (section_offset, _) in zip(SECTIONS, entries):
+            f.write(bytes(section_offset - f.tell()))
+            f.write(sections[name])
+
+    os.replace(tmp_path, path)
+
+
+def align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class MapCache:
+    """
+    Read-only view of a cache file. Columns are memoryviews straight into the mapping, nothing is decoded
+    until it's asked for. Use as a context manager, or call close() once done.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise MapCacheError("map cache files can only be read on little-endian machines")
+
+        # Every view into the mapping, they all have to be released before it can be closed.
+        self.views: List[memoryview] = []
+        self.mm: Optional[mmap.mmap] = None
+        self.file = open(path, "rb")
+        try:
+            self.open_sections(path)
+        except BaseException:
+            self.close()
+            raise
+
+        self.string_offsets = self.column("string_offsets", U64)
+        self.group_proto = self.column("group_proto", U32)
+        self.group_start = self.column("group_start", U64)
+        self.uids = self.column("uids", I64)
+        self.extra_offsets = self.column("extra_offsets", U64)
+        self.comp_start = self.column("comp_start", U64)
+        self.comp_type = self.column("comp_type", U32)
+        self.comp_offsets = self.column("comp_offsets", U64)
+
+        self._header: Optional[Dict[Any, Any]] = None
+        self._reference_keys: List[str] = []
+        self._uid_index: Optional[Dict[int, int]] = None
+
+    def open_sections(self, path: str):
+        size = os.fstat(self.file.fileno()).st_size
+        table_size = FILE_HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+        # mmap can't map empty files, and anything shorter than the section table is truncated anyway.
+        if size < table_size:
+            raise MapCacheError(f"{path}: truncated map cache file")
+
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mm)
+        self.views.append(self.buffer)
+
+        magic, version, marshal_version, self.source_size, self.source_mtime = FILE_HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or marshal_version != MARSHAL_VERSION:
+            raise MapCacheError(f"{path}: not a map cache file, or an unsupported version")
+
+        self.sections: Dict[str, memoryview] = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = SECTION_ENTRY.unpack_from(self.mm, FILE_HEADER.size + i * SECTION_ENTRY.size)
+            if offset + length > size:
+                raise MapCacheError(f"{path}: truncated map cache file")
+            self.sections[name] = self.buffer[offset:offset + length]
+            self.views.append(self.sections[name])
+
+        for name in ("string_offsets", "group_start", "extra_offsets", "comp_start", "comp_offsets"):
+            # Offset columns always have a leading 0.
+            if len(self.sections[name]) < ALIGNMENT:
+                raise MapCacheError(f"{path}: corrupt map cache file")
+
+    def __enter__(self) -> "MapCache":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views.clear()
+        if self.mm is not None:
+            self.mm.close()
+        self.file.close()
+
+    def column(self, name: str, typecode: str) -> memoryview:
+        view = self.sections[name].cast(typecode)
+        self.views.append(view)
+        return view
+
+    def is_fresh(self, yaml_path: str) -> bool:
+        stat = os.stat(yaml_path)
+        return stat.st_size == self.source_size and stat.st_mtime_ns == self.source_mtime
+
+    @property
+    def entity_count(self) -> int:
+        return len(self.uids)
+
+    @property
+    def component_count(self) -> int:
+        return len(self.comp_type)
+
+    def string(self, index: int) -> str:
+        return str(self.sections["string_data"][self.string_offsets[index]:self.string_offsets[index + 1]], "utf-8")
+
+    @property
+    def header(self) -> Dict[Any, Any]:
+        """
+        Every top-level key other than entities and the reference lists (meta, tilemap, ...).
+        """
+
+        return self.load_header()
+
+    def load_header(self) -> Dict[Any, Any]:
+        if self._header is None:
+            self._header, self._reference_keys = load_blob(self.sections["header"])
+        return self._header
+
+    def references(self, key: str) -> Optional[memoryview]:
+        """
+        One of the maps/grids/orphans/nullspace lists, or None if the file doesn't have it.
+        """
+
+        self.load_header()
+        return self.column(key, I64) if key in self._reference_keys else None
+
+    def entity_index(self, uid: int) -> Optional[int]:
+        if self._uid_index is None:
+            self._uid_index = {uid: i for i, uid in enumerate(self.uids)}
+        return self._uid_index.get(uid)
+
+    def proto_of(self, index: int) -> str:
+        group = bisect_right(self.group_start, index) - 1
+        return self.string(self.group_proto[group])
+
+    def entity(self, index: int) -> Dict[str, Any]:
+        entity: Dict[str, Any] = {"uid": self.uids[index]}
+        start, end = self.extra_offsets[index], self.extra_offsets[index + 1]
+        if end > start:
+            entity.update(load_blob(self.sections["extra_data"][start:end]))
+
+        entity["components"] = [self.component(c) for c in range(self.comp_start[index], self.comp_start[index + 1])]
+        return entity
+
+    def component(self, index: int) -> Dict[str, Any]:
+        component: Dict[str, Any] = {"type": self.string(self.comp_type[index])}
+        component.update(load_blob(self.sections["comp_data"][self.comp_offsets[index]:self.comp_offsets[index + 1]]))
+        return component
+
+    def proto_counts(self) -> Counter:
+        counts: Counter = Counter()
+        for group in range(len(self.group_proto)):
+            counts[self.string(self.group_proto[group])] += self.group_start[group + 1] - self.group_start[group]
+        return counts
+
+    def component_counts(self) -> Counter:
+        by_index = Counter(self.comp_type)
+        return Counter({self.string(index): count for index, count in by_index.items()})
+
+    def to_dict(self) -> Dict[Any, Any]:
+        """
+        Decodes the whole file, same as yaml.safe_load on the original map except that unknown tags are kept as Tagged.
+        """
+
+        document = dict(self.load_header())
+        for key in self._reference_keys:
+            document[key] = list(self.column(key, I64))
+
+        groups = []
+        for group in range(len(self.group_proto)):
+            start, end = self.group_start[group], self.group_start[group + 1]
+            groups.append({"proto": self.string(self.group_proto[group]), "entities": [self.entity(i) for i in range(start, end)]})
+        document["entities"] = groups
+        return document
+
+
+def cache_path_for(yaml_path: str, output: Optional[str] = None) -> str:
+    if output is None:
+        return yaml_path + CACHE_SUFFIX
+    # Maps in different directories can have the same name, tell them apart by a hash of the full path.
+    path_hash = hashlib.sha256(os.path.abspath(yaml_path).encode("utf-8")).hexdigest()[:12]
+    name, _ = os.path.splitext(os.path.basename(yaml_path))
+    return os.path.join(output, f"{name}-{path_hash}{CACHE_SUFFIX}")
+
+
+def open_map(yaml_path: str, output: Optional[str] = None) -> MapCache:
+    """
+    Opens the cache of a map file, (re)building it first if it's missing or out of date.
+    """
+
+    cache_path = cache_path_for(yaml_path, output)
+    try:
+        cache = MapCache(cache_path)
+        if cache.is_fresh(yaml_path):
+            return cache
+        cache.close()
+    except (OSError, MapCacheError):
+        pass
+
+    convert(yaml_path, cache_path)
+    return MapCache(cache_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("mapfile_binary.py", description="Converts map files into compact binary caches.")
+    parser.add_argument("paths", nargs="+", help="Map files, or directories to look for .yml map files in")
+    parser.add_argument("-o", "--output", help=f"Directory to write caches to (default: next to each map, with a {CACHE_SUFFIX} suffix)")
+    parser.add_argument("--force", action="store_true", help="Rebuild caches even if they're up to date")
+
+    args = parser.parse_args()
+
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+
+    failed = 0
+    converted = 0
+    files = find_map_files(args.paths)
+    for path in files:
+        cache_path = cache_path_for(path, args.output)
+        if not args.force and is_up_to_date(cache_path, path):
+            continue
+
+        try:
+            convert(path, cache_path)
+            converted += 1
+        except MapCacheError as e:
+            failed += 1
+            print(f"{path}: {e}")
+
+    print(f"Converted {converted} of {len(files)} maps")
+    return 1 if failed else 0
+
+
+def is_up_to_date(cache_path: str, yaml_path: str) -> bool:
+    try:
+        with MapCache(cache_path) as cache:
+            return cache.is_fresh(yaml_path)
+    except (OSError, MapCacheError):
+        return False
+
+
+if __name__ == "__main__":
+    exit(main())
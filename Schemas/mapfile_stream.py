@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+# Streaming reader for map files (see mapfile.yml), for tools that need to look at every entity of huge maps
+# without loading the whole document into memory.
+#
+# The YAML event stream is walked directly (with the libyaml C parser when available),
+# and only ever one entity is built into Python objects at a time.
+# Everything outside of the entities list (meta, tilemap, maps, grids, ...) is small and gets built in full.
+#
+# Scalars resolve exactly like yaml.safe_load. Unknown tags (e.g. !type:) are ignored rather than rejected,
+# the value is built as if the tag wasn't there. Tools that need to see them (e.g. diffs, where a changed !type:
+# is a real change) pass keep_tags=True, which wraps every value with an unknown tag in a Tagged.
+
+import yaml
+from typing import Any, Dict, IO, Iterator, List, Optional, Union
+
+try:
+    from yaml import CSafeLoader as StreamLoader
+except ImportError:
+    from yaml import SafeLoader as StreamLoader
+
+
+class MapStreamError(Exception):
+    def __init__(self, message: str, line: Optional[int] = None):
+        super().__init__(message if line is None else f"line {line}: {message}")
+        self.line = line
+
+
+class HeaderValue:
+    """
+    A top-level key other than a streamable entities list.
+    """
+
+    def __init__(self, key: Any, value: Any, line: int):
+        self.key = key
+        self.value = value
+        self.line = line
+
+
+class EntityRecord:
+    def __init__(self, proto: Any, proto_index: int, entity_index: int, value: Any, line: int):
+        # Value of the proto key of the containing prototype group. Not necessarily a valid string.
+        self.proto = proto
+        self.proto_index = proto_index
+        self.entity_index = entity_index
+        self.value = value
+        self.line = line
+
+
+class ProtoRecord:
+    """
+    Emitted after all entities of a prototype group.
+    fields holds every key of the group except a streamed entities list, or the raw value if the group isn't a mapping.
+    """
+
+    def __init__(self, proto_index: int, fields: Any, entity_count: Optional[int], line: int):
+        self.proto_index = proto_index
+        self.fields = fields
+        # None if there was no entities list to stream (missing or not a list, see fields).
+        self.entity_count = entity_count
+        self.line = line
+
+
+class Tagged:
+    """
+    A value with an application specific tag, like a !type:ContainerSlot mapping. Only built with keep_tags=True.
+    """
+
+    __slots__ = ("tag", "value")
+
+    def __init__(self, tag: str, value: Any):
+        self.tag = tag
+        self.value = value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Tagged) and self.tag == other.tag and self.value == other.value
+
+    def __hash__(self) -> int:
+        return hash((self.tag, self.value))
+
+    def __repr__(self) -> str:
+        return f"{self.tag} {self.value!r}"
+
+
+MapRecord = Union[HeaderValue, EntityRecord, ProtoRecord]
+
+
+def is_component(value: Any) -> bool:
+    """
+    Whether an entry of an entity's components list is a component.
+    Shared by the Yamale schema (mapfile_validators.Component) and validate_mapfile.py.
+    """
+
+    return isinstance(value, dict) and "type" in value
+
+# Tags of mappings and sequences that don't need preserving, the value already says as much.
+PLAIN_COLLECTION_TAGS = {None, "!", "tag:yaml.org,2002:map", "tag:yaml.org,2002:seq"}
+
+
+def iter_map(stream: Union[IO[str], IO[bytes]], keep_tags: bool = False) -> Iterator[MapRecord]:
+    """
+    Yields the contents of a map file in document order.
+    Top-level structure that can't be followed (e.g. the document isn't a mapping) raises MapStreamError.
+    """
+
+    reader = _EventReader(yaml.parse(stream, Loader=StreamLoader), keep_tags)
+
+    reader.expect(yaml.StreamStartEvent)
+    start = reader.next()
+    if isinstance(start, yaml.StreamEndEvent):
+        raise MapStreamError("file is empty")
+
+    reader.expect_current(yaml.DocumentStartEvent, start)
+    top = reader.next()
+    if not isinstance(top, yaml.MappingStartEvent):
+        raise MapStreamError("top level of a map file must be a mapping", line_of(top))
+
+    while True:
+        event = reader.next()
+        if isinstance(event, yaml.MappingEndEvent):
+            break
+
+        key = reader.build(event)
+        value_event = reader.next()
+        if key == "entities" and isinstance(value_event, yaml.SequenceStartEvent):
+            yield from _iter_protos(reader)
+        else:
+            yield HeaderValue(key, reader.build(value_event), line_of(event))
+
+    reader.expect(yaml.DocumentEndEvent)
+    end = reader.next()
+    if not isinstance(end, yaml.StreamEndEvent):
+        raise MapStreamError("map files must contain a single YAML document", line_of(end))
+
+
+def _iter_protos(reader: "_EventReader") -> Iterator[MapRecord]:
+    proto_index = 0
+    while True:
+        event = reader.next()
+        if isinstance(event, yaml.SequenceEndEvent):
+            return
+
+        if not isinstance(event, yaml.MappingStartEvent):
+            yield ProtoRecord(proto_index, reader.build(event), None, line_of(event))
+            proto_index += 1
+            continue
+
+        line = line_of(event)
+        fields: Dict[Any, Any] = {}
+        entity_count: Optional[int] = None
+        # Entities that came before the proto key, only happens with hand-written files.
+        pending: List[EntityRecord] = []
+
+        while True:
+            key_event = reader.next()
+            if isinstance(key_event, yaml.MappingEndEvent):
+                break
+
+            key = reader.build(key_event)
+            value_event = reader.next()
+            if key != "entities" or not isinstance(value_event, yaml.SequenceStartEvent):
+                fields[key] = reader.build(value_event)
+                if key == "proto" and pending:
+                    for record in pending:
+                        record.proto = fields[key]
+                    yield from pending
+                    pending.clear()
+                continue
+
+            entity_count = 0
+            while True:
+                entity_event = reader.next()
+                if isinstance(entity_event, yaml.SequenceEndEvent):
+                    break
+
+                record = EntityRecord(fields.get("proto"), proto_index, entity_count, reader.build(entity_event), line_of(entity_event))
+                entity_count += 1
+                if "proto" in fields:
+                    yield record
+                else:
+                    pending.append(record)
+
+        # No proto key at all, hand them out anyway so they still get checked.
+        yield from pending
+        yield ProtoRecord(proto_index, fields, entity_count, line)
+        proto_index += 1
+
+
+class _EventReader:
+    def __init__(self, events: Iterator[yaml.Event], keep_tags: bool = False):
+        self.events = events
+        self.keep_tags = keep_tags
+        self.anchors: Dict[str, Any] = {}
+        self.resolver = yaml.resolver.Resolver()
+        self.constructor = yaml.constructor.SafeConstructor()
+
+    def next(self) -> yaml.Event:
+        try:
+            return next(self.events)
+        except StopIteration:
+            raise MapStreamError("unexpected end of file")
+
+    def expect(self, kind: type) -> yaml.Event:
+        return self.expect_current(kind, self.next())
+
+    def expect_current(self, kind: type, event: yaml.Event) -> yaml.Event:
+        if not isinstance(event, kind):
+            raise MapStreamError(f"expected {kind.__name__}, got {type(event).__name__}", line_of(event))
+        return event
+
+    def build(self, event: yaml.Event) -> Any:
+        """
+        Builds the full value starting at the given event.
+        """
+
+        if isinstance(event, yaml.ScalarEvent):
+            value = self.construct_scalar(event)
+            if self.keep_tags and event.tag not in (None, "!") and event.tag not in self.constructor.yaml_constructors:
+                value = Tagged(event.tag, value)
+            self.remember(event, value)
+            return value
+
+        if isinstance(event, yaml.SequenceStartEvent):
+            sequence: List[Any] = []
+            built = self.tagged(event, sequence)
+            self.remember(event, built)
+            while True:
+                item = self.next()
+                if isinstance(item, yaml.SequenceEndEvent):
+                    return built
+                sequence.append(self.build(item))
+
+        if isinstance(event, yaml.MappingStartEvent):
+            mapping: Dict[Any, Any] = {}
+            built = self.tagged(event, mapping)
+            self.remember(event, built)
+            while True:
+                key_event = self.next()
+                if isinstance(key_event, yaml.MappingEndEvent):
+                    return built
+                key = self.build(key_event)
+                mapping[key] = self.build(self.next())
+
+        if isinstance(event, yaml.AliasEvent):
+            if event.anchor not in self.anchors:
+                raise MapStreamError(f"unknown alias {event.anchor}", line_of(event))
+            return self.anchors[event.anchor]
+
+        raise MapStreamError(f"unexpected {type(event).__name__}", line_of(event))
+
+    def tagged(self, event: yaml.CollectionStartEvent, value: Any) -> Any:
+        if self.keep_tags and event.tag not in PLAIN_COLLECTION_TAGS:
+            return Tagged(event.tag, value)
+        return value
+
+    def remember(self, event: yaml.NodeEvent, value: Any):
+        if event.anchor is not None:
+            self.anchors[event.anchor] = value
+
+    def construct_scalar(self, event: yaml.ScalarEvent) -> Any:
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = self.resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+        elif tag not in self.constructor.yaml_constructors:
+            # Unknown tag, resolve as if it wasn't there.
+            tag = self.resolver.resolve(yaml.ScalarNode, event.value, (not event.style, True))
+
+        node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, event.style)
+        return self.constructor.yaml_constructors[tag](self.constructor, node)
+
+
+def line_of(event: yaml.Event) -> int:
+    mark = event.start_mark
+    return mark.line + 1 if mark is not None else 0
@@ -1,8 +1,9 @@
 from yamale.validators import Validator
+from mapfile_stream import is_component
 import yaml
 
 class Component(Validator):
     tag = "comp"
 
     def _is_valid(self, value):
-        return 'type' in value
+        return is_component(value)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+# Losslessly recompresses PNGs: RSI state sheets and any other PNG in the given directories.
+#
+# Every image is re-encoded with the smallest pixel-exact color type and bit depth (grayscale, palette, no alpha...),
+# every PNG row filter strategy and several zlib strategies, keeping whichever comes out smallest.
+# Ancillary chunks (text, timestamps, color profiles, ...) are dropped: the engine ignores them.
+# A file is only replaced if the new encoding decodes to exactly the same RGBA pixels and is actually smaller.
+
+import argparse
+import io
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+# numpy and PIL are slow to import, they're only imported where they're used.
+if TYPE_CHECKING:
+    import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+COLOR_GRAY = 0
+COLOR_RGB = 2
+COLOR_PALETTE = 3
+COLOR_GRAY_ALPHA = 4
+COLOR_RGBA = 6
+
+ZLIB_STRATEGIES = [zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_RLE]
+
+
+class Result:
+    def __init__(self, path: str, old_size: int, new_size: Optional[int] = None, skipped: Optional[str] = None):
+        self.path = path
+        self.old_size = old_size
+        # None if the file was left alone.
+        self.new_size = new_size
+        self.skipped = skipped
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("optimize_pngs.py", description="Losslessly recompresses PNG files in place.")
+    parser.add_argument("directories", nargs="+", help="Directories to look for PNGs (including RSI states) in")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="Only report how much would be saved, don't touch any files")
+    parser.add_argument("--fast", action="store_true", help="Try fewer filter and zlib strategy combinations")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Report every file, not just totals")
+
+    args = parser.parse_args()
+
+    files = sorted(set(find_pngs(args.directories)))
+
+    total_old = 0
+    total_new = 0
+    optimized = 0
+    failed = 0
+
+    with ProcessPoolExecutor(args.jobs) as executor:
+        results = executor.map(optimize_file, files, [args.dry_run] * len(files), [args.fast] * len(files), chunksize=8)
+        for result in results:
+            total_old += result.old_size
+            if result.skipped:
+                total_new += result.old_size
+                if result.skipped.startswith("error"):
+                    failed += 1
+                    print(f"{result.path}: {result.skipped}")
+                elif args.verbose:
+                    print(f"{result.path}: skipped, {result.skipped}")
+                continue
+
+            if result.new_size is None:
+                total_new += result.old_size
+                continue
+
+            optimized += 1
+            total_new += result.new_size
+            if args.verbose:
+                print(f"{result.path}: {result.old_size} -> {result.new_size} bytes (-{result.old_size - result.new_size})")
+
+    saved = total_old - total_new
+    verb = "Would save" if args.dry_run else "Saved"
+    percent = saved / total_old if total_old else 0.0
+    print(f"{verb} {saved} bytes ({percent:.1%}) over {len(files)} PNGs, {optimized} recompressed")
+
+    return 1 if failed else 0
+
+
+def find_pngs(directories: List[str]) -> Iterator[str]:
+    # RSI state sheets are just PNGs under the directory as well, so a single walk finds them.
+    # Any stray PNG inside an RSI gets optimized too, validate_rsis.py is what complains about those.
+    for dir in directories:
+        for root, _, files in os.walk(dir):
+            for file in files:
+                if file.lower().endswith(".png"):
+                    yield os.path.join(root, file)
+
+
+def optimize_file(path: str, dry_run: bool, fast: bool) -> Result:
+    import numpy as np
+    from PIL import Image
+
+    with open(path, "rb") as f:
+        original = f.read()
+
+    try:
+        skip_reason = check_supported(original)
+        if skip_reason:
+            return Result(path, len(original), skipped=skip_reason)
+
+        with Image.open(path) as image:
+            if getattr(image, "is_animated", False):
+                return Result(path, len(original), skipped="animated PNG")
+
+            pixels = np.asarray(image.convert("RGBA"))
+
+        encoded = encode_smallest(pixels, fast)
+        if len(encoded) >= len(original):
+            return Result(path, len(original))
+
+        # Never trust the encoder blindly, decode what we just made and compare.
+        with Image.open(io.BytesIO(encoded)) as check:
+            if not np.array_equal(np.asarray(check.convert("RGBA")), pixels):
+                return Result(path, len(original), skipped="error: re-encoded image does not match, file left untouched")
+
+        if not dry_run:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encoded)
+            os.replace(tmp_path, path)
+
+        return Result(path, len(original), len(encoded))
+
+    except Exception as e:
+        return Result(path, len(original), skipped=f"error: {e}")
+
+
+def check_supported(data: bytes) -> Optional[str]:
+    if data[:8] != PNG_SIGNATURE or data[12:16] != b"IHDR":
+        return "error: not a PNG file"
+
+    # PIL decodes 16-bit images to 8 bits per channel, so we can't compare those exactly.
+    bit_depth = data[24]
+    if bit_depth == 16:
+        return "16-bit image"
+
+    return None
+
+
+def encode_smallest(pixels: "np.ndarray", fast: bool) -> bytes:
+    best: Optional[bytes] = None
+    for color_type, bit_depth, rows, palette, transparency in pixel_layouts(pixels):
+        for filtered in filter_candidates(rows, bits_per_pixel(color_type, bit_depth), fast):
+            for strategy in ZLIB_STRATEGIES[:1] if fast else ZLIB_STRATEGIES:
+                compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+                idat = compressor.compress(filtered) + compressor.flush()
+
+                height, width = pixels.shape[:2]
+                png = write_png(width, height, bit_depth, color_type, palette, transparency, idat)
+                if best is None or len(png) < len(best):
+                    best = png
+
+    assert best is not None
+    return best
+
+
+def pixel_layouts(pixels: "np.ndarray") -> Iterator[Tuple[int, int, "np.ndarray", Optional[bytes], Optional[bytes]]]:
+    """
+    Yields every exact representation worth trying as (color type, bit depth, packed rows, PLTE, tRNS).
+    """
+
+    import numpy as np
+
+    rgb = pixels[:, :, :3]
+    alpha = pixels[:, :, 3]
+    opaque = bool((alpha == 255).all())
+    gray = bool((rgb[:, :, 0] == rgb[:, :, 1]).all() and (rgb[:, :, 1] == rgb[:, :, 2]).all())
+
+    if gray and opaque:
+        values = rgb[:, :, 0]
+        depth = smallest_gray_depth(values)
+        yield COLOR_GRAY, depth, pack_rows(values // (255 // ((1 << depth) - 1)), depth), None, None
+    elif gray:
+        yield COLOR_GRAY_ALPHA, 8, pixels[:, :, [0, 3]].reshape(pixels.shape[0], -1), None, None
+    elif opaque:
+        yield COLOR_RGB, 8, rgb.reshape(pixels.shape[0], -1), None, None
+    else:
+        yield COLOR_RGBA, 8, pixels.reshape(pixels.shape[0], -1), None, None
+
+    # Palette, if it fits.
+    packed = pixels.view(np.uint32).reshape(pixels.shape[:2])
+    colors, indices = np.unique(packed, return_inverse=True)
+    if len(colors) > 256:
+        return
+
+    # Put translucent colors first so tRNS can stop after the last one of them.
+    color_bytes = colors.view(np.uint8).reshape(-1, 4)
+    order = np.argsort(color_bytes[:, 3] == 255, kind="stable")
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    color_bytes = color_bytes[order]
+    indices = remap[indices.reshape(pixels.shape[:2])]
+
+    translucent = int((color_bytes[:, 3] != 255).sum())
+    palette = color_bytes[:, :3].tobytes()
+    transparency = color_bytes[:translucent, 3].tobytes() if translucent else None
+
+    depth = next(d for d in (1, 2, 4, 8) if len(colors) <= (1 << d))
+    yield COLOR_PALETTE, depth, pack_rows(indices.astype(np.uint8), depth), palette, transparency
+
+
+def smallest_gray_depth(values: "np.ndarray") -> int:
+    # A gray value is representable at a lower depth if it's an exact multiple of that depth's scale step.
+    for depth in (1, 2, 4):
+        step = 255 // ((1 << depth) - 1)
+        if not (values % step).any():
+            return depth
+
+    return 8
+
+
+def pack_rows(values: "np.ndarray", depth: int) -> "np.ndarray":
+    import numpy as np
+
+    if depth == 8:
+        return values.astype(np.uint8)
+
+    per_byte = 8 // depth
+    height, width = values.shape
+    padded_width = -(-width // per_byte) * per_byte
+    padded = np.zeros((height, padded_width), dtype=np.uint8)
+    padded[:, :width] = values
+
+    grouped = padded.reshape(height, -1, per_byte)
+    shifts = np.arange(per_byte - 1, -1, -1, dtype=np.uint8) * depth
+    return (grouped << shifts).sum(axis=2, dtype=np.uint8)
+
+
+def bits_per_pixel(color_type: int, bit_depth: int) -> int:
+    channels = {COLOR_GRAY: 1, COLOR_RGB: 3, COLOR_PALETTE: 1, COLOR_GRAY_ALPHA: 2, COLOR_RGBA: 4}[color_type]
+    return channels * bit_depth
+
+
+def filter_candidates(rows: "np.ndarray", bits: int, fast: bool) -> Iterator[bytes]:
+    """
+    Yields the image data (filter byte + filtered scanline, for every row) for each filtering strategy:
+    every row with the same filter, and the usual minimum sum of absolute differences heuristic per row.
+    """
+
+    import numpy as np
+
+    # Filters work on bytes, "previous pixel" means bpp bytes back (at least 1).
+    bpp = max(1, bits // 8)
+    x = rows.astype(np.int16)
+    height = x.shape[0]
+
+    a = np.zeros_like(x)
+    a[:, bpp:] = x[:, :-bpp]
+    b = np.zeros_like(x)
+    b[1:] = x[:-1]
+    c = np.zeros_like(x)
+    c[1:, bpp:] = x[:-1, :-bpp]
+
+    p = a + b - c
+    pa = np.abs(p - a)
+    pb = np.abs(p - b)
+    pc = np.abs(p - c)
+    paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+    filtered = np.stack([
+        x,
+        x - a,
+        x - b,
+        x - ((a + b) >> 1),
+        x - paeth,
+    ]).astype(np.uint8)
+
+    def serialize(choice: "np.ndarray") -> bytes:
+        out = np.empty((height, x.shape[1] + 1), dtype=np.uint8)
+        out[:, 0] = choice
+        out[:, 1:] = filtered[choice, np.arange(height)]
+        return out.tobytes()
+
+    # Minimum sum of absolute differences, treating filtered bytes as signed.
+    cost = np.abs(filtered.astype(np.int8).astype(np.int32)).sum(axis=2)
+    yield serialize(cost.argmin(axis=0))
+
+    if fast:
+        yield serialize(np.zeros(height, dtype=np.intp))
+        return
+
+    for f in range(5):
+        yield serialize(np.full(height, f, dtype=np.intp))
+
+
+def write_png(width: int, height: int, bit_depth: int, color_type: int, palette: Optional[bytes], transparency: Optional[bytes], idat: bytes) -> bytes:
+    out = [PNG_SIGNATURE, chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0))]
+    if palette is not None:
+        out.append(chunk(b"PLTE", palette))
+    if transparency is not None:
+        out.append(chunk(b"tRNS", transparency))
+    out.append(chunk(b"IDAT", idat))
+    out.append(chunk(b"IEND", b""))
+    return b"".join(out)
+
+
+def chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# Shared RSI geometry and atlas packing logic for the RSI atlas tools.
+#
+# The packing mirrors what the client does at startup (see ResourceCache.Preload.cs and RsiLoading.GenerateAtlas):
+# every RSI gets blitted into its own square-ish sheet, and those sheets are packed into shared atlas pages
+# using first-fit decreasing height levels, with extra "free" levels above shorter items.
+
+import math
+import os
+import struct
+from validate_rsis import read_json, state_frame_count
+from typing import Any, List, Optional, Tuple
+
+# res.rsi_atlas_size default.
+DEFAULT_PAGE_SIZE = 12288
+
+# RGBA8
+BYTES_PER_PIXEL = 4
+
+
+class StateGeometry:
+    def __init__(self, name: str, directions: int, frame_count: int, sheet_size: Optional[Tuple[int, int]]):
+        self.name = name
+        self.directions = directions
+        self.frame_count = frame_count
+        # Dimensions of the state PNG, None if it couldn't be read.
+        self.sheet_size = sheet_size
+
+
+class RsiGeometry:
+    def __init__(self, path: str, frame_size: Tuple[int, int], states: List[StateGeometry], meta_atlas: bool):
+        self.path = path
+        self.frame_size = frame_size
+        self.states = states
+        # Whether the client puts this RSI into the shared atlas, or gives it its own texture.
+        self.meta_atlas = meta_atlas
+
+    @property
+    def frame_count(self) -> int:
+        return sum(s.frame_count for s in self.states)
+
+    def engine_sheet_size(self) -> Tuple[int, int]:
+        """
+        Size of the per-RSI sheet the engine generates, see RsiLoading.GenerateAtlas.
+        """
+
+        total = self.frame_count
+        if total == 0:
+            return 0, 0
+
+        dim_x = math.ceil(math.sqrt(total))
+        dim_y = math.ceil(total / dim_x)
+        return dim_x * self.frame_size[0], dim_y * self.frame_size[1]
+
+    def frame_pixels(self) -> int:
+        return self.frame_count * self.frame_size[0] * self.frame_size[1]
+
+    def source_pixels(self) -> int:
+        return sum(s.sheet_size[0] * s.sheet_size[1] for s in self.states if s.sheet_size)
+
+
+def load_rsi_geometry(rsi: str) -> RsiGeometry:
+    meta_json = read_json(os.path.join(rsi, "meta.json"))
+    frame_size = (meta_json["size"]["x"], meta_json["size"]["y"])
+
+    states = []
+    for state in meta_json["states"]:
+        try:
+            sheet_size = read_png_size(os.path.join(rsi, f"{state['name']}.png"))
+        except (OSError, ValueError):
+            sheet_size = None
+
+        states.append(StateGeometry(state["name"], state.get("directions", 1), state_frame_count(state), sheet_size))
+
+    # See RSIResource and ResourceCache.ShouldMetaAtlas: non-default load parameters get a separate texture.
+    load = meta_json.get("load") or {}
+    meta_atlas = meta_json.get("metaAtlas", True) and load.get("srgb", True)
+
+    return RsiGeometry(rsi, frame_size, states, meta_atlas)
+
+
+def read_png_size(path: str) -> Tuple[int, int]:
+    # Only the IHDR chunk is needed, which always comes first. No need to go through an image library for this.
+    with open(path, "rb") as f:
+        header = f.read(24)
+
+    if len(header) < 24 or header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR":
+        raise ValueError(f"{path} is not a PNG file")
+
+    return struct.unpack(">II", header[16:24])
+
+
+class Placement:
+    def __init__(self, page: int, x: int, y: int):
+        self.page = page
+        self.x = x
+        self.y = y
+
+
+class _Level:
+    def __init__(self, page: int, x: int, y: int, height: int, max_width: int):
+        self.page = page
+        self.x = x
+        self.y = y
+        self.height = height
+        self.width = 0
+        self.max_width = max_width
+
+
+class PackResult:
+    def __init__(self, placements: List[Placement], page_sizes: List[Tuple[int, int]]):
+        # Same order as the rectangles passed in.
+        self.placements = placements
+        self.page_sizes = page_sizes
+
+    def allocated_pixels(self) -> int:
+        return sum(w * h for w, h in self.page_sizes)
+
+
+def pack_rects(sizes: List[Tuple[int, int]], page_size: int) -> PackResult:
+    """
+    Packs rectangles into pages of page_size width and at most page_size height.
+    Like the engine, pages are only as tall as what got placed on them.
+    Packing is deterministic: ties in height are broken by the order the rectangles are passed in.
+    """
+
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], i))
+    placements: List[Optional[Placement]] = [None] * len(sizes)
+    page_sizes: List[Tuple[int, int]] = []
+    levels: List[_Level] = []
+
+    page = 0
+    current_height = 0
+    # Only differs from page_size if something wider than a page had to go on it.
+    current_width = page_size
+
+    for i in order:
+        width, height = sizes[i]
+        if width == 0 or height == 0:
+            placements[i] = Placement(-1, 0, 0)
+            continue
+
+        for level in levels:
+            if level.height < height or level.width + width > level.max_width:
+                continue
+
+            placements[i] = Placement(level.page, level.x + level.width, level.y)
+            if level.height > height:
+                # Free space above the item becomes a new level as wide as the item.
+                free = _Level(level.page, level.x + level.width, level.y + height, level.height - height, width)
+                levels.append(free)
+
+            level.width += width
+            break
+        else:
+            if current_height + height > page_size and current_height > 0:
+                page_sizes.append((current_width, current_height))
+                page += 1
+                current_height = 0
+                current_width = page_size
+
+            current_width = max(current_width, width)
+            level = _Level(page, 0, current_height, height, current_width)
+            level.width = width
+            levels.append(level)
+            placements[i] = Placement(page, 0, current_height)
+            current_height += height
+
+    if current_height > 0:
+        page_sizes.append((current_width, current_height))
+
+    return PackResult(placements, page_sizes)
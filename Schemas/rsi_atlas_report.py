@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# Estimates how much texture memory RSIs take up in the client once packed into its atlases.
+# Uses the same per-RSI sheet layout and atlas packing as the engine, see rsi_atlas.py.
+
+import argparse
+import json
+import os
+import subprocess
+import tarfile
+import tempfile
+from rsi_atlas import BYTES_PER_PIXEL, DEFAULT_PAGE_SIZE, RsiGeometry, load_rsi_geometry, pack_rects
+from validate_rsis import find_rsis
+from typing import Any, Dict, List, Tuple
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("rsi_atlas_report.py", description="Estimates client atlas pages and texture memory used by RSIs.")
+    parser.add_argument("directories", nargs="+", help="Directories to look for RSIs in")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help=f"Atlas page size, res.rsi_atlas_size on the client (default {DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--depth", type=int, default=2, help="Number of path components below each directory to group RSIs by (default 2)")
+    parser.add_argument("--top", type=int, default=20, help="Number of largest RSIs to list (default 20)")
+    parser.add_argument("--compare", metavar="REF", help="Also analyze the directories as of this git ref, and report the difference")
+    parser.add_argument("--json", metavar="PATH", help="Write the full report as JSON")
+
+    args = parser.parse_args()
+
+    report = build_report(args.directories, args.directories, args.page_size, args.depth)
+
+    print_report(report, args.top)
+
+    if args.compare:
+        with tempfile.TemporaryDirectory() as tmp:
+            old_dirs = export_git_dirs(args.compare, args.directories, tmp)
+            old_report = build_report(old_dirs, args.directories, args.page_size, args.depth)
+
+        print()
+        print_comparison(old_report, report, args.compare)
+        report["compare"] = {"ref": args.compare, "report": old_report}
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+def build_report(directories: List[str], names: List[str], page_size: int, depth: int) -> Dict[str, Any]:
+    """
+    names are used in place of directories in the report, so reports of different checkouts line up.
+    """
+
+    rsis: List[Tuple[str, RsiGeometry]] = []
+    skipped: List[str] = []
+    for dir, name in zip(directories, names):
+        for rsi in find_rsis(dir):
+            rel = os.path.relpath(rsi, dir)
+            try:
+                rsis.append((os.path.join(name, rel), load_rsi_geometry(rsi)))
+            except Exception:
+                # validate_rsis.py is what reports broken RSIs.
+                skipped.append(os.path.join(name, rel))
+
+    rsis.sort(key=lambda r: r[0])
+
+    atlased = [(name, geo) for name, geo in rsis if geo.meta_atlas]
+    packing = pack_rects([geo.engine_sheet_size() for _, geo in atlased], page_size)
+
+    pages = [{"width": w, "height": h, "bytes": w * h * BYTES_PER_PIXEL, "used_pixels": 0} for w, h in packing.page_sizes]
+    for (_, geo), placement in zip(atlased, packing.placements):
+        if placement.page >= 0:
+            pages[placement.page]["used_pixels"] += geo.frame_pixels()
+
+    per_rsi: Dict[str, Dict[str, Any]] = {}
+    for name, geo in rsis:
+        sheet_w, sheet_h = geo.engine_sheet_size()
+        per_rsi[name] = {
+            "atlased": geo.meta_atlas,
+            "frames": geo.frame_count,
+            "frame_size": list(geo.frame_size),
+            "sheet_size": [sheet_w, sheet_h],
+            "sheet_bytes": sheet_w * sheet_h * BYTES_PER_PIXEL,
+            "frame_bytes": geo.frame_pixels() * BYTES_PER_PIXEL,
+            "source_bytes": geo.source_pixels() * BYTES_PER_PIXEL,
+        }
+
+    per_dir: Dict[str, Dict[str, int]] = {}
+    for name, entry in per_rsi.items():
+        group = group_key(name, names, depth)
+        totals = per_dir.setdefault(group, {"rsis": 0, "frames": 0, "sheet_bytes": 0, "frame_bytes": 0})
+        totals["rsis"] += 1
+        totals["frames"] += entry["frames"]
+        totals["sheet_bytes"] += entry["sheet_bytes"]
+        totals["frame_bytes"] += entry["frame_bytes"]
+
+    atlas_bytes = packing.allocated_pixels() * BYTES_PER_PIXEL
+    standalone_bytes = sum(e["sheet_bytes"] for e in per_rsi.values() if not e["atlased"])
+    frame_bytes = sum(e["frame_bytes"] for e in per_rsi.values() if e["atlased"])
+
+    return {
+        "page_size": page_size,
+        "totals": {
+            "rsis": len(rsis),
+            "atlased_rsis": len(atlased),
+            "pages": len(pages),
+            "atlas_bytes": atlas_bytes,
+            "standalone_bytes": standalone_bytes,
+            "gpu_bytes": atlas_bytes + standalone_bytes,
+            "fill_ratio": frame_bytes / atlas_bytes if atlas_bytes else 0.0,
+        },
+        "pages": pages,
+        "directories": per_dir,
+        "rsis": per_rsi,
+        "skipped": skipped,
+    }
+
+
+def group_key(rsi: str, roots: List[str], depth: int) -> str:
+    # RSI paths in reports always start with one of the roots.
+    for root in roots:
+        prefix = os.path.join(root, "")
+        if rsi.startswith(prefix):
+            parts = os.path.dirname(rsi[len(prefix):]).split(os.sep)
+            return os.path.join(root, *[p for p in parts[:depth] if p])
+
+    return os.path.dirname(rsi)
+
+
+def export_git_dirs(ref: str, directories: List[str], dest: str) -> List[str]:
+    """
+    Extracts the given directories as of a git ref into dest, returns the matching paths inside it.
+    """
+
+    toplevel = subprocess.run(["git", "rev-parse", "--show-toplevel"], check=True, stdout=subprocess.PIPE).stdout.decode("utf-8").strip()
+    rel_dirs = [os.path.relpath(os.path.realpath(d), toplevel) for d in directories]
+
+    archive = subprocess.Popen(["git", "archive", "--format=tar", ref, "--"] + rel_dirs, cwd=toplevel, stdout=subprocess.PIPE)
+    with tarfile.open(fileobj=archive.stdout, mode="r|") as tar:
+        tar.extractall(dest, filter="data")
+
+    if archive.wait() != 0:
+        raise RuntimeError(f"git archive failed for {ref}")
+
+    return [os.path.join(dest, d) for d in rel_dirs]
+
+
+def print_report(report: Dict[str, Any], top: int):
+    totals = report["totals"]
+    print(f"RSIs: {totals['rsis']} ({totals['atlased_rsis']} in the shared atlas)")
+    print(f"Atlas pages ({report['page_size']} wide): {totals['pages']}, fill ratio {totals['fill_ratio']:.1%}")
+    for i, page in enumerate(report["pages"]):
+        fill = page["used_pixels"] * BYTES_PER_PIXEL / page["bytes"] if page["bytes"] else 0.0
+        print(f"  page {i}: {page['width']}x{page['height']}, {format_bytes(page['bytes'])}, {fill:.1%} filled")
+    print(f"Estimated texture memory: {format_bytes(totals['gpu_bytes'])} "
+          f"({format_bytes(totals['atlas_bytes'])} atlas, {format_bytes(totals['standalone_bytes'])} standalone RSIs)")
+
+    if report["skipped"]:
+        print(f"Skipped {len(report['skipped'])} RSI(s) that failed to load, run validate_rsis.py on them.")
+
+    print()
+    print("Per directory:")
+    dirs = sorted(report["directories"].items(), key=lambda d: -d[1]["sheet_bytes"])
+    for name, entry in dirs:
+        print(f"  {format_bytes(entry['sheet_bytes']):>12}  {entry['rsis']:>5} RSIs {entry['frames']:>6} frames  {name}")
+
+    print()
+    print(f"Largest {top} RSIs:")
+    rsis = sorted(report["rsis"].items(), key=lambda r: -r[1]["sheet_bytes"])
+    for name, entry in rsis[:top]:
+        w, h = entry["sheet_size"]
+        fw, fh = entry["frame_size"]
+        print(f"  {format_bytes(entry['sheet_bytes']):>12}  {w}x{h} sheet, {entry['frames']} frames of {fw}x{fh}  {name}")
+
+
+def print_comparison(old: Dict[str, Any], new: Dict[str, Any], ref: str):
+    print(f"Compared to {ref}:")
+    for key in ("rsis", "pages", "atlas_bytes", "standalone_bytes", "gpu_bytes"):
+        before = old["totals"][key]
+        after = new["totals"][key]
+        value = format_bytes if key.endswith("bytes") else str
+        print(f"  {key}: {value(before)} -> {value(after)} ({format_delta(after - before, key.endswith('bytes'))})")
+    print(f"  fill_ratio: {old['totals']['fill_ratio']:.1%} -> {new['totals']['fill_ratio']:.1%}")
+
+    changed = []
+    for name in sorted(set(old["directories"]) | set(new["directories"])):
+        before = old["directories"].get(name, {}).get("sheet_bytes", 0)
+        after = new["directories"].get(name, {}).get("sheet_bytes", 0)
+        if before != after:
+            changed.append((after - before, name))
+
+    if changed:
+        print("  Changed directories:")
+        for delta, name in sorted(changed, key=lambda c: -abs(c[0])):
+            print(f"    {format_delta(delta, True):>14}  {name}")
+
+
+def format_bytes(count: int) -> str:
+    return f"{count / (1024 * 1024):.2f} MiB"
+
+
+def format_delta(delta: int, is_bytes: bool) -> str:
+    sign = "+" if delta >= 0 else "-"
+    if is_bytes:
+        return sign + format_bytes(abs(delta))
+
+    return f"{sign}{abs(delta)}"
+
+
+if __name__ == "__main__":
+    exit(main())
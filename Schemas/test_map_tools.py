@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Regression tests for the map file tools. Run from this directory:
+#
+#   python -m unittest test_map_tools
+
+import io
+import os
+import tempfile
+import unittest
+from diff_maps import MapSource, diff_maps
+from mapfile_binary import MapCache, MapCacheError, cache_path_for, convert, is_up_to_date, open_map
+from mapfile_stream import EntityRecord, Tagged, iter_map
+
+MAP_TEMPLATE = """meta:
+  format: 7
+entities:
+- proto: Locker
+  entities:
+  - uid: 1
+    components:
+    - type: Transform
+    - type: ContainerContainer
+      containers:
+        storage: !type:{container}
+          ents: []
+"""
+
+
+def write_map(directory: str, name: str, container: str) -> str:
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(MAP_TEMPLATE.format(container=container))
+    return path
+
+
+def entities(text: str, keep_tags: bool):
+    return [r.value for r in iter_map(io.StringIO(text), keep_tags=keep_tags) if isinstance(r, EntityRecord)]
+
+
+class MapStreamTagTests(unittest.TestCase):
+    def test_tags_dropped_by_default(self):
+        [entity] = entities(MAP_TEMPLATE.format(container="ContainerSlot"), keep_tags=False)
+        self.assertEqual(entity["components"][1]["containers"]["storage"], {"ents": []})
+
+    def test_keep_tags(self):
+        [entity] = entities(MAP_TEMPLATE.format(container="ContainerSlot"), keep_tags=True)
+        self.assertEqual(entity["components"][1]["containers"]["storage"], Tagged("!type:ContainerSlot", {"ents": []}))
+
+    def test_tagged_scalar(self):
+        [entity] = entities("entities:\n- proto: A\n  entities:\n  - uid: !type:Foo 1\n", keep_tags=True)
+        self.assertEqual(entity["uid"], Tagged("!type:Foo", 1))
+
+
+class DiffMapsTests(unittest.TestCase):
+    def test_tag_only_change(self):
+        with tempfile.TemporaryDirectory() as directory:
+            old = write_map(directory, "old.yml", "ContainerSlot")
+            new = write_map(directory, "new.yml", "Container")
+            header_changes, changes = diff_maps(MapSource(old), MapSource(new))
+
+        self.assertEqual(header_changes, [])
+        self.assertEqual([(c.uid, c.kind) for c in changes], [(1, "modified")])
+        [line] = changes[0].details()
+        self.assertIn("ContainerContainer.containers", line)
+        self.assertIn("!type:ContainerSlot", line)
+        self.assertIn("!type:Container ", line)
+
+    def test_identical(self):
+        with tempfile.TemporaryDirectory() as directory:
+            old = write_map(directory, "old.yml", "ContainerSlot")
+            new = write_map(directory, "new.yml", "ContainerSlot")
+            self.assertEqual(diff_maps(MapSource(old), MapSource(new)), ([], []))
+
+
+class MapCacheTests(unittest.TestCase):
+    def test_keeps_tags(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = write_map(directory, "map.yml", "ContainerSlot")
+            with open_map(path, directory) as cache:
+                containers = cache.entity(0)["components"][1]["containers"]
+
+        self.assertEqual(containers, {"storage": Tagged("!type:ContainerSlot", {"ents": []})})
+
+    def test_same_name_in_different_directories(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, "a"))
+            os.mkdir(os.path.join(directory, "b"))
+            a = write_map(os.path.join(directory, "a"), "map.yml", "ContainerSlot")
+            b = write_map(os.path.join(directory, "b"), "map.yml", "Container")
+            self.assertNotEqual(cache_path_for(a, directory), cache_path_for(b, directory))
+
+    def test_truncated_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = write_map(directory, "map.yml", "ContainerSlot")
+            cache_path = cache_path_for(path, directory)
+            convert(path, cache_path)
+            with open(cache_path, "rb") as f:
+                data = f.read()
+
+            for length in (0, 10, 100, len(data) // 2):
+                with open(cache_path, "wb") as f:
+                    f.write(data[:length])
+                with self.assertRaises(MapCacheError):
+                    MapCache(cache_path)
+                self.assertFalse(is_up_to_date(cache_path, path))
+
+            # Rebuilt instead of crashing.
+            with open_map(path, directory) as cache:
+                self.assertEqual(cache.entity_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
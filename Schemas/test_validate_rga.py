@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Regression tests for validate_rga.py. Run from this directory:
+#
+#   python -m unittest test_validate_rga
+
+import os
+import tempfile
+import unittest
+from validate_rga import DEFAULT_FILE_NAME, cross_check, directory_files, index_tree, parse_attributions
+
+ATTRIBUTIONS = """- files: ["a.ogg"]
+  license: "CC0-1.0"
+  copyright: "me"
+  source: "https://example.com/a"
+"""
+
+
+class IndexTreeTests(unittest.TestCase):
+    def check_tree(self, argument: str):
+        listing, attribution_files = index_tree([argument], DEFAULT_FILE_NAME)
+        self.assertEqual(len(attribution_files), 1)
+
+        result = parse_attributions(attribution_files[0])
+        self.assertEqual(result.errors, [])
+        present = directory_files(listing, result.path)
+        self.assertEqual(cross_check(result, present, DEFAULT_FILE_NAME), [])
+
+    def test_directory_spellings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            audio = os.path.join(directory, "Audio")
+            os.mkdir(audio)
+            open(os.path.join(audio, "a.ogg"), "wb").close()
+            with open(os.path.join(audio, DEFAULT_FILE_NAME), "w", encoding="utf-8") as f:
+                f.write(ATTRIBUTIONS)
+
+            for argument in (audio, audio + os.sep, directory + os.sep, os.path.join(directory, ".", "Audio", "")):
+                with self.subTest(argument=argument):
+                    self.check_tree(argument)
+
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                for argument in (".", "." + os.sep, "Audio" + os.sep):
+                    with self.subTest(argument=argument):
+                        self.check_tree(argument)
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    unittest.main()
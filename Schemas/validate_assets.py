@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+# Runs every asset validator (RSIs, map files, attribution files) over a tree in one go.
+#
+# The tree is walked once, and each RSI, map and attribution file is handed to the matching validator
+# in a shared pool of worker processes as soon as it's found.
+# Findings are streamed out while the run is still going: as plain text, JSON lines, or SARIF for code scanning.
+#
+# Maps are recognized by path (see --map-glob), attribution files by name (see --attribution-name).
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import validate_rga
+import validate_rsis
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, IO, List, Set, Tuple
+from validate_mapfile import MapValidator
+
+DEFAULT_MAP_GLOB = "*/Maps/*.yml"
+
+# Validator name -> description, also the SARIF rules.
+VALIDATORS = {
+    "rsi": "RSI meta.json and state images (rsi.json)",
+    "map": "Map file structure (mapfile.yml)",
+    "attribution": "Attribution files (rga.yml)",
+}
+
+# How many tasks to keep in flight while still walking, so findings start coming out right away
+# without queueing the entire tree up front.
+MAX_PENDING_PER_WORKER = 8
+
+
+class Finding:
+    def __init__(self, validator: str, path: str, message: str):
+        self.validator = validator
+        self.path = path
+        self.message = message
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("validate_assets.py", description="Validates RSIs, map files and attribution files in a single pass.")
+    parser.add_argument("directories", nargs="+", help="Directories to validate")
+    parser.add_argument("--format", choices=["text", "jsonl", "sarif"], default="text", help="Output format (default text)")
+    parser.add_argument("-o", "--output", help="Write findings to this file instead of stdout")
+    parser.add_argument("--fail-fast", action="store_true", help="Stop at the first finding")
+    parser.add_argument("--only", action="append", choices=list(VALIDATORS), help="Only run these validators (can be repeated)")
+    parser.add_argument("--map-glob", default=DEFAULT_MAP_GLOB, help=f"Pattern for paths of map files (default {DEFAULT_MAP_GLOB})")
+    parser.add_argument("--attribution-name", default=validate_rga.DEFAULT_FILE_NAME, help=f"File name of attribution files (default {validate_rga.DEFAULT_FILE_NAME})")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    enabled = set(args.only or VALIDATORS)
+    output = open(args.output, "w", encoding="utf-8", newline="\n") if args.output is not None else sys.stdout
+    writer = create_writer(args.format, output)
+
+    files_checked = 0
+    findings = 0
+
+    executor = ProcessPoolExecutor(args.jobs, initializer=init_worker)
+    max_pending = MAX_PENDING_PER_WORKER * (args.jobs or os.cpu_count() or 1)
+    pending: Set[Future] = set()
+
+    def collect(block: bool) -> bool:
+        """
+        Writes out findings of finished tasks. Returns False if the run should stop.
+        """
+
+        nonlocal files_checked, findings
+        done, not_done = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        pending.intersection_update(not_done)
+        for future in done:
+            files_checked += 1
+            for finding in future.result():
+                findings += 1
+                writer.write(finding)
+                if args.fail_fast:
+                    return False
+        return True
+
+    stopped = False
+    try:
+        for validator, path, extra in walk(args.directories, enabled, args.map_glob, args.attribution_name):
+            pending.add(executor.submit(run_validator, validator, path, extra))
+            if len(pending) >= max_pending and not collect(True):
+                stopped = True
+                break
+            if not collect(False):
+                stopped = True
+                break
+
+        while pending and not stopped:
+            if not collect(True):
+                stopped = True
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"{'Stopped after' if stopped else 'Checked'} {files_checked} assets, {findings} finding(s)", file=sys.stderr)
+    return 1 if findings else 0
+
+
+def walk(directories: List[str], enabled: Set[str], map_glob: str, attribution_name: str):
+    """
+    Yields (validator, path, extra argument) for everything to validate, in a single walk.
+    """
+
+    for dir in directories:
+        for root, dirs, files in os.walk(dir):
+            dirs.sort()
+            if root.endswith(".rsi"):
+                # RSIs never contain subdirectories worth looking at.
+                dirs.clear()
+                if "rsi" in enabled:
+                    yield "rsi", root, None
+                continue
+
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                if file == attribution_name:
+                    if "attribution" in enabled:
+                        yield "attribution", path, (files, attribution_name)
+                elif file.endswith(".yml") and fnmatch.fnmatch(path.replace(os.sep, "/"), map_glob):
+                    if "map" in enabled:
+                        yield "map", path, None
+
+
+def init_worker():
+    global worker_rsi_schema
+    worker_rsi_schema = validate_rsis.load_schema()
+
+
+def run_validator(validator: str, path: str, extra: Any) -> List[Finding]:
+    try:
+        return [Finding(validator, path, message) for message in VALIDATOR_FUNCTIONS[validator](path, extra)]
+    except Exception as e:
+        return [Finding(validator, path, f"Failed to validate (script bug): {e}")]
+
+
+def check_rsi(path: str, _: Any) -> List[str]:
+    messages = [e.message for e in validate_rsis.check_rsi_cached(path, worker_rsi_schema, None)]
+    # Don't let the error list grow for the lifetime of the worker.
+    validate_rsis.errors.clear()
+    return messages
+
+
+def check_map(path: str, _: Any) -> List[str]:
+    with open(path, "rb") as f:
+        return MapValidator().validate(f)
+
+
+def check_attribution(path: str, extra: Tuple[List[str], str]) -> List[str]:
+    files, name = extra
+    return validate_rga.attribution_errors(validate_rga.parse_attributions(path), set(files), name)
+
+
+VALIDATOR_FUNCTIONS = {
+    "rsi": check_rsi,
+    "map": check_map,
+    "attribution": check_attribution,
+}
+
+
+class Writer(ABC):
+    def __init__(self, output: IO[str]):
+        self.output = output
+
+    @abstractmethod
+    def write(self, finding: Finding):
+        pass
+
+    def close(self):
+        pass
+
+
+class TextWriter(Writer):
+    def write(self, finding: Finding):
+        self.output.write(f"{finding.path}: {finding.message}\n")
+        self.output.flush()
+
+
+class JsonLinesWriter(Writer):
+    def write(self, finding: Finding):
+        self.output.write(json.dumps({"validator": finding.validator, "path": finding.path, "message": finding.message}) + "\n")
+        self.output.flush()
+
+
+class SarifWriter(Writer):
+    """
+    Writes the SARIF document piece by piece, results are flushed as they come in.
+    The document is only complete (valid JSON) once closed.
+    """
+
+    def __init__(self, output: IO[str]):
+        super().__init__(output)
+        self.first = True
+        run = {
+            "tool": {
+                "driver": {
+                    "name": "validate_assets",
+                    "rules": [{"id": id, "shortDescription": {"text": text}} for id, text in VALIDATORS.items()],
+                },
+            },
+        }
+        header = json.dumps({"version": "2.1.0", "$schema": "https://json.schemastore.org/sarif-2.1.0.json", "runs": [run]})
+        # Splice the results array into the end of the run.
+        self.output.write(header[:-3] + ', "results": [\n')
+
+    def write(self, finding: Finding):
+        result: Dict[str, Any] = {
+            "ruleId": finding.validator,
+            "level": "error",
+            "message": {"text": finding.message},
+            "locations": [{"physicalLocation": {"artifactLocation": {"uri": finding.path.replace(os.sep, "/")}}}],
+        }
+        self.output.write(("" if self.first else ",\n") + json.dumps(result))
+        self.output.flush()
+        self.first = False
+
+    def close(self):
+        self.output.write("\n]}]}\n")
+        self.output.flush()
+
+
+def create_writer(format: str, output: IO[str]) -> Writer:
+    if format == "jsonl":
+        return JsonLinesWriter(output)
+    if format == "sarif":
+        return SarifWriter(output)
+    return TextWriter(output)
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+# Streaming validator for map files, checking the same rules as the mapfile.yml Yamale schema
+# without ever loading a whole map into memory. See mapfile_stream.py.
+#
+# Like Yamale's default strict mode, keys not present in the schema are errors.
+
+import argparse
+import os
+import yaml
+from glob import iglob
+from mapfile_stream import EntityRecord, HeaderValue, MapStreamError, ProtoRecord, is_component, iter_map
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+FILE_CATEGORIES = ["Unknown", "Entity", "Grid", "Map", "Save"]
+
+# Value checks, mirroring Yamale's validators: a check returns an error message or None.
+Check = Callable[[Any], Optional[str]]
+
+
+def is_int(value: Any) -> Optional[str]:
+    # Yamale's int() doesn't accept bools.
+    return None if isinstance(value, int) and not isinstance(value, bool) else f"'{value}' is not a int."
+
+
+def is_str(value: Any) -> Optional[str]:
+    return None if isinstance(value, str) else f"'{value}' is not a str."
+
+
+def is_bool(value: Any) -> Optional[str]:
+    return None if isinstance(value, bool) else f"'{value}' is not a bool."
+
+
+def is_category(value: Any) -> Optional[str]:
+    return None if value in FILE_CATEGORIES else f"'{value}' not in {tuple(FILE_CATEGORIES)}"
+
+
+def is_comp(value: Any) -> Optional[str]:
+    return None if is_component(value) else f"'{value}' is not a comp."
+
+
+# (check, required)
+META_SCHEMA: Dict[str, Tuple[Check, bool]] = {
+    "format": (is_int, True),
+    "postmapinit": (is_bool, False),
+    "time": (is_str, False),
+    "category": (is_category, False),
+    "engineVersion": (is_str, False),
+    "entityCount": (is_int, False),
+    "forkId": (is_str, False),
+    "forkVersion": (is_str, False),
+}
+
+INT_LIST_KEYS = {"orphans", "nullspace", "maps", "grids"}
+TOP_LEVEL_KEYS = {"meta", "tilemap", "entities"} | INT_LIST_KEYS
+PROTO_KEYS = {"proto", "entities"}
+
+ENTITY_SCHEMA: Dict[str, Tuple[Check, bool]] = {
+    "uid": (is_int, True),
+    "paused": (is_bool, False),
+    "mapInit": (is_bool, False),
+}
+ENTITY_KEYS = set(ENTITY_SCHEMA) | {"components", "missingComponents"}
+
+
+class MapValidator:
+    def __init__(self, strict: bool = True):
+        self.strict = strict
+        self.errors: List[str] = []
+
+    def error(self, path: str, message: str, line: Optional[int] = None):
+        location = f" (line {line})" if line else ""
+        self.errors.append(f"{path}: {message}{location}")
+
+    def validate(self, stream) -> List[str]:
+        seen_keys: Set[Any] = set()
+        try:
+            for record in iter_map(stream):
+                if isinstance(record, HeaderValue):
+                    seen_keys.add(record.key)
+                    self.check_header(record)
+                elif isinstance(record, EntityRecord):
+                    self.check_entity(record)
+                elif isinstance(record, ProtoRecord):
+                    seen_keys.add("entities")
+                    self.check_proto(record)
+        except (MapStreamError, yaml.YAMLError) as e:
+            self.errors.append(f"failed to parse: {e}")
+            return self.errors
+
+        for key in ("meta", "tilemap", "entities"):
+            if key not in seen_keys:
+                self.error(key, "Required field missing")
+
+        return self.errors
+
+    def check_header(self, record: HeaderValue):
+        key = record.key
+        value = record.value
+        if key not in TOP_LEVEL_KEYS:
+            if self.strict:
+                self.error(str(key), "Unexpected element", record.line)
+            return
+
+        if value is None:
+            if key in ("meta", "tilemap", "entities"):
+                self.error(key, "Required field missing", record.line)
+            return
+
+        if key == "meta":
+            self.check_mapping(key, value, META_SCHEMA, set(META_SCHEMA), record.line)
+        elif key == "tilemap":
+            if not isinstance(value, dict):
+                self.error(key, f"'{value}' is not a map", record.line)
+                return
+            for tile_id, tile_name in value.items():
+                message = is_int(tile_id) or is_str(tile_name)
+                if message:
+                    self.error(f"{key}.{tile_id}", message, record.line)
+        elif key in INT_LIST_KEYS:
+            self.check_list(key, value, is_int, record.line)
+        elif key == "entities":
+            # Only ends up here if it isn't a list, otherwise it gets streamed.
+            self.error(key, f"'{value}' is not a list.", record.line)
+
+    def check_proto(self, record: ProtoRecord):
+        path = f"entities.{record.proto_index}"
+        fields = record.fields
+        if not isinstance(fields, dict):
+            self.error(path, f"'{fields}' is not a map", record.line)
+            return
+
+        proto = fields.get("proto")
+        if proto is None:
+            self.error(f"{path}.proto", "Required field missing", record.line)
+        else:
+            message = is_str(proto)
+            if message:
+                self.error(f"{path}.proto", message, record.line)
+
+        if record.entity_count is None:
+            entities = fields.get("entities")
+            if entities is None:
+                self.error(f"{path}.entities", "Required field missing", record.line)
+            else:
+                self.error(f"{path}.entities", f"'{entities}' is not a list.", record.line)
+        elif record.entity_count < 1:
+            self.error(f"{path}.entities", "Length of [] is less than 1", record.line)
+
+        if self.strict:
+            for key in fields:
+                if key not in PROTO_KEYS:
+                    self.error(f"{path}.{key}", "Unexpected element", record.line)
+
+    def check_entity(self, record: EntityRecord):
+        path = f"entities.{record.proto_index}.entities.{record.entity_index}"
+        entity = record.value
+        if not isinstance(entity, dict):
+            self.error(path, f"'{entity}' is not a map", record.line)
+            return
+
+        uid = entity.get("uid")
+        if uid is not None and not is_int(uid):
+            path += f" (uid {uid})"
+
+        self.check_mapping(path, entity, ENTITY_SCHEMA, ENTITY_KEYS, record.line)
+
+        components = entity.get("components")
+        if components is None:
+            self.error(f"{path}.components", "Required field missing", record.line)
+        else:
+            self.check_list(f"{path}.components", components, is_comp, record.line)
+
+        missing = entity.get("missingComponents")
+        if missing is not None:
+            self.check_list(f"{path}.missingComponents", missing, is_str, record.line)
+
+    def check_mapping(self, path: str, value: Any, schema: Dict[str, Tuple[Check, bool]], allowed: Set[str], line: int):
+        if not isinstance(value, dict):
+            self.error(path, f"'{value}' is not a map", line)
+            return
+
+        for key, (check, required) in schema.items():
+            item = value.get(key)
+            if item is None:
+                if required:
+                    self.error(f"{path}.{key}", "Required field missing", line)
+                continue
+
+            message = check(item)
+            if message:
+                self.error(f"{path}.{key}", message, line)
+
+        if self.strict:
+            for key in value:
+                if key not in allowed:
+                    self.error(f"{path}.{key}", "Unexpected element", line)
+
+    def check_list(self, path: str, value: Any, check: Check, line: int):
+        if not isinstance(value, list):
+            self.error(path, f"'{value}' is not a list.", line)
+            return
+
+        for i, item in enumerate(value):
+            message = check(item)
+            if message:
+                self.error(f"{path}.{i}", message, line)
+
+
+def find_map_files(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in iglob("**/*.yml", root_dir=path, recursive=True)))
+        else:
+            files.append(path)
+
+    return files
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("validate_mapfile.py", description="Validates map files against mapfile.yml without loading them into memory.")
+    parser.add_argument("paths", nargs="+", help="Map files, or directories to look for .yml map files in")
+    parser.add_argument("--no-strict", action="store_true", help="Allow keys that aren't in the schema")
+    parser.add_argument("--max-errors", type=int, default=50, help="Maximum errors to print per file (default 50)")
+
+    args = parser.parse_args()
+
+    failed = 0
+    for path in find_map_files(args.paths):
+        validator = MapValidator(strict=not args.no_strict)
+        with open(path, "rb") as f:
+            errors = validator.validate(f)
+
+        if not errors:
+            continue
+
+        failed += 1
+        for error in errors[:args.max_errors]:
+            print(f"{path}: {error}")
+        if len(errors) > args.max_errors:
+            print(f"{path}: ... and {len(errors) - args.max_errors} more errors")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
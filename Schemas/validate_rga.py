@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+# Batch validation of attribution (RGA) files against the rules of rga.yml, for a whole asset tree at once.
+#
+# The tree is walked a single time, which both finds the attribution files and builds a directory listing index.
+# Files are parsed in parallel, source URLs and licenses are only checked once per distinct value
+# (the same few sources show up thousands of times), using the validators from rga_validators.py.
+# Every attribution file is also cross-checked against the directory it's in:
+# files listed that don't exist are stale, files that exist but aren't listed are unattributed.
+
+import argparse
+import os
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+
+DEFAULT_FILE_NAME = "attributions.yml"
+
+ATTRIBUTION_KEYS = {"files", "license", "copyright", "source"}
+
+
+class ParsedAttributions:
+    """
+    Result of parsing a single attribution file in a worker process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.errors: List[str] = []
+        # Every entry of every files list.
+        self.files: List[str] = []
+        # (yaml path, value) of every license and source, checked afterwards in the main process.
+        self.licenses: List[Tuple[str, Any]] = []
+        self.sources: List[Tuple[str, Any]] = []
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("validate_rga.py", description="Validates all attribution files in the given directories.")
+    parser.add_argument("directories", nargs="+", help="Directories to look for attribution files in")
+    parser.add_argument("--name", default=DEFAULT_FILE_NAME, help=f"File name of attribution files (default {DEFAULT_FILE_NAME})")
+    parser.add_argument("--no-cross-check", action="store_true", help="Don't check attributed files against the directory contents")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    listing, attribution_files = index_tree(args.directories, args.name)
+
+    with ProcessPoolExecutor(args.jobs) as executor:
+        parsed = list(executor.map(parse_attributions, attribution_files, chunksize=16))
+
+    failed = 0
+    for result in parsed:
+        present = None if args.no_cross_check else directory_files(listing, result.path)
+        errors = attribution_errors(result, present, args.name)
+        for error in errors:
+            print(f"{result.path}: {error}")
+        if errors:
+            failed += 1
+
+    print(f"Checked {len(parsed)} attribution files, {failed} with errors "
+          f"({url_valid.cache_info().currsize} distinct sources)")
+    return 1 if failed else 0
+
+
+def index_tree(directories: List[str], name: str) -> Tuple[Dict[str, Set[str]], List[str]]:
+    """
+    Returns the files in every directory (keyed by normalized path, see directory_files()),
+    and the paths of all attribution files.
+    """
+
+    listing: Dict[str, Set[str]] = {}
+    attribution_files: List[str] = []
+    for dir in directories:
+        # os.walk() roots start with the directory as given, "Audio/" and "Audio" have to end up the same.
+        for root, dirs, files in os.walk(os.path.normpath(dir)):
+            dirs.sort()
+            listing[os.path.normpath(root)] = set(files)
+            if name in files:
+                attribution_files.append(os.path.join(root, name))
+
+    return listing, attribution_files
+
+
+def directory_files(listing: Dict[str, Set[str]], path: str) -> Set[str]:
+    """
+    The files next to path, from the listing built by index_tree().
+    """
+
+    return listing[os.path.normpath(os.path.dirname(path))]
+
+
+def parse_attributions(path: str) -> ParsedAttributions:
+    result = ParsedAttributions(path)
+    try:
+        with open(path, "rb") as f:
+            data = yaml.load(f, Loader=Loader)
+    except (OSError, yaml.YAMLError) as e:
+        result.errors.append(f"failed to parse: {e}")
+        return result
+
+    # list(include('attribution'), min=1)
+    if not isinstance(data, list):
+        result.errors.append(f"'{data}' is not a list.")
+        return result
+    if not data:
+        result.errors.append("Length of [] is less than 1")
+        return result
+
+    for i, attribution in enumerate(data):
+        if not isinstance(attribution, dict):
+            result.errors.append(f"{i}: '{attribution}' is not a map")
+            continue
+
+        for key in sorted(attribution.keys() - ATTRIBUTION_KEYS, key=str):
+            result.errors.append(f"{i}.{key}: Unexpected element")
+
+        for key in sorted(ATTRIBUTION_KEYS):
+            if attribution.get(key) is None:
+                result.errors.append(f"{i}.{key}: Required field missing")
+
+        files = attribution.get("files")
+        if files is not None:
+            if not isinstance(files, list):
+                result.errors.append(f"{i}.files: '{files}' is not a list.")
+            else:
+                for j, file in enumerate(files):
+                    if isinstance(file, str):
+                        result.files.append(file)
+                    else:
+                        result.errors.append(f"{i}.files.{j}: '{file}' is not a str.")
+
+        copyright = attribution.get("copyright")
+        if copyright is not None and not isinstance(copyright, str):
+            result.errors.append(f"{i}.copyright: '{copyright}' is not a str.")
+
+        if attribution.get("license") is not None:
+            result.licenses.append((f"{i}.license", attribution["license"]))
+        if attribution.get("source") is not None:
+            result.sources.append((f"{i}.source", attribution["source"]))
+
+    return result
+
+
+def attribution_errors(result: ParsedAttributions, present: Optional[Set[str]], name: str) -> List[str]:
+    """
+    All errors of a parsed attribution file. present is the listing of its directory, None to skip the cross-check.
+    """
+
+    errors = list(result.errors)
+    for path, value in result.licenses:
+        if not isinstance(value, str) or not license_valid(value):
+            errors.append(f"{path}: '{value}' is not a license.")
+    for path, value in result.sources:
+        if not isinstance(value, str) or not url_valid(value):
+            errors.append(f"{path}: '{value}' is not a url.")
+
+    if present is not None:
+        errors.extend(cross_check(result, present, name))
+
+    return errors
+
+
+# Neither validator accepts anything but strings, which keeps these hashable.
+@lru_cache(maxsize=None)
+def license_valid(value: str) -> bool:
+    return bool(rga_validator("license")._is_valid(value))
+
+
+@lru_cache(maxsize=None)
+def url_valid(value: str) -> bool:
+    return bool(rga_validator("url")._is_valid(value))
+
+
+@lru_cache(maxsize=None)
+def rga_validator(name: str):
+    # yamale and validators take a while to import, only pay for that when there's something to check.
+    from rga_validators import License, Url
+
+    return {"license": License, "url": Url}[name]()
+
+
+def cross_check(result: ParsedAttributions, present: Set[str], name: str) -> List[str]:
+    errors = []
+    attributed: Set[str] = set()
+    for file in result.files:
+        if file in attributed:
+            errors.append(f"'{file}' is attributed more than once")
+        attributed.add(file)
+        if file not in present:
+            errors.append(f"'{file}' is attributed but does not exist")
+
+    for file in sorted(present - attributed):
+        if file != name and not file.startswith("."):
+            errors.append(f"'{file}' is not attributed")
+
+    return errors
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,12 +1,23 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
 import json
 import os
-from PIL import Image
+import subprocess
+import sys
+import time
+from fast_schema import UnsupportedSchema, compile_schema
 from glob import iglob
-from jsonschema import Draft7Validator, ValidationError
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
+
+# The profiling helpers are shared with the scripts in Tools/.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Tools"))
+from profiling import add_profiling_arguments, phase, run_profiled
+
+# PIL and jsonschema are slow to import, they're only imported where they're used.
+if TYPE_CHECKING:
+    from jsonschema import Draft7Validator, ValidationError
 
 ALLOWED_RSI_DIR_GARBAGE = {
     "meta.json",
@@ -15,34 +26,194 @@ ALLOWED_RSI_DIR_GARBAGE = {
     ".directory"
 }
 
+# Bump this if a change to the checks below should invalidate existing result caches.
+CACHE_VERSION = 1
+
 errors: List["RsiError"] = []
+warnings: List["RsiError"] = []
+
+# Compiled fast-path checks for loaded schemas, see schema_fast_check().
+# The schema itself is kept alongside so its id() can't get reused.
+fast_checks: Dict[int, Tuple["Draft7Validator", Callable[[Any], bool]]] = {}
 
 def main() -> int:
     parser = argparse.ArgumentParser("validate_rsis.py", description="Validates RSI file integrity for mistakes the engine does not catch while loading.")
     parser.add_argument("directories", nargs="+", help="Directories to look for RSIs in")
+    parser.add_argument("--cache", metavar="PATH", help="File to persist per-RSI results in. RSIs whose contents match a cached clean result are skipped.")
+    parser.add_argument("--changed-since", metavar="REF", help="Only validate RSIs with files changed since the given git ref (including uncommitted and untracked changes).")
+    parser.add_argument("--lint-frames", action="store_true", help="Also decode sprite sheets and warn about fully transparent, duplicate and unused frames. Requires numpy.")
+    parser.add_argument("--watch", action="store_true", help="After the initial run, keep watching the directories and revalidate RSIs as they change.")
+    add_profiling_arguments(parser)
 
     args = parser.parse_args()
-    schema = load_schema()
+    return run_profiled("validate_rsis", args, lambda: validate(args))
+
+
+def validate(args: argparse.Namespace) -> int:
+    with phase("load schema"):
+        schema = load_schema()
+
+    cache: Optional[RsiCache] = None
+    if args.cache:
+        cache = RsiCache.load(args.cache, schema_hash())
+
+    changed: Optional[Set[str]] = None
+    if args.changed_since:
+        with phase("git diff"):
+            changed = git_changed_rsis(args.changed_since)
+
+    lint = FrameLintTotals() if args.lint_frames else None
 
     for dir in args.directories:
-        check_dir(dir, schema)
+        check_dir(dir, schema, cache, changed, lint)
+
+    if cache is not None:
+        cache.save()
+
+    for warning in warnings:
+        print(f"{warning.path}: warning: {warning.message}")
 
     for error in errors:
         print(f"{error.path}: {error.message}")
 
+    if lint is not None:
+        lint.print_summary()
+
+    if args.watch:
+        watch(args.directories, schema, cache, lint is not None)
+
     return 1 if errors else 0
 
 
-def check_dir(dir: str, schema: Draft7Validator):
+def check_dir(dir: str, schema: "Draft7Validator", cache: Optional["RsiCache"] = None, changed: Optional[Set[str]] = None, lint: Optional["FrameLintTotals"] = None):
+    for rsi_path in find_rsis(dir):
+        if changed is not None and os.path.realpath(rsi_path) not in changed:
+            continue
+
+        rsi_errors = check_rsi_cached(rsi_path, schema, cache)
+
+        # Linting relies on the metadata and sheet sizes being sane, so only bother with valid RSIs.
+        if lint is not None and not rsi_errors:
+            try:
+                with phase("frame lint"):
+                    lint_rsi_frames(rsi_path, lint)
+            except Exception as e:
+                add_error(rsi_path, f"Failed to lint RSI frames (script bug): {e}")
+
+
+def watch(directories: List[str], schema: "Draft7Validator", cache: Optional["RsiCache"], lint: bool):
+    from fs_watch import create_watcher
+
+    # RSI path -> error messages, for everything we know about.
+    # Kept up to date so the error count after each change covers the whole tree.
+    results: Dict[str, List[str]] = {}
+    for error in errors:
+        results.setdefault(os.path.normpath(error.path), []).append(error.message)
+
+    watcher = create_watcher(directories)
+    print(f"Watching {', '.join(directories)} for changes...")
+
+    try:
+        while True:
+            changed = watcher.wait()
+            start = time.perf_counter()
+
+            if changed:
+                rsis = {rsi for rsi in map(containing_rsi, changed) if rsi is not None}
+            else:
+                # Missed events, rescan everything.
+                print("Lost track of changes, revalidating everything")
+                rsis = {os.path.normpath(rsi) for dir in directories for rsi in find_rsis(dir)}
+                results.clear()
+
+            for rsi in sorted(rsis):
+                if not os.path.isdir(rsi):
+                    results.pop(rsi, None)
+                    print(f"{rsi}: removed")
+                    continue
+
+                errors.clear()
+                warnings.clear()
+                rsi_start = time.perf_counter()
+                check_rsi_cached(rsi, schema, cache)
+                if lint and not errors:
+                    try:
+                        lint_rsi_frames(rsi, FrameLintTotals())
+                    except Exception as e:
+                        add_error(rsi, f"Failed to lint RSI frames (script bug): {e}")
+
+                elapsed = (time.perf_counter() - rsi_start) * 1000
+                results[rsi] = [e.message for e in errors]
+
+                for warning in warnings:
+                    print(f"{rsi}: warning: {warning.message}")
+                for error in errors:
+                    print(f"{rsi}: {error.message}")
+                if not errors:
+                    print(f"{rsi}: OK ({elapsed:.1f} ms)")
+
+            if not rsis:
+                continue
+
+            if cache is not None:
+                cache.save()
+
+            bad = sum(1 for messages in results.values() if messages)
+            total = (time.perf_counter() - start) * 1000
+            print(f"Revalidated {len(rsis)} RSI(s) in {total:.1f} ms, {bad} RSI(s) with errors in total")
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def containing_rsi(path: str) -> Optional[str]:
+    # Changes to files inside an RSI (or the RSI directory itself) map to the RSI.
+    path = os.path.normpath(path)
+    while path and not path.endswith(".rsi"):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+    return path or None
+
+
+def find_rsis(dir: str) -> Iterator[str]:
     for rsi_rel in iglob("**/*.rsi", root_dir=dir, recursive=True):
-        rsi_path = os.path.join(dir, rsi_rel)
+        yield os.path.join(dir, rsi_rel)
+
+
+def check_rsi_cached(rsi: str, schema: "Draft7Validator", cache: Optional["RsiCache"]) -> List["RsiError"]:
+    key = None
+    if cache is not None:
         try:
-            check_rsi(rsi_path, schema)
-        except Exception as e:
-            add_error(rsi_path, f"Failed to validate RSI (script bug): {e}")
+            with phase("cache key"):
+                key = rsi_content_key(rsi, cache.schema_hash)
+        except OSError:
+            # Let the normal checks below report whatever is wrong with the directory.
+            key = None
+
+        if key is not None and cache.is_clean(rsi, key):
+            return []
+
+    first_error = len(errors)
+    try:
+        check_rsi(rsi, schema)
+    except Exception as e:
+        add_error(rsi, f"Failed to validate RSI (script bug): {e}")
 
+    rsi_errors = errors[first_error:]
+    if cache is not None and key is not None:
+        cache.store(rsi, key, not rsi_errors)
+
+    return rsi_errors
+
+
+def check_rsi(rsi: str, schema: "Draft7Validator"):
+    from PIL import Image
 
-def check_rsi(rsi: str, schema: Draft7Validator):
     meta_path = os.path.join(rsi, "meta.json")
 
     # Try to load meta.json
@@ -53,7 +224,12 @@ def check_rsi(rsi: str, schema: Draft7Validator):
         return
 
     # Check if meta.json passes schema.
-    schema_errors: List[ValidationError] = list(schema.iter_errors(meta_json))
+    # The compiled check is much cheaper, only go through the full validator if it fails to get proper messages.
+    schema_errors: List["ValidationError"] = []
+    with phase("schema validate"):
+        if not schema_fast_check(schema)(meta_json):
+            schema_errors = list(schema.iter_errors(meta_json))
+
     if schema_errors:
         for error in schema_errors:
             add_error(rsi, f"meta.json: [{error.json_path}] {error.message}")
@@ -111,13 +287,14 @@ def check_rsi(rsi: str, schema: Draft7Validator):
 
         png_name = os.path.join(rsi, f"{state_name}.png")
         try:
-            image = Image.open(png_name)
+            # Only reads the header, the image data is never decoded.
+            with phase("PNG open"), Image.open(png_name) as image:
+                size = image.size
         except Exception as e:
             add_error(rsi, f"{state_name}: failed to open state {state_name}.png")
             continue
 
         # Check that size is a multiple of the metadata frame size.
-        size = image.size
         if size[0] % frame_width != 0 or size[1] % frame_height != 0:
             add_error(rsi, f"{state_name}: sprite sheet of {size[0]}x{size[1]} is not size multiple of RSI size ({frame_width}x{frame_height}).png")
             continue
@@ -126,9 +303,7 @@ def check_rsi(rsi: str, schema: Draft7Validator):
         frames_w = size[0] // frame_width
         frames_h = size[1] // frame_height
 
-        directions: int = state.get("directions", 1)
-        delays: Optional[List[List[float]]] = state.get("delays", [[1]] * directions)
-        frame_count = sum(map(len, delays))
+        frame_count = state_frame_count(state)
         max_sheet_frames = frames_w * frames_h
 
         if frame_count > max_sheet_frames:
@@ -146,14 +321,158 @@ def check_rsi(rsi: str, schema: Draft7Validator):
     return
 
 
-def load_schema() -> Draft7Validator:
+def schema_path() -> str:
     base_path = os.path.dirname(os.path.realpath(__file__))
-    schema_path = os.path.join(base_path, "rsi.json")
-    schema_json = read_json(schema_path)
+    return os.path.join(base_path, "rsi.json")
+
+
+def state_frame_count(state: Any) -> int:
+    directions: int = state.get("directions", 1)
+    delays: List[List[float]] = state.get("delays", [[1]] * directions)
+    return sum(map(len, delays))
+
+
+def lint_rsi_frames(rsi: str, totals: "FrameLintTotals"):
+    """
+    Finds frames that waste space in the texture atlas (fully transparent or exact duplicates of another frame),
+    and cells in the sheets that aren't used by any frame.
+    """
+
+    import numpy as np
+    from PIL import Image
+
+    meta_json = read_json(os.path.join(rsi, "meta.json"))
+    frame_width: int = meta_json["size"]["x"]
+    frame_height: int = meta_json["size"]["y"]
+    frame_bytes = frame_width * frame_height * 4
+
+    # Used frames of every state, flattened to one row of RGBA bytes per frame.
+    state_frames = []
+    # (state name, frame index in that state) for every row in state_frames, concatenated.
+    frame_owners: List[Tuple[str, int]] = []
+
+    for state in meta_json["states"]:
+        state_name: str = state["name"]
+        frame_count = state_frame_count(state)
+
+        with Image.open(os.path.join(rsi, f"{state_name}.png")) as image:
+            sheet = np.asarray(image.convert("RGBA"))
+
+        rows = sheet.shape[0] // frame_height
+        columns = sheet.shape[1] // frame_width
+
+        # (rows * fh, columns * fw, 4) -> (rows * columns, fh * fw * 4), cells in row-major order like the engine reads them.
+        cells = sheet.reshape(rows, frame_height, columns, frame_width, 4).swapaxes(1, 2).reshape(rows * columns, frame_bytes)
+
+        unused_cells = rows * columns - frame_count
+        if unused_cells:
+            add_warning(rsi, f"{state_name}: {unused_cells} unused sheet cell(s) after the last frame")
+            totals.unused_cells += unused_cells
+            totals.unused_bytes += unused_cells * frame_bytes
+
+        frames = cells[:frame_count]
+        transparent = np.flatnonzero(~frames[:, 3::4].any(axis=1))
+        if transparent.size:
+            add_warning(rsi, f"{state_name}: fully transparent frame(s): {', '.join(map(str, transparent))}")
+            totals.transparent_frames += int(transparent.size)
+            totals.wasted_bytes += int(transparent.size) * frame_bytes
+
+        state_frames.append(frames)
+        frame_owners.extend((state_name, i) for i in range(frame_count))
+
+    if not frame_owners:
+        return
+
+    all_frames = np.concatenate(state_frames)
+    # Transparent frames are all reported above already, don't report them again as duplicates of each other.
+    opaque = all_frames[:, 3::4].any(axis=1)
+
+    _, first_index, inverse = np.unique(all_frames, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    for i in np.flatnonzero((first_index[inverse] != np.arange(len(inverse))) & opaque):
+        state_name, frame = frame_owners[i]
+        orig_state, orig_frame = frame_owners[first_index[inverse[i]]]
+        add_warning(rsi, f"{state_name}: frame {frame} is identical to {orig_state} frame {orig_frame}")
+        totals.duplicate_frames += 1
+        totals.wasted_bytes += frame_bytes
+
+
+def load_schema() -> "Draft7Validator":
+    from jsonschema import Draft7Validator
+
+    schema_json = read_json(schema_path())
 
     return Draft7Validator(schema_json)
 
 
+def schema_fast_check(schema: "Draft7Validator") -> Callable[[Any], bool]:
+    cached = fast_checks.get(id(schema))
+    if cached is not None:
+        return cached[1]
+
+    try:
+        check = compile_schema(schema.schema)
+    except UnsupportedSchema:
+        # Schema uses something the compiler doesn't handle, always take the slow path.
+        check = lambda _: False
+
+    fast_checks[id(schema)] = (schema, check)
+    return check
+
+
+def schema_hash() -> str:
+    with open(schema_path(), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def rsi_content_key(rsi: str, schema_hash: str) -> str:
+    # Everything check_rsi looks at: the directory listing, meta.json and every PNG.
+    # Other files only matter by name (they're errors regardless of content).
+    hasher = hashlib.sha256()
+    hasher.update(f"v{CACHE_VERSION}\0{schema_hash}\0".encode("utf-8"))
+
+    for name in sorted(os.listdir(rsi)):
+        hasher.update(name.encode("utf-8") + b"\0")
+        if name != "meta.json" and not name.endswith(".png"):
+            continue
+
+        with open(os.path.join(rsi, name), "rb") as f:
+            hasher.update(hashlib.sha256(f.read()).digest())
+
+    return hasher.hexdigest()
+
+
+def git_changed_rsis(ref: str) -> Set[str]:
+    """
+    Returns the real paths of all RSI directories containing a file that differs from the given git ref,
+    either in the working tree or as a new untracked file.
+    """
+
+    # Both of these report paths relative to the repo root when ran from there.
+    toplevel = git_output(["rev-parse", "--show-toplevel"]).strip()
+    changed_files = git_output(["diff", "--name-only", "--no-renames", "-z", ref, "--"], toplevel).split("\0")
+    changed_files += git_output(["ls-files", "--others", "--exclude-standard", "-z"], toplevel).split("\0")
+
+    rsis: Set[str] = set()
+    for file in changed_files:
+        if not file:
+            continue
+
+        # Walk up to find the containing .rsi directory, if any.
+        parts = file.split("/")
+        for i in range(len(parts) - 1, -1, -1):
+            if parts[i].endswith(".rsi"):
+                rsis.add(os.path.realpath(os.path.join(toplevel, *parts[:i + 1])))
+                break
+
+    return rsis
+
+
+def git_output(args: List[str], cwd: Optional[str] = None) -> str:
+    result = subprocess.run(["git"] + args, check=True, stdout=subprocess.PIPE, cwd=cwd)
+    return result.stdout.decode("utf-8")
+
+
 def read_json(path: str) -> Any:
     with open(path, "r", encoding="utf-8-sig") as f:
         return json.load(f)
@@ -163,10 +482,85 @@ def add_error(rsi: str, message: str):
     errors.append(RsiError(rsi, message))
 
 
+def add_warning(rsi: str, message: str):
+    warnings.append(RsiError(rsi, message))
+
+
 class RsiError:
     def __init__(self, path: str, message: str):
         self.path = path
         self.message = message
 
 
-exit(main())
+class FrameLintTotals:
+    def __init__(self):
+        self.transparent_frames = 0
+        self.duplicate_frames = 0
+        # Frames that end up in the client's texture atlas for nothing.
+        self.wasted_bytes = 0
+        self.unused_cells = 0
+        # Unused cells only cost decoding and download size: the engine doesn't copy them into the atlas.
+        self.unused_bytes = 0
+
+    def print_summary(self):
+        print(f"Frame lint: {self.transparent_frames} fully transparent and {self.duplicate_frames} duplicate frame(s), "
+              f"wasting {format_bytes(self.wasted_bytes)} of texture memory (RGBA8)")
+        print(f"Frame lint: {self.unused_cells} unused sheet cell(s), {format_bytes(self.unused_bytes)} decoded for nothing")
+
+
+def format_bytes(count: int) -> str:
+    return f"{count / 1024:.1f} KiB"
+
+
+class RsiCache:
+    """
+    Persistent per-RSI validation results, keyed by RSI path.
+    Only clean results are kept: anything with errors is always revalidated so the errors get reported.
+    """
+
+    def __init__(self, path: str, schema_hash: str, entries: Dict[str, str]):
+        self.path = path
+        self.schema_hash = schema_hash
+        self.entries = entries
+        self.dirty = False
+
+    @staticmethod
+    def load(path: str, schema_hash: str) -> "RsiCache":
+        entries: Dict[str, str] = {}
+        try:
+            data = read_json(path)
+            if data.get("version") == CACHE_VERSION and data.get("schema") == schema_hash:
+                entries = data["clean"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            # Missing or corrupt cache, start fresh.
+            pass
+
+        return RsiCache(path, schema_hash, entries)
+
+    def is_clean(self, rsi: str, key: str) -> bool:
+        return self.entries.get(os.path.normpath(rsi)) == key
+
+    def store(self, rsi: str, key: str, clean: bool):
+        rsi = os.path.normpath(rsi)
+        if clean:
+            if self.entries.get(rsi) != key:
+                self.entries[rsi] = key
+                self.dirty = True
+        elif self.entries.pop(rsi, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        data = {"version": CACHE_VERSION, "schema": self.schema_hash, "clean": self.entries}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=0, sort_keys=True)
+
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+if __name__ == "__main__":
+    exit(main())
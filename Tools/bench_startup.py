@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# Startup benchmark for the commands of robust_tools.py.
+#
+# Runs "<command> --help" for every command under python -X importtime, which imports the command's module
+# and parses arguments but does no work. Reports wall time and total import time per command,
+# and which heavy dependencies got imported on the way. Those should only be imported by the code paths
+# that use them, so --check fails if any command imports one just to start up, unless every run of
+# that command needs it anyway (see STARTUP_IMPORTS).
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Set
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+CLI = os.path.join(TOOLS_DIR, "robust_tools.py")
+
+# Top level packages too slow to import on every start.
+HEAVY_MODULES = ["PIL", "numpy", "jsonschema", "requests", "zstandard", "yamale", "validators", "colorama", "yaml"]
+
+# Heavy modules a command may import at startup. Parsing YAML is what these commands do,
+# so deferring the import of yaml would only make --help faster.
+YAML_COMMANDS = ["validate_assets", "validate_rga", "validate_mapfile", "check_map_refs", "diff_maps", "map_stats",
+                 "mapfile_binary", "bench_map_cache"]
+STARTUP_IMPORTS: Dict[str, Set[str]] = {command: {"yaml"} for command in YAML_COMMANDS}
+
+DEFAULT_RUNS = 5
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("bench_startup.py", description="Measures startup and import time of every robust_tools.py command.")
+    parser.add_argument("commands", nargs="*", help="Commands to measure (default all)")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help=f"Runs per command, the fastest counts (default {DEFAULT_RUNS})")
+    parser.add_argument("--check", action="store_true", help="Fail if any command imports a heavy dependency at startup")
+    parser.add_argument("--json", metavar="FILE", help="Also write the measurements to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, TOOLS_DIR)
+    from robust_tools import COMMANDS
+
+    commands = args.commands or list(COMMANDS)
+    for command in commands:
+        if command not in COMMANDS:
+            parser.error(f"unknown command {command}")
+
+    baseline = measure([sys.executable, "-X", "importtime", "-c", "pass"], args.runs)
+    print(f"{'(interpreter)':<24} {baseline['seconds'] * 1000:>8.1f} ms {baseline['import_us'] / 1000:>8.1f} ms imports")
+
+    results: List[Dict[str, Any]] = []
+    failed = False
+    for command in commands:
+        result = measure([sys.executable, "-X", "importtime", CLI, command, "--help"], args.runs)
+        result["command"] = command
+        results.append(result)
+
+        problems = []
+        if result["exit_code"] != 0:
+            problems.append(f"exited with {result['exit_code']}")
+        unexpected = [module for module in result["heavy"] if module not in STARTUP_IMPORTS.get(command, set())]
+        if unexpected:
+            problems.append(f"imports {', '.join(unexpected)}")
+        failed |= bool(problems) if args.check else result["exit_code"] != 0
+
+        print(f"{command:<24} {result['seconds'] * 1000:>8.1f} ms {result['import_us'] / 1000:>8.1f} ms imports"
+              + (f"  {'; '.join(problems)}" if problems else ""))
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "baseline": baseline, "results": results}, f, indent=1)
+
+    return 1 if failed else 0
+
+
+def measure(cmd: List[str], runs: int) -> Dict[str, Any]:
+    best = None
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        process = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best["seconds"]:
+            modules = parse_importtime(process.stderr)
+            best = {
+                "seconds": seconds,
+                "exit_code": process.returncode,
+                # Cumulative times of top level imports add up to the total.
+                "import_us": sum(us for name, us, depth in modules if depth == 0),
+                "heavy": sorted({name.split(".")[0] for name, _, _ in modules if name.split(".")[0] in HEAVY_MODULES}),
+                "slowest": [{"module": name, "us": us} for name, us, depth in sorted(modules, key=lambda m: -m[1]) if depth == 0][:5],
+            }
+
+    assert best is not None
+    return best
+
+
+def parse_importtime(stderr: str) -> List[Any]:
+    """
+    (module, cumulative microseconds, nesting depth) of every import in -X importtime output.
+    """
+
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        stripped = name.lstrip(" ")
+        depth = (len(name) - len(stripped) - 1) // 2
+        modules.append((stripped, int(cumulative), depth))
+
+    return modules
+
+
+if __name__ == "__main__":
+    exit(main())
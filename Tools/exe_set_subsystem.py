@@ -22,50 +22,31 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
 import sys
-import struct
-
-if len(sys.argv) != 3:
-	print("exe_set_subsystem.py <EXE> <SUBSYSTEM>")
-	print(" alters EXE in-place to change it's subsystem to SUBSYSTEM")
-	print("")
-	print("SUBSYSTEM values:")
-	print(" 2: GUI")
-	print(" 3: Console")
-	sys.exit(1)
-
-file = open(sys.argv[1], "r+b")
-if file.read(2) != b"MZ":
-	print("Header must be 'MZ'.")
-	sys.exit(2)
-file.seek(0x3C)
-
-peSignatureOfs = struct.unpack("<I", file.read(4))[0]
-print("PE Signature Ofs: " + str(peSignatureOfs))
-file.seek(peSignatureOfs)
-if file.read(4) != b"PE\x00\x00":
-	print("PE Signature must be 'PE'.")
-	sys.exit(3)
-peHeader = struct.unpack("<HHIIIHH", file.read(20))
-optHeaderOfs = peSignatureOfs + 4 + 20
-print("Opt. Header Ofs: " + str(optHeaderOfs))
-
-subsystemOptOfs = 0
-# This is the hard bit.
-# Or not.
-# Expected these to be in different places.
-if peHeader[0] == 332:
-	subsystemOptOfs = 68
-elif peHeader[0] == 0x8664:
-	subsystemOptOfs = 68
-else:
-	print("Unable to handle machine: " + str(peHeader[0]))
-	sys.exit(4)
-subsystemOfs = optHeaderOfs + subsystemOptOfs
-file.seek(subsystemOfs)
-print("Current Subsystem: " + str(struct.unpack("<H", file.read(2))[0]))
-file.seek(subsystemOfs)
-file.write(struct.pack("<H", int(sys.argv[2])))
-file.close()
-print("Done!")
 
+# The actual patching lives in pe_header.py, this is kept for its command line.
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from pe_header import PEError, patch_files
+
+def main():
+	if len(sys.argv) != 3:
+		print("exe_set_subsystem.py <EXE> <SUBSYSTEM>")
+		print(" alters EXE in-place to change it's subsystem to SUBSYSTEM")
+		print("")
+		print("SUBSYSTEM values:")
+		print(" 2: GUI")
+		print(" 3: Console")
+		sys.exit(1)
+
+	try:
+		[(_, old)] = patch_files([sys.argv[1]], int(sys.argv[2]))
+	except PEError as e:
+		print(str(e) + ".")
+		sys.exit(2)
+
+	print("Previous Subsystem: " + str(old))
+	print("Done!")
+
+if __name__ == "__main__":
+	main()
@@ -4,8 +4,11 @@ import argparse
 import os
 import re
 import shutil
+import stat
 import plistlib
 
+from concurrent.futures import ThreadPoolExecutor
+
 p = os.path.join
 
 symlinkable_re = re.compile(r"(?:runtimes|.+\.(?:dll|pdb|json))$", re.IGNORECASE)
@@ -30,14 +33,17 @@ def main():
 
     # Copy apphost
     dest_apphost = p(dir, f"{name}.app", "Contents", "MacOS", name)
-    shutil.copy(p(dir, args.apphost), dest_apphost)
+    copy_if_changed(p(dir, args.apphost), dest_apphost)
+
+    # The same files get linked into every bundle, only look at them once.
+    linkable = scan_linkable(dir)
 
     # Symlink most files in the bin dir.
-    symlink_files(args.directory, p(dir, f"{name}.app", "Contents", "MacOS"), "")
+    symlink_files(dir, linkable, p(dir, f"{name}.app", "Contents", "MacOS"), "")
 
     # Copy icon
     if args.icon:
-        shutil.copy(args.icon, p(dir, f"{name}.app", "Contents", "Resources", "icon.icns"))
+        copy_if_changed(args.icon, p(dir, f"{name}.app", "Contents", "Resources", "icon.icns"))
 
     # Write plist
     plist_dat = {
@@ -49,20 +55,23 @@ def main():
         "LSApplicationCategoryType": "public.app-category.games"
     }
 
-    with open(p(dir, f"{name}.app", "Contents", "Info.plist"), "wb") as f:
-        plistlib.dump(plist_dat, f)
+    write_plist_if_changed(p(dir, f"{name}.app", "Contents", "Info.plist"), plist_dat)
 
     if args.webview:
         chromium_framework_path = p(dir, f"{name}.app", "Contents", "Frameworks", "Chromium Embedded Framework.framework")
-        if not os.path.exists(chromium_framework_path):
+        if not os.path.lexists(chromium_framework_path):
             os.symlink("../../../Chromium Embedded Framework.framework", chromium_framework_path)
 
-        create_webview_helper(dir, name, args.identifier, None, None)
-        create_webview_helper(dir, name, args.identifier, "GPU", "gpu")
-        create_webview_helper(dir, name, args.identifier, "Renderer", "renderer")
-        create_webview_helper(dir, name, args.identifier, "Alerts", "alerts")
+        # Helpers don't share anything they write, so they can all be done at once.
+        helpers = [(None, None), ("GPU", "gpu"), ("Renderer", "renderer"), ("Alerts", "alerts")]
+        with ThreadPoolExecutor(len(helpers)) as executor:
+            futures = [executor.submit(create_webview_helper, dir, linkable, name, args.identifier, suffix, identifier_suffix)
+                       for suffix, identifier_suffix in helpers]
+            for future in futures:
+                future.result()
 
-def create_webview_helper(dir: str, name: str, identifier: str, suffix: str | None, identifier_suffix: str | None):
+def create_webview_helper(dir: str, linkable: list[tuple[str, os.stat_result]], name: str, identifier: str,
+                          suffix: str | None, identifier_suffix: str | None):
     helper_name = f"{name} helper"
     if suffix is not None:
         helper_name += f" ({suffix})"
@@ -73,10 +82,10 @@ def create_webview_helper(dir: str, name: str, identifier: str, suffix: str | No
     os.makedirs(p(sub_app_path, "Contents", "Resources"), exist_ok=True)
 
     # Copy apphost for Robust.Client.WebView
-    shutil.copy(p(dir, "Robust.Client.WebView"), p(sub_app_path, "Contents", "MacOS", helper_name))
+    copy_if_changed(p(dir, "Robust.Client.WebView"), p(sub_app_path, "Contents", "MacOS", helper_name))
 
     # Symlink files
-    symlink_files(dir, p(sub_app_path, "Contents", "MacOS"), "../../../")
+    symlink_files(dir, linkable, p(sub_app_path, "Contents", "MacOS"), "../../../")
 
     helper_identifier = f"{identifier}.cef.{identifier_suffix}"
 
@@ -90,17 +99,16 @@ def create_webview_helper(dir: str, name: str, identifier: str, suffix: str | No
         "CFBundleExecutable": helper_name
     }
 
-    with open(p(sub_app_path, "Contents", "Info.plist"), "wb") as f:
-        plistlib.dump(plist_dat, f)
+    write_plist_if_changed(p(sub_app_path, "Contents", "Info.plist"), plist_dat)
 
-def symlink_files(src_dir: str, dest_dir: str, relative: str):
-    for file in os.listdir(src_dir):
-        if not symlinkable_re.match(file):
-            continue
+def scan_linkable(src_dir: str) -> list[tuple[str, os.stat_result]]:
+    return [(entry.name, entry.stat()) for entry in os.scandir(src_dir) if symlinkable_re.match(entry.name)]
 
+def symlink_files(src_dir: str, linkable: list[tuple[str, os.stat_result]], dest_dir: str, relative: str):
+    for file, src_stat in linkable:
         src_path = p(src_dir, file)
         dest_symlink = p(dest_dir, file)
-        if os.path.isdir(src_path):
+        if stat.S_ISDIR(src_stat.st_mode):
             # Symlink directories
             if not os.path.islink(dest_symlink):
                 os.symlink(f"../../../{relative}{file}", dest_symlink)
@@ -108,11 +116,46 @@ def symlink_files(src_dir: str, dest_dir: str, relative: str):
             # Hardlink files
             # (so that .NET doesn't report the real file path for assembly locations)
             try:
-                os.remove(dest_symlink)
+                dest_stat = os.lstat(dest_symlink)
             except FileNotFoundError:
-                pass # Fine
+                dest_stat = None
 
-            os.link(src_path, dest_symlink)
+            if dest_stat is not None:
+                # Still a link to the same file, nothing to do.
+                # The build replaces outputs with new files rather than writing into them, which changes the inode.
+                if (dest_stat.st_ino == src_stat.st_ino and dest_stat.st_dev == src_stat.st_dev
+                        and dest_stat.st_mtime_ns == src_stat.st_mtime_ns):
+                    continue
 
+                os.remove(dest_symlink)
+
+            os.link(src_path, dest_symlink)
 
-main()
+def copy_if_changed(src: str, dest: str):
+    src_stat = os.stat(src)
+    try:
+        dest_stat = os.stat(dest)
+        if dest_stat.st_size == src_stat.st_size and dest_stat.st_mtime_ns == src_stat.st_mtime_ns:
+            return
+    except FileNotFoundError:
+        pass
+
+    # copy2 so the modification time carries over for the next comparison.
+    shutil.copy2(src, dest)
+
+def write_plist_if_changed(path: str, plist_dat: dict):
+    # Rewriting it bumps the bundle's modification time, which makes macOS re-register the app.
+    data = plistlib.dumps(plist_dat)
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return
+    except FileNotFoundError:
+        pass
+
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+# Read-only access to the files of a server build, over the manifest download protocol.
+#
+# Nothing is downloaded until it's needed: the manifest on first access, blobs on first open().
+# Downloaded blobs are kept in a bounded in-memory cache and optionally an on-disk cache (keyed by blob hash,
+# so it's shared between builds), and opens of uncached files that happen at the same time from multiple threads
+# are batched into one download request.
+#
+#   fs = ManifestFileSystem("https://example.com:1212", cache_dir=".manifest_cache")
+#   for name in fs.listdir("Prototypes/Entities"):
+#       ...
+#   with fs.open("Prototypes/Entities/foo.yml") as f:
+#       ...
+#
+# Protocol, as far as this needs it:
+#   manifest:  header line, then "<BLAKE2b-256 hash> <path>" per file. Index of a file is its line number after the header.
+#   download:  POST u32 file indices, with the header X-Robust-Download-Protocol: 1.
+#              Response is u32 flags (bit 0: blobs may be zstd compressed), then per requested file in order:
+#              u32 length, u32 compressed length if compression is enabled (0: stored uncompressed), data.
+
+import hashlib
+import io
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from profiling import phase
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+# requests and zstandard are slow to import, they're only imported where they're used.
+if TYPE_CHECKING:
+    import requests
+    import zstandard
+
+PROTOCOL_VERSION = "1"
+FLAG_COMPRESSION = 1
+
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+# How long the first thread to miss the cache waits for others to join its download request.
+DEFAULT_BATCH_WINDOW = 0.01
+
+
+class ManifestError(Exception):
+    pass
+
+
+def cdn_urls(server: str, build_info) -> Tuple[str, str]:
+    if build_info["acz"]:
+        return (f"{server}/manifest.txt", f"{server}/download")
+
+    return build_info["manifest_url"], build_info["manifest_download_url"]
+
+
+def decompress_blob(data: bytes, dictionary: Optional["zstandard.ZstdCompressionDict"]) -> bytes:
+    import zstandard
+
+    # Dictionary-compressed frames carry the ID of the dictionary they need.
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    if dict_id == 0:
+        return zstandard.decompress(data)
+
+    if dictionary is None:
+        raise ManifestError(f"Blob was compressed with zstd dictionary {dict_id}, but no dictionary was given")
+
+    if dictionary.dict_id() != dict_id:
+        raise ManifestError(f"Blob needs zstd dictionary {dict_id}, but was given dictionary {dictionary.dict_id()}")
+
+    return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+
+
+def load_dictionary(path: str) -> "zstandard.ZstdCompressionDict":
+    import zstandard
+
+    with open(path, "rb") as f:
+        return zstandard.ZstdCompressionDict(f.read())
+
+
+class ManifestFileSystem:
+    """
+    Read-only file system over the manifest of a server build. Safe to use from multiple threads.
+    """
+
+    def __init__(self, server: Optional[str] = None, manifest_url: Optional[str] = None, download_url: Optional[str] = None,
+                 cache_dir: Optional[str] = None, memory_limit: int = DEFAULT_MEMORY_LIMIT, disk_limit: Optional[int] = None,
+                 dictionary: Optional[str] = None, batch_window: float = DEFAULT_BATCH_WINDOW,
+                 session: Optional["requests.Session"] = None):
+        """
+        Either pass the game server address (no trailing /), to look the build up from its /info,
+        or the manifest and download URLs directly.
+        """
+
+        if server is None and (manifest_url is None or download_url is None):
+            raise ValueError("Need either a server or both the manifest and download URL")
+
+        self.server = server
+        self.manifest_url = manifest_url
+        self.download_url = download_url
+        if session is None:
+            import requests
+            session = requests.Session()
+
+        self.session = session
+        self.dictionary = load_dictionary(dictionary) if dictionary is not None else None
+        self.batch_window = batch_window
+
+        self.memory = MemoryCache(memory_limit)
+        self.disk = DiskCache(cache_dir, disk_limit) if cache_dir is not None else None
+
+        self.lock = threading.Lock()
+        self.manifest_loaded = False
+        self.header = ""
+        # Path -> (index, hash)
+        self.files: Dict[str, Tuple[int, str]] = {}
+        # Directory -> names of direct children, directories end in /
+        self.dirs: Dict[str, List[str]] = {}
+
+        # Hash -> future of blobs being downloaded or waiting to be.
+        self.in_flight: Dict[str, Future] = {}
+        # Hashes (with the index to request them by) waiting for the next download request.
+        self.queued: Dict[str, int] = {}
+        self.batch_scheduled = False
+
+        self.requests_made = 0
+        self.bytes_downloaded = 0
+
+    def open(self, path: str) -> io.BytesIO:
+        return io.BytesIO(self.read(path))
+
+    def read(self, path: str) -> bytes:
+        _, hash = self.entry(path)
+        data = self.cached(hash)
+        if data is not None:
+            return data
+
+        return self.request([path])[hash].result()
+
+    def prefetch(self, paths: Iterable[str]):
+        """
+        Downloads everything in paths that isn't cached yet, in a single request.
+        """
+
+        futures = self.request([path for path in paths if self.cached(self.entry(path)[1]) is None])
+        for future in futures.values():
+            future.result()
+
+    def listdir(self, prefix: str = "") -> List[str]:
+        """
+        Names of the files and directories directly in a directory, directories end in /.
+        """
+
+        self.load_manifest()
+        try:
+            return list(self.dirs[prefix.strip("/")])
+        except KeyError:
+            raise FileNotFoundError(prefix) from None
+
+    def walk(self, prefix: str = "") -> Iterable[str]:
+        """
+        Paths of all files in and below a directory.
+        """
+
+        self.load_manifest()
+        prefix = prefix.strip("/")
+        start = prefix + "/" if prefix else ""
+        return [path for path in self.files if path.startswith(start)]
+
+    def exists(self, path: str) -> bool:
+        self.load_manifest()
+        path = path.strip("/")
+        return path in self.files or path in self.dirs
+
+    def isdir(self, path: str) -> bool:
+        self.load_manifest()
+        return path.strip("/") in self.dirs
+
+    def hash_of(self, path: str) -> str:
+        return self.entry(path)[1]
+
+    def entry(self, path: str) -> Tuple[int, str]:
+        self.load_manifest()
+        try:
+            return self.files[path.strip("/")]
+        except KeyError:
+            raise FileNotFoundError(path) from None
+
+    def load_manifest(self):
+        if self.manifest_loaded:
+            return
+
+        with self.lock:
+            if self.manifest_loaded:
+                return
+
+            if self.manifest_url is None or self.download_url is None:
+                with phase("server info"):
+                    response = self.session.get(f"{self.server}/info")
+                    response.raise_for_status()
+                self.manifest_url, self.download_url = cdn_urls(self.server, response.json()["build"])
+
+            with phase("fetch manifest"):
+                response = self.session.get(self.manifest_url)
+                response.raise_for_status()
+            lines = response.content.decode("utf-8").splitlines()
+            if not lines:
+                raise ManifestError("Manifest is empty")
+
+            self.header = lines[0]
+            self.dirs[""] = []
+            for index, line in enumerate(lines[1:]):
+                hash, path = line.split(" ", maxsplit=1)
+                self.files[path] = (index, hash)
+                self.add_to_dirs(path)
+
+            self.manifest_loaded = True
+
+    def add_to_dirs(self, path: str):
+        parent, _, name = path.rpartition("/")
+        # Walk up until a directory that was already seen, registering the new ones on the way.
+        while parent not in self.dirs:
+            self.dirs[parent] = [name]
+            parent, _, dir_name = parent.rpartition("/")
+            name = dir_name + "/"
+
+        self.dirs[parent].append(name)
+
+    def cached(self, hash: str) -> Optional[bytes]:
+        data = self.memory.get(hash)
+        if data is None and self.disk is not None:
+            data = self.disk.get(hash)
+            if data is not None:
+                self.memory.put(hash, data)
+        return data
+
+    def request(self, paths: List[str]) -> Dict[str, Future]:
+        """
+        Queues the blobs of paths for download. The first thread to queue anything waits the batch window
+        for others to add theirs, then makes one request for everything queued by then.
+        """
+
+        futures: Dict[str, Future] = {}
+        leader = False
+        with self.lock:
+            for path in paths:
+                index, hash = self.files[path.strip("/")]
+                future = self.in_flight.get(hash)
+                if future is None:
+                    future = Future()
+                    self.in_flight[hash] = future
+                    self.queued[hash] = index
+                futures[hash] = future
+
+            if self.queued and not self.batch_scheduled:
+                self.batch_scheduled = True
+                leader = True
+
+        if leader:
+            if self.batch_window > 0:
+                time.sleep(self.batch_window)
+
+            with self.lock:
+                batch = self.queued
+                self.queued = {}
+                self.batch_scheduled = False
+
+            self.download(batch)
+
+        return futures
+
+    def download(self, batch: Dict[str, int]):
+        try:
+            blobs = self.fetch(batch)
+        except BaseException as e:
+            with self.lock:
+                for hash in batch:
+                    self.in_flight.pop(hash).set_exception(e)
+            raise
+
+        # Other threads may be waiting on these, they get their data no matter what happens while caching it.
+        try:
+            for hash, data in blobs.items():
+                self.memory.put(hash, data)
+        finally:
+            with self.lock:
+                for hash, data in blobs.items():
+                    self.in_flight.pop(hash).set_result(data)
+
+        if self.disk is not None:
+            for hash, data in blobs.items():
+                try:
+                    self.disk.put(hash, data)
+                except OSError as e:
+                    # E.g. the disk is full. Only costs a download next time.
+                    print(f"Failed to write blob {hash} to the disk cache: {e}", file=sys.stderr)
+
+    def fetch(self, batch: Dict[str, int]) -> Dict[str, bytes]:
+        with phase("fetch blobs"):
+            return self.fetch_blobs(batch)
+
+    def fetch_blobs(self, batch: Dict[str, int]) -> Dict[str, bytes]:
+        hashes = list(batch)
+        body = struct.pack(f"<{len(hashes)}I", *(batch[hash] for hash in hashes))
+        headers = {"Content-Type": "application/octet-stream", "X-Robust-Download-Protocol": PROTOCOL_VERSION}
+        response = self.session.post(self.download_url, data=body, headers=headers, stream=True)
+        response.raise_for_status()
+        self.requests_made += 1
+
+        with response:
+            stream = response.raw
+            flags = read_u32(stream)
+            compression = (flags & FLAG_COMPRESSION) != 0
+
+            blobs = {}
+            for hash in hashes:
+                length = read_u32(stream)
+                compressed_length = read_u32(stream) if compression else 0
+                data = read_exact(stream, compressed_length or length)
+                self.bytes_downloaded += len(data)
+                if compressed_length:
+                    with phase("decompress"):
+                        data = decompress_blob(data, self.dictionary)
+
+                if len(data) != length or hashlib.blake2b(data, digest_size=32).hexdigest().upper() != hash:
+                    raise ManifestError(f"Downloaded blob {hash} does not match the manifest")
+                blobs[hash] = data
+
+        return blobs
+
+
+class MemoryCache:
+    """
+    LRU of blobs by hash, bounded by total size in bytes.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self.entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, hash: str) -> Optional[bytes]:
+        with self.lock:
+            data = self.entries.get(hash)
+            if data is not None:
+                self.entries.move_to_end(hash)
+            return data
+
+    def put(self, hash: str, data: bytes):
+        if len(data) > self.limit:
+            return
+
+        with self.lock:
+            if hash in self.entries:
+                return
+            self.entries[hash] = data
+            self.size += len(data)
+            while self.size > self.limit:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class DiskCache:
+    """
+    Directory of uncompressed blobs named by hash. With a limit, least recently used blobs
+    (by modification time, which hits update) get removed when it grows past it.
+    """
+
+    def __init__(self, directory: str, limit: Optional[int]):
+        self.directory = directory
+        self.limit = limit
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()) if limit is not None else 0
+
+    def get(self, hash: str) -> Optional[bytes]:
+        path = os.path.join(self.directory, hash)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Something else may have written a bad file in there, don't trust it blindly.
+        if hashlib.blake2b(data, digest_size=32).hexdigest().upper() != hash:
+            return None
+
+        if self.limit is not None:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        return data
+
+    def put(self, hash: str, data: bytes):
+        path = os.path.join(self.directory, hash)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # Don't leave partial files behind, evict() doesn't count them.
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        if self.limit is None:
+            return
+
+        with self.lock:
+            self.size += len(data)
+            if self.size > self.limit:
+                self.evict()
+
+    def evict(self):
+        entries = sorted((e for e in os.scandir(self.directory) if e.is_file() and not e.name.endswith(".tmp")),
+                         key=lambda e: e.stat().st_mtime)
+        self.size = sum(e.stat().st_size for e in entries)
+        for entry in entries:
+            if self.size <= self.limit:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.size -= size
+
+
+def read_u32(stream) -> int:
+    return struct.unpack("<I", read_exact(stream, 4))[0]
+
+
+def read_exact(stream, length: int) -> bytes:
+    data = bytearray()
+    while len(data) < length:
+        chunk = stream.read(length - len(data))
+        if not chunk:
+            raise ManifestError("Download response ended early")
+        data += chunk
+    return bytes(data)
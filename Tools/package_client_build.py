@@ -3,28 +3,41 @@
 # Native libraries are not included.
 
 import os
+import posixpath
 import shutil
+import stat
 import subprocess
 import sys
 import zipfile
 import argparse
 import glob
 from enum import StrEnum
+from pe_header import set_gui_subsystem
+from profiling import add_profiling_arguments, phase, run_profiled
+from resource_files import IGNORED_RESOURCES
+from zip_chunks import write_chunk_index
 
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
-try:
-    from colorama import init, Fore, Style
-    init()
+# Just give an empty string for everything, no colored logging. Until init_colors() runs, or without colorama.
+class ColorDummy(object):
+    def __getattr__(self, name):
+        return ""
+
+Fore = ColorDummy()
+Style = ColorDummy()
 
-except ImportError:
-    # Just give an empty string for everything, no colored logging.
-    class ColorDummy(object):
-        def __getattr__(self, name):
-            return ""
 
-    Fore = ColorDummy()
-    Style = ColorDummy()
+def init_colors() -> None:
+    # colorama is only imported once there's something to print, --help doesn't need it.
+    global Fore, Style
+    try:
+        from colorama import init, Fore, Style
+    except ImportError:
+        return
+
+    # Not on import, this wraps stdout.
+    init()
 
 
 p = os.path.join
@@ -57,12 +70,6 @@ RID_FREEBSD_ARM64 = f"{PLATFORM_FREEBSD}-arm64"
 DEFAULT_RIDS = [RID_WIN_X64, RID_WIN_ARM64, RID_LINUX_X64, RID_LINUX_ARM64, RID_OSX_X64, RID_OSX_ARM64, RID_FREEBSD_X64, RID_FREEBSD_ARM64]
 ALL_RIDS = [RID_WIN_X64, RID_WIN_ARM64, RID_LINUX_X64, RID_LINUX_ARM64, RID_OSX_X64, RID_OSX_ARM64, RID_FREEBSD_X64, RID_FREEBSD_ARM64]
 
-IGNORED_RESOURCES = {
-    ".gitignore",
-    ".directory",
-    ".DS_Store"
-}
-
 IGNORED_FILES_WINDOWS = {
     "libGLESv2.dll",
     "openal32.dll",
@@ -130,9 +137,38 @@ def main() -> None:
                         action="store_true",
                         help=argparse.SUPPRESS)
 
+    parser.add_argument("--deterministic",
+                        action="store_true",
+                        help="Make byte-for-byte reproducible zips (sorted entries, fixed timestamps and permissions) "
+                             "and write a chunk index next to each one for delta downloads, see zip_chunks.py.")
+
+    parser.add_argument("--preserve-links",
+                        action="store_true",
+                        help="macOS: store symlinks as symlinks instead of copies of what they point to.")
+
+    parser.add_argument("--dedupe-hardlinks",
+                        action="store_true",
+                        help="macOS, with --preserve-links: store each set of hardlinked files once, the other copies "
+                             "become symlinks to it. Smaller zip, but the app bundles' assemblies then resolve to paths "
+                             "outside Contents/MacOS, which the hardlinks made by macos_make_appbundle.py avoid.")
+
+    add_profiling_arguments(parser)
+
     args = parser.parse_args()
+    init_colors()
+    run_profiled("package_client_build", args, lambda: package(args))
+
+
+def package(args: argparse.Namespace) -> None:
     platforms: list[str] = args.platform
     skip_build: bool = args.skip_build
+    deterministic: bool = args.deterministic
+    preserve_links: bool = args.preserve_links
+    dedupe_hardlinks: bool = args.dedupe_hardlinks
+
+    if dedupe_hardlinks and not preserve_links:
+        print(Fore.RED + "--dedupe-hardlinks needs --preserve-links" + Style.RESET_ALL)
+        exit(1)
 
     if not platforms:
         platforms = DEFAULT_RIDS
@@ -152,10 +188,12 @@ def main() -> None:
         os.mkdir("release")
 
     for platform in platforms:
-        build_for_platform(platform, skip_build)
+        # Phases of each platform are reported under its RID, like "linux-x64/zip Resources".
+        with phase(platform):
+            build_for_platform(platform, skip_build, deterministic, preserve_links, dedupe_hardlinks)
 
 
-def build_for_platform(rid: str, skip_build: bool):
+def build_for_platform(rid: str, skip_build: bool, deterministic: bool, preserve_links: bool, dedupe_hardlinks: bool):
     print(Fore.GREEN + f"Building for platform '{rid}'..." + Style.RESET_ALL)
 
     if not skip_build:
@@ -163,69 +201,231 @@ def build_for_platform(rid: str, skip_build: bool):
 
     platform = rid.split('-', maxsplit=2)[0]
     if platform == PLATFORM_WIN:
-        build_windows(rid, skip_build)
+        build_windows(rid, skip_build, deterministic)
     elif platform == PLATFORM_LINUX:
-        build_linux_like(rid, TargetOS.Linux, skip_build)
+        build_linux_like(rid, TargetOS.Linux, skip_build, deterministic)
     elif platform == PLATFORM_OSX:
-        build_macos(rid, skip_build)
+        build_macos(rid, skip_build, deterministic, preserve_links, dedupe_hardlinks)
     elif platform == PLATFORM_FREEBSD:
-        build_linux_like(rid, TargetOS.FreeBSD, skip_build)
+        build_linux_like(rid, TargetOS.FreeBSD, skip_build, deterministic)
 
 def wipe_bin():
     print(Fore.BLUE + Style.DIM +
           "Clearing old build artifacts (if any)..." + Style.RESET_ALL)
 
     if os.path.exists("bin"):
-        shutil.rmtree("bin")
+        with phase("clean"):
+            shutil.rmtree("bin")
 
 
-def build_windows(rid: str, skip_build: bool) -> None:
+def build_windows(rid: str, skip_build: bool, deterministic: bool) -> None:
     if not skip_build:
         publish_client(rid, TargetOS.Windows)
         if sys.platform != "win32":
-            subprocess.run(["Tools/exe_set_subsystem.py", p("bin", "Client", rid, "publish", "Robust.Client"), "2"])
+            with phase("set subsystem"):
+                set_gui_subsystem([p("bin", "Client", rid, "publish", "Robust.Client")])
 
     print(Fore.GREEN + f"Packaging {rid} client..." + Style.RESET_ALL)
 
-    client_zip = zipfile.ZipFile(
-        p("release", f"Robust.Client_{rid}.zip"), "w",
-        compression=zipfile.ZIP_DEFLATED)
+    client_zip = open_client_zip(p("release", f"Robust.Client_{rid}.zip"), "w", deterministic)
 
-    copy_dir_into_zip(p("bin", "Client", rid, "publish"), "", client_zip, IGNORED_FILES_WINDOWS)
+    with phase("zip publish"):
+        copy_dir_into_zip(p("bin", "Client", rid, "publish"), "", client_zip, IGNORED_FILES_WINDOWS)
     copy_resources("Resources", client_zip)
     # Cool we're done.
-    client_zip.close()
+    close_client_zip(client_zip, deterministic)
 
-def build_macos(rid: str, skip_build: bool) -> None:
+def build_macos(rid: str, skip_build: bool, deterministic: bool, preserve_links: bool, dedupe_hardlinks: bool) -> None:
     if not skip_build:
         publish_client(rid, TargetOS.MacOS)
 
     print(Fore.GREEN + f"Packaging {rid} client..." + Style.RESET_ALL)
     # Client has to go in an app bundle.
-    client_zip = zipfile.ZipFile(p("release", f"Robust.Client_{rid}.zip"), "a",
-                                 compression=zipfile.ZIP_DEFLATED)
+    client_zip = open_client_zip(p("release", f"Robust.Client_{rid}.zip"), "a", deterministic)
 
+    links = LinkTracker(dedupe_hardlinks) if preserve_links else None
     contents = p("Space Station 14.app", "Contents", "Resources")
-    copy_dir_into_zip(p("BuildFiles", "Mac", "Space Station 14.app"), "Space Station 14.app", client_zip)
-    copy_dir_into_zip(p("bin", "Client", rid, "publish"), contents, client_zip, IGNORED_FILES_MACOS)
+    with phase("zip app bundle"):
+        copy_dir_into_zip(p("BuildFiles", "Mac", "Space Station 14.app"), "Space Station 14.app", client_zip, links=links)
+    with phase("zip publish"):
+        copy_dir_into_zip(p("bin", "Client", rid, "publish"), contents, client_zip, IGNORED_FILES_MACOS, links)
     copy_resources(p(contents, "Resources"), client_zip)
-    client_zip.close()
+    if links is not None:
+        with phase("zip hardlinks"):
+            links.finish(client_zip)
+    close_client_zip(client_zip, deterministic)
+    if links is not None:
+        links.report(client_zip.filename)
 
 
-def build_linux_like(rid: str, target_os: TargetOS, skip_build: bool) -> None:
+def build_linux_like(rid: str, target_os: TargetOS, skip_build: bool, deterministic: bool) -> None:
     if not skip_build:
         publish_client(rid, target_os)
 
     print(Fore.GREEN + "Packaging %s client..." % rid + Style.RESET_ALL)
 
-    client_zip = zipfile.ZipFile(
-        p("release", "Robust.Client_%s.zip" % rid), "w",
-        compression=zipfile.ZIP_DEFLATED, strict_timestamps=False)
+    client_zip = open_client_zip(p("release", "Robust.Client_%s.zip" % rid), "w", deterministic,
+                                 strict_timestamps=False)
 
-    copy_dir_into_zip(p("bin", "Client", rid, "publish"), "", client_zip, IGNORED_FILES_LINUX)
+    with phase("zip publish"):
+        copy_dir_into_zip(p("bin", "Client", rid, "publish"), "", client_zip, IGNORED_FILES_LINUX)
     copy_resources("Resources", client_zip)
     # Cool we're done.
-    client_zip.close()
+    close_client_zip(client_zip, deterministic)
+
+
+def open_client_zip(path: str, mode: str, deterministic: bool, **kwargs) -> zipfile.ZipFile:
+    if deterministic:
+        return DeterministicZipFile(path, mode)
+
+    return zipfile.ZipFile(path, mode, compression=zipfile.ZIP_DEFLATED, **kwargs)
+
+
+def close_client_zip(zipf: zipfile.ZipFile, deterministic: bool) -> None:
+    # Deterministic zips only get written out here.
+    with phase("zip close"):
+        zipf.close()
+    if deterministic:
+        print(Fore.BLUE + Style.DIM + f"Writing chunk index for {zipf.filename}..." + Style.RESET_ALL)
+        with phase("chunk index"):
+            write_chunk_index(zipf.filename)
+
+
+class DeterministicZipFile(zipfile.ZipFile):
+    """
+    Zip file whose bytes only depend on the names and contents of what's put in it.
+
+    write() only records the entry, everything is written out on close() sorted by name,
+    with a fixed timestamp and permissions (executable or not is kept).
+    """
+
+    # Earliest date zip can represent.
+    DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+    def __init__(self, file: str, mode: str):
+        super().__init__(file, mode, compression=zipfile.ZIP_DEFLATED)
+        # Name -> source file, or (external_attr, data) for entries written from memory.
+        self.pending: Dict[str, Union[str, Tuple[int, bytes]]] = {}
+
+    def write(self, filename, arcname=None, compress_type=None, compresslevel=None):
+        # Same name sanitizing as the real thing.
+        zinfo = zipfile.ZipInfo.from_file(filename, arcname, strict_timestamps=False)
+        self.pending[zinfo.filename] = filename
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        if isinstance(zinfo_or_arcname, zipfile.ZipInfo):
+            zinfo = zinfo_or_arcname
+        else:
+            zinfo = zipfile.ZipInfo(zinfo_or_arcname, self.DATE_TIME)
+        self.pending[zinfo.filename] = (zinfo.external_attr, data.encode("utf-8") if isinstance(data, str) else data)
+
+    def getinfo(self, name):
+        if name in self.pending:
+            return zipfile.ZipInfo(name, self.DATE_TIME)
+
+        return super().getinfo(name)
+
+    def close(self):
+        if self.fp is not None and self.mode != "r":
+            for name in sorted(self.pending):
+                self.write_entry(name, self.pending[name])
+            self.pending.clear()
+
+        super().close()
+
+    def write_entry(self, name: str, source: Union[str, Tuple[int, bytes]]):
+        zinfo = zipfile.ZipInfo(name, self.DATE_TIME)
+        # Otherwise this depends on the OS the zip is made on.
+        zinfo.create_system = 3
+        if isinstance(source, tuple):
+            zinfo.external_attr, data = source
+            super().writestr(zinfo, data)
+            return
+
+        if zinfo.is_dir():
+            zinfo.external_attr = (0o40755 << 16) | 0x10
+            super().writestr(zinfo, b"")
+            return
+
+        st = os.stat(source)
+        zinfo.external_attr = (0o100755 if st.st_mode & 0o111 else 0o100644) << 16
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.file_size = st.st_size
+        with open(source, "rb") as src, self.open(zinfo, "w") as dest:
+            shutil.copyfileobj(src, dest, 1024 * 1024)
+
+
+class LinkTracker:
+    """
+    Keeps links as links when copying directories into a zip, instead of storing full copies of everything.
+
+    Symlinks become symlink entries (Unix mode bits in external_attr, like zip -y), which unzip and
+    Archive Utility recreate as symlinks. Zip has no hardlinks, so hardlinked files are stored in full by default.
+
+    With dedupe_hardlinks, of a set of hardlinked files only the one closest to the root gets stored and the others
+    become symlinks to it. That changes what the files resolve to: macos_make_appbundle.py hardlinks the assemblies
+    into the bundles precisely so .NET reports paths inside Contents/MacOS, which symlinks would defeat.
+    The sets are only known once everything is walked, see finish().
+    """
+
+    def __init__(self, dedupe_hardlinks: bool = False):
+        self.dedupe_hardlinks = dedupe_hardlinks
+        # (device, inode) -> [(file path, zip path)]
+        self.hardlinks: Dict[Tuple[int, int], List[Tuple[str, str]]] = {}
+        self.symlinks = 0
+        self.deduplicated = 0
+        self.saved_bytes = 0
+
+    def add(self, zipf: zipfile.ZipFile, filepath: str, zippath: str) -> bool:
+        """
+        Handles filepath if it's a link. Returns False if it's a regular file that still needs to be written.
+        """
+
+        st = os.lstat(filepath)
+        if stat.S_ISLNK(st.st_mode):
+            write_symlink(zipf, zippath, os.readlink(filepath))
+            self.symlinks += 1
+            return True
+
+        if self.dedupe_hardlinks and st.st_nlink > 1:
+            self.hardlinks.setdefault((st.st_dev, st.st_ino), []).append((filepath, zippath))
+            return True
+
+        return False
+
+    def finish(self, zipf: zipfile.ZipFile):
+        for links in self.hardlinks.values():
+            links.sort(key=lambda link: (zip_name(link[1]).count("/"), zip_name(link[1])))
+            filepath, zippath = links[0]
+            zipf.write(filepath, zippath)
+
+            for _, other in links[1:]:
+                target = posixpath.relpath(zip_name(zippath), posixpath.dirname(zip_name(other)))
+                write_symlink(zipf, other, target)
+                self.deduplicated += 1
+                self.saved_bytes += os.path.getsize(filepath)
+
+        self.hardlinks.clear()
+
+    def report(self, zip_path: str):
+        mib = 1024 * 1024
+        message = f"{zip_path}: {os.path.getsize(zip_path) / mib:.1f} MiB, kept {self.symlinks} symlinks"
+        if self.dedupe_hardlinks:
+            message += (f", replaced {self.deduplicated} hardlinked files with symlinks "
+                        f"({self.saved_bytes / mib:.1f} MiB uncompressed saved)")
+        print(Fore.GREEN + message + Style.RESET_ALL)
+
+
+def zip_name(path: str) -> str:
+    # What ZipInfo.from_file turns a path into.
+    return os.path.normpath(os.path.splitdrive(path)[1]).lstrip(os.sep).replace(os.sep, "/")
+
+
+def write_symlink(zipf: zipfile.ZipFile, zippath: str, target: str):
+    zinfo = zipfile.ZipInfo(zip_name(zippath))
+    zinfo.create_system = 3
+    zinfo.external_attr = (stat.S_IFLNK | 0o777) << 16
+    zipf.writestr(zinfo, target)
 
 
 def publish_client(runtime: str, target_os: TargetOS) -> None:
@@ -239,11 +439,13 @@ def publish_client(runtime: str, target_os: TargetOS) -> None:
         "/p:UseAppHost=False"
     ]
 
-    subprocess.run(base + ["Robust.Client/Robust.Client.csproj"], check=True)
+    with phase("publish"):
+        subprocess.run(base + ["Robust.Client/Robust.Client.csproj"], check=True)
 
 
 def copy_resources(target, zipf):
-    do_resource_copy(target, "Resources", zipf, IGNORED_RESOURCES)
+    with phase("zip Resources"):
+        do_resource_copy(target, "Resources", zipf, IGNORED_RESOURCES)
 
 
 def do_resource_copy(target, source, zipf, ignore_set):
@@ -270,15 +472,21 @@ def zip_entry_exists(zipf, name):
     return True
 
 
-def copy_dir_into_zip(directory, basepath, zipf, ignored={}):
+def copy_dir_into_zip(directory, basepath, zipf, ignored={}, links: Optional[LinkTracker] = None):
     if basepath and not zip_entry_exists(zipf, basepath):
         zipf.write(directory, basepath)
 
-    for root, _, files in os.walk(directory):
+    for root, dirs, files in os.walk(directory):
         relpath = os.path.relpath(root, directory)
         if relpath != "." and not zip_entry_exists(zipf, p(basepath, relpath)):
             zipf.write(root, p(basepath, relpath))
 
+        if links is not None:
+            # os.walk doesn't go into symlinked directories.
+            for dirname in dirs:
+                if dirname not in ignored and os.path.islink(p(root, dirname)):
+                    links.add(zipf, p(root, dirname), p(basepath, relpath, dirname))
+
         for filename in files:
             zippath = p(basepath, relpath, filename)
             filepath = p(root, filename)
@@ -294,7 +502,8 @@ def copy_dir_into_zip(directory, basepath, zipf, ignored={}):
                 zipfile=os.path.normpath(zippath))
 
             print(Fore.CYAN + message + Style.RESET_ALL)
-            zipf.write(filepath, zippath)
+            if links is None or not links.add(zipf, filepath, zippath):
+                zipf.write(filepath, zippath)
 
 
 def copy_dir_or_file(src: str, dst: str):
@@ -9,21 +9,29 @@ import sys
 import zipfile
 import argparse
 import glob
+from pe_header import set_gui_subsystem
 
-from typing import List, Optional
+from typing import Optional
 
-try:
-    from colorama import init, Fore, Style
-    init()
+# Just give an empty string for everything, no colored logging. Until init_colors() runs, or without colorama.
+class ColorDummy(object):
+    def __getattr__(self, name):
+        return ""
+
+Fore = ColorDummy()
+Style = ColorDummy()
 
-except ImportError:
-    # Just give an empty string for everything, no colored logging.
-    class ColorDummy(object):
-        def __getattr__(self, name):
-            return ""
 
-    Fore = ColorDummy()
-    Style = ColorDummy()
+def init_colors() -> None:
+    # colorama is only imported once there's something to print, --help doesn't need it.
+    global Fore, Style
+    try:
+        from colorama import init, Fore, Style
+    except ImportError:
+        return
+
+    # Not on import, this wraps stdout.
+    init()
 
 
 p = os.path.join
@@ -50,6 +58,7 @@ def main() -> None:
                         help=argparse.SUPPRESS)
 
     args = parser.parse_args()
+    init_colors()
     platforms = args.platform
     skip_build = args.skip_build
 
@@ -93,7 +102,7 @@ def build_windows(skip_build: bool) -> None:
         build_client_rid("Windows", "win-x64")
         build_client("Windows")
         if sys.platform != "win32":
-            subprocess.run(["Tools/exe_set_subsystem.py", p(base_bin, "Robust.Client.WebView.exe"), "2"])
+            set_gui_subsystem([p(base_bin, "Robust.Client.WebView.exe")])
 
 
     print(Fore.GREEN + "Packaging win-x64..." + Style.RESET_ALL)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# Reads and patches PE (Windows executable) headers in place, without rewriting the file.
+#
+# Used by the packaging scripts to mark executables as GUI programs (so they don't open a console window)
+# when they're built on a non-Windows host. Can patch many files in one go, and optionally fixes up the
+# PE checksum afterwards (only really matters for drivers and signed system files, but keeps tools like dumpbin quiet).
+#
+#   pe_header.py --subsystem 2 bin/Client/win-x64/publish/Robust.Client.exe
+
+import argparse
+import array
+import mmap
+import os
+import struct
+import sys
+from typing import Iterable, List, Tuple
+
+SUBSYSTEM_GUI = 2
+SUBSYSTEM_CONSOLE = 3
+
+MAGIC_PE32 = 0x10B
+MAGIC_PE32_PLUS = 0x20B
+
+# Machine -> (name, optional header magic it uses)
+MACHINES = {
+    0x014C: ("i386", MAGIC_PE32),
+    0x01C4: ("arm", MAGIC_PE32),
+    0x8664: ("amd64", MAGIC_PE32_PLUS),
+    0xAA64: ("arm64", MAGIC_PE32_PLUS),
+}
+
+# Offsets in the optional header, these happen to be the same for PE32 and PE32+.
+CHECKSUM_OFFSET = 64
+SUBSYSTEM_OFFSET = 68
+
+COFF_HEADER_SIZE = 20
+# The DOS header, which holds the offset of the PE signature.
+DOS_HEADER_SIZE = 0x40
+
+
+class PEError(Exception):
+    pass
+
+
+class PEHeader:
+    """
+    The parts of the headers of a PE file that get patched, with absolute file offsets.
+    """
+
+    def __init__(self, machine: int, magic: int, checksum_offset: int, subsystem_offset: int):
+        self.machine = machine
+        self.magic = magic
+        self.checksum_offset = checksum_offset
+        self.subsystem_offset = subsystem_offset
+
+    @property
+    def machine_name(self) -> str:
+        return MACHINES[self.machine][0]
+
+    @property
+    def is_pe32_plus(self) -> bool:
+        return self.magic == MAGIC_PE32_PLUS
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Patches PE headers of Windows executables in place.")
+    parser.add_argument("files", nargs="+", help="Executables to patch")
+    parser.add_argument("--subsystem", type=int, help=f"Set the subsystem ({SUBSYSTEM_GUI}: GUI, {SUBSYSTEM_CONSOLE}: console)")
+    parser.add_argument("--checksum", action="store_true", help="Recompute the PE checksum")
+    args = parser.parse_args()
+
+    try:
+        if args.subsystem is None and not args.checksum:
+            for path in args.files:
+                with open(path, "rb") as f:
+                    try:
+                        header = read_header(f.read())
+                    except PEError as e:
+                        raise PEError(f"{path}: {e}") from None
+                print(f"{path}: {header.machine_name}, {'PE32+' if header.is_pe32_plus else 'PE32'}")
+            return
+
+        for path, old in patch_files(args.files, args.subsystem, args.checksum):
+            print(f"{path}: subsystem {old} -> {args.subsystem if args.subsystem is not None else old}")
+    except PEError as e:
+        print(e)
+        exit(1)
+
+
+def read_header(data) -> PEHeader:
+    """
+    Parses and validates the headers in data (anything that supports the buffer protocol).
+    """
+
+    if len(data) < DOS_HEADER_SIZE or data[0:2] != b"MZ":
+        raise PEError("Header must be 'MZ'")
+
+    (pe_offset,) = struct.unpack_from("<I", data, 0x3C)
+    if pe_offset + 4 + COFF_HEADER_SIZE > len(data) or data[pe_offset:pe_offset + 4] != b"PE\x00\x00":
+        raise PEError("PE signature must be 'PE'")
+
+    machine, _, _, _, _, optional_size, _ = struct.unpack_from("<HHIIIHH", data, pe_offset + 4)
+    if machine not in MACHINES:
+        raise PEError(f"Unable to handle machine: {machine:#x}")
+
+    optional_offset = pe_offset + 4 + COFF_HEADER_SIZE
+    if optional_size < SUBSYSTEM_OFFSET + 2 or optional_offset + optional_size > len(data):
+        raise PEError(f"Optional header is too small or truncated ({optional_size} bytes)")
+
+    (magic,) = struct.unpack_from("<H", data, optional_offset)
+    expected = MACHINES[machine][1]
+    if magic != expected:
+        raise PEError(f"Optional header magic {magic:#x} does not match machine {MACHINES[machine][0]} (expected {expected:#x})")
+
+    return PEHeader(machine, magic, optional_offset + CHECKSUM_OFFSET, optional_offset + SUBSYSTEM_OFFSET)
+
+
+def compute_checksum(data, checksum_offset: int) -> int:
+    """
+    The PE image checksum: 16-bit one's complement sum of the file, with the checksum field as zero, plus the file size.
+    """
+
+    words = array.array("H")
+    words.frombytes(data[:len(data) & ~1])
+    if sys.byteorder == "big":
+        words.byteswap()
+
+    total = sum(words)
+    if len(data) & 1:
+        total += data[-1]
+
+    # The checksum field isn't part of the sum. Bytes at odd offsets are the high halves of words.
+    total -= sum(data[i] << (8 * (i & 1)) for i in range(checksum_offset, checksum_offset + 4))
+
+    while total > 0xFFFF:
+        total = (total & 0xFFFF) + (total >> 16)
+
+    return (total + len(data)) & 0xFFFFFFFF
+
+
+def patch_files(paths: Iterable[str], subsystem: int | None, update_checksum: bool = False) -> List[Tuple[str, int]]:
+    """
+    Sets the subsystem of every file (unless None) and optionally recomputes the checksum, in place through mmap.
+    Returns (path, previous subsystem) for each file. Headers of all files are validated before any gets changed.
+    """
+
+    opened = []
+    try:
+        for path in paths:
+            f = open(path, "r+b")
+            try:
+                # mmap can't map empty files, and anything this small can't be valid anyway.
+                size = os.fstat(f.fileno()).st_size
+                if size < DOS_HEADER_SIZE:
+                    raise PEError(f"{path}: Too small to be a PE file ({size} bytes)")
+                mm = mmap.mmap(f.fileno(), 0)
+            except BaseException:
+                f.close()
+                raise
+            opened.append((path, f, mm))
+
+        headers = []
+        for path, _, mm in opened:
+            try:
+                headers.append(read_header(mm))
+            except PEError as e:
+                raise PEError(f"{path}: {e}") from None
+
+        results = []
+        for (path, _, mm), header in zip(opened, headers):
+            (old,) = struct.unpack_from("<H", mm, header.subsystem_offset)
+            if subsystem is not None and subsystem != old:
+                struct.pack_into("<H", mm, header.subsystem_offset, subsystem)
+
+            if update_checksum:
+                struct.pack_into("<I", mm, header.checksum_offset, compute_checksum(mm, header.checksum_offset))
+
+            mm.flush()
+            results.append((path, old))
+
+        return results
+    finally:
+        for _, f, mm in opened:
+            mm.close()
+            f.close()
+
+
+def set_gui_subsystem(executables: Iterable[str]) -> bool:
+    """
+    Marks executables as GUI programs, for the packaging scripts: Windows builds made elsewhere come out
+    as console programs. Failing doesn't stop a build, it prints a warning and returns False.
+    """
+
+    try:
+        patch_files(executables, SUBSYSTEM_GUI)
+        return True
+    except (OSError, PEError) as e:
+        print(f"Unable to set GUI subsystem: {e}")
+        return False
+
+
+if __name__ == '__main__':
+    main()
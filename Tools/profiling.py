@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+# Shared instrumentation for the packaging, validation, download and native build scripts.
+#
+# Scripts mark where their time goes with named phases, which can nest:
+#
+#   with phase("zip Resources"):
+#       ...
+#
+# Phases can be timed on any thread, but nesting is tracked per thread: a phase opened on a worker thread
+# doesn't know what the thread that submitted the work was in. Pass that along explicitly where it matters:
+#
+#   executor.submit(work, current_phase())  ...  with phase("link", parent):
+#
+# Phases in other processes (e.g. ProcessPoolExecutor workers) aren't recorded at all, only this process reports.
+#
+# and run their work through run_profiled(), which adds nothing unless asked to:
+#   --timings FILE   writes a JSON timing report: wall and CPU time, and count/total/max seconds per phase.
+#                    If ROBUST_TIMINGS_DIR is set, every run writes one there by default, for CI to collect.
+#   --profile FILE   profiles the run. FILE ending in .json gets speedscope output (https://www.speedscope.app),
+#                    sampled stacks of every thread plus the phases as a timeline. Anything else gets cProfile
+#                    stats of the main thread, for pstats or snakeviz.
+#
+# Run directly, this summarizes a set of reports, e.g. the ones collected from many CI runs:
+#
+#   profiling.py summarize timings/ [--json summary.json]
+
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+REPORT_VERSION = 1
+TIMINGS_DIR_ENV = "ROBUST_TIMINGS_DIR"
+
+# Nested phases are reported under their full path, like "linux-x64/publish".
+PHASE_SEPARATOR = "/"
+
+SAMPLE_INTERVAL = 0.001
+
+# CI run metadata for reports, from GitHub Actions' environment.
+CI_VARIABLES = {
+    "commit": "GITHUB_SHA",
+    "ref": "GITHUB_REF",
+    "workflow": "GITHUB_WORKFLOW",
+    "job": "GITHUB_JOB",
+    "run": "GITHUB_RUN_ID",
+    "attempt": "GITHUB_RUN_ATTEMPT",
+    "runner": "RUNNER_NAME",
+}
+
+T = TypeVar("T")
+
+# Phase path -> [count, total seconds, max seconds]
+phase_totals: Dict[str, List[Any]] = {}
+phase_lock = threading.Lock()
+# (thread id, phase path, start, end) of every phase, only recorded while a speedscope profile is being taken.
+phase_events: Optional[List[Tuple[int, str, float, float]]] = None
+phase_stacks = threading.local()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser("profiling.py", description="Summarizes timing reports written by the tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    summarize_parser = subparsers.add_parser("summarize", help="Per tool and phase statistics over many reports")
+    summarize_parser.add_argument("reports", nargs="+", help="Report files, or directories to search for them")
+    summarize_parser.add_argument("--json", metavar="FILE", help="Also write the summary to this file")
+
+    args = parser.parse_args()
+
+    reports = load_reports(args.reports)
+    if not reports:
+        print("No timing reports found")
+        return 1
+
+    summary = summarize(reports)
+    print_summary(summary)
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+
+    return 0
+
+
+class Phase:
+    """
+    Times a block of code, see phase().
+    """
+
+    __slots__ = ("name", "parent", "path", "start")
+
+    def __init__(self, name: str, parent: Optional[str] = None):
+        self.name = name
+        self.parent = parent
+
+    def __enter__(self) -> "Phase":
+        stack = getattr(phase_stacks, "stack", None)
+        if stack is None:
+            stack = phase_stacks.stack = []
+
+        parent = stack[-1] if stack else self.parent
+        self.path = parent + PHASE_SEPARATOR + self.name if parent else self.name
+        stack.append(self.path)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        elapsed = end - self.start
+        phase_stacks.stack.pop()
+
+        with phase_lock:
+            totals = phase_totals.get(self.path)
+            if totals is None:
+                phase_totals[self.path] = [1, elapsed, elapsed]
+            else:
+                totals[0] += 1
+                totals[1] += elapsed
+                totals[2] = max(totals[2], elapsed)
+
+            if phase_events is not None:
+                phase_events.append((threading.get_ident(), self.path, self.start, end))
+
+
+def phase(name: str, parent: Optional[str] = None) -> Phase:
+    """
+    Context manager that adds the time spent in it to the named phase.
+    Cheap enough (a few microseconds) to wrap every file of a loop in.
+
+    parent is the path to nest under when no phase is open on this thread yet,
+    for work running on behalf of another thread, see current_phase().
+    """
+
+    return Phase(name, parent)
+
+
+def current_phase() -> Optional[str]:
+    """
+    Full path of the innermost phase open on this thread, None if there's none.
+    """
+
+    stack = getattr(phase_stacks, "stack", None)
+    return stack[-1] if stack else None
+
+
+def add_profiling_arguments(parser: argparse.ArgumentParser):
+    # Absolute, some scripts change directories before they're done.
+    parser.add_argument("--profile", metavar="FILE", type=os.path.abspath,
+                        help="Profile the run. Writes speedscope JSON if FILE ends in .json, cProfile stats otherwise")
+    parser.add_argument("--timings", metavar="FILE", type=os.path.abspath,
+                        help=f"Write a JSON report of the time spent per phase. Defaults to a new file in ${TIMINGS_DIR_ENV} if set")
+
+
+def run_profiled(tool: str, args: argparse.Namespace, func: Callable[[], T]) -> T:
+    """
+    Runs func with the profiling and timing report asked for by the arguments from add_profiling_arguments().
+    The report is also written if func fails, with its exit code.
+    """
+
+    global phase_events
+
+    profile_path: Optional[str] = getattr(args, "profile", None)
+    report_path: Optional[str] = getattr(args, "timings", None)
+    if report_path is None and os.environ.get(TIMINGS_DIR_ENV):
+        report_path = default_report_path(tool)
+
+    profiler = None
+    sampler = None
+    if profile_path is not None:
+        if profile_path.endswith(".json"):
+            phase_events = []
+            sampler = Sampler()
+            sampler.start()
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+    started = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    exit_code = 1
+    try:
+        result = func()
+        exit_code = result if isinstance(result, int) else 0
+        return result
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        raise
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print(f"Wrote cProfile stats to {profile_path}", file=sys.stderr)
+
+        if sampler is not None:
+            sampler.stop()
+            write_speedscope(profile_path, tool, sampler, phase_events or [], start)
+            phase_events = None
+            print(f"Wrote speedscope profile to {profile_path}", file=sys.stderr)
+
+        if report_path is not None:
+            write_report(report_path, build_report(tool, started, wall, cpu, exit_code))
+
+
+def build_report(tool: str, started: datetime, wall: float, cpu: float, exit_code: int) -> Dict[str, Any]:
+    with phase_lock:
+        phases = {path: {"count": count, "seconds": round(total, 6), "max": round(longest, 6)}
+                  for path, (count, total, longest) in phase_totals.items()}
+
+    report = {
+        "version": REPORT_VERSION,
+        "tool": tool,
+        "argv": sys.argv[1:],
+        "started": started.isoformat(timespec="seconds"),
+        "exit_code": exit_code,
+        "wall": round(wall, 6),
+        "cpu": round(cpu, 6),
+        "python": platform.python_version(),
+        "platform": f"{platform.system()}-{platform.machine()}",
+        "phases": phases,
+    }
+
+    try:
+        import resource
+        # Kilobytes on Linux, bytes on macOS.
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report["max_rss_kib"] = max_rss // 1024 if sys.platform == "darwin" else max_rss
+    except ImportError:
+        # Windows.
+        pass
+
+    ci = {key: os.environ[name] for key, name in CI_VARIABLES.items() if name in os.environ}
+    if ci:
+        report["ci"] = ci
+
+    return report
+
+
+def default_report_path(tool: str) -> str:
+    directory = os.path.abspath(os.environ[TIMINGS_DIR_ENV])
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    return os.path.join(directory, f"{tool}-{stamp}-{os.getpid()}.json")
+
+
+def write_report(path: str, report: Dict[str, Any]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+class Sampler:
+    """
+    Samples the stacks of all other threads at a fixed interval, on a background thread.
+    Samples are weighted by the actual time since the previous one, so a late wakeup doesn't skew anything.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        # Code object -> index in frames.
+        self.frame_indices: Dict[Any, int] = {}
+        self.frames: List[Dict[str, Any]] = []
+        # Thread id -> ([stack of frame indices, outermost first], weights)
+        self.samples: Dict[int, Tuple[List[List[int]], List[float]]] = {}
+        self.thread_names: Dict[int, str] = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profiling sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            weight = now - last
+            last = now
+
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    stack.append(self.frame_index(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+
+                if ident not in self.samples:
+                    self.samples[ident] = ([], [])
+                    self.thread_names.update((t.ident, t.name) for t in threading.enumerate() if t.ident is not None)
+                stacks, weights = self.samples[ident]
+                stacks.append(stack)
+                weights.append(weight)
+
+    def frame_index(self, code) -> int:
+        index = self.frame_indices.get(code)
+        if index is None:
+            index = self.frame_indices[code] = len(self.frames)
+            self.frames.append({"name": code.co_qualname, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+
+def write_speedscope(path: str, tool: str, sampler: Sampler, events: List[Tuple[int, str, float, float]], origin: float):
+    frames = list(sampler.frames)
+    profiles = []
+    for ident, (stacks, weights) in sampler.samples.items():
+        profiles.append({
+            "type": "sampled",
+            "name": sampler.thread_names.get(ident, f"thread {ident}"),
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        })
+
+    # Phases as one timeline per thread. They're properly nested within a thread, which speedscope requires.
+    phase_frames: Dict[str, int] = {}
+    by_thread: Dict[int, List[Tuple[str, float, float]]] = {}
+    for ident, name, start, end in events:
+        by_thread.setdefault(ident, []).append((name, start - origin, end - origin))
+
+    for ident, phases in by_thread.items():
+        phases.sort(key=lambda p: (p[1], -p[2]))
+        timeline = []
+        open_phases: List[Tuple[int, float]] = []
+        for name, start, end in phases:
+            while open_phases and open_phases[-1][1] <= start:
+                frame, closed_at = open_phases.pop()
+                timeline.append({"type": "C", "frame": frame, "at": closed_at})
+
+            frame = phase_frames.get(name)
+            if frame is None:
+                frame = phase_frames[name] = len(frames)
+                frames.append({"name": name})
+            timeline.append({"type": "O", "frame": frame, "at": start})
+            open_phases.append((frame, end))
+
+        while open_phases:
+            frame, closed_at = open_phases.pop()
+            timeline.append({"type": "C", "frame": frame, "at": closed_at})
+
+        profiles.append({
+            "type": "evented",
+            "name": f"phases ({sampler.thread_names.get(ident, f'thread {ident}')})",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": timeline[-1]["at"],
+            "events": timeline,
+        })
+
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": tool,
+        "exporter": "profiling.py",
+        "shared": {"frames": frames},
+        "profiles": profiles,
+    }
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, separators=(",", ":"))
+
+
+def load_reports(paths: List[str]) -> List[Dict[str, Any]]:
+    reports = []
+    for path in find_report_files(paths):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            continue
+
+        if not isinstance(report, dict) or report.get("version") != REPORT_VERSION:
+            print(f"{path}: not a timing report", file=sys.stderr)
+            continue
+
+        reports.append(report)
+
+    return reports
+
+
+def find_report_files(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+
+def summarize(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Tool -> run count, wall time statistics and per phase statistics of the total seconds per run.
+    """
+
+    by_tool: Dict[str, List[Dict[str, Any]]] = {}
+    for report in reports:
+        by_tool.setdefault(report["tool"], []).append(report)
+
+    summary = {}
+    for tool, runs in sorted(by_tool.items()):
+        phase_seconds: Dict[str, List[float]] = {}
+        for run in runs:
+            for path, stats in run["phases"].items():
+                phase_seconds.setdefault(path, []).append(stats["seconds"])
+
+        summary[tool] = {
+            "runs": len(runs),
+            "failed": sum(1 for run in runs if run.get("exit_code")),
+            "wall": statistics(run["wall"] for run in runs),
+            "phases": {path: dict(statistics(seconds), runs=len(seconds)) for path, seconds in sorted(phase_seconds.items())},
+        }
+
+    return summary
+
+
+def statistics(values) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "mean": sum(values) / len(values),
+        "median": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "max": values[-1],
+    }
+
+
+def percentile(values: List[float], percent: float) -> float:
+    # Nearest rank on sorted values.
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def print_summary(summary: Dict[str, Any]):
+    for tool, data in summary.items():
+        wall = data["wall"]
+        failed = f", {data['failed']} failed" if data["failed"] else ""
+        print(f"{tool}: {data['runs']} run(s){failed}, wall median {wall['median']:.3f} s, p90 {wall['p90']:.3f} s, max {wall['max']:.3f} s")
+
+        if not data["phases"]:
+            continue
+
+        width = max(map(len, data["phases"]))
+        for path, stats in data["phases"].items():
+            print(f"  {path:<{width}}  median {stats['median']:>9.3f} s  p90 {stats['p90']:>9.3f} s  "
+                  f"max {stats['max']:>9.3f} s  ({stats['runs']} run(s))")
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,9 @@
+# Which files of a Resources tree are content, shared by the packaging scripts and the tools that look at
+# what gets shipped. Kept free of heavy imports, it's loaded by commands that should start fast.
+
+# Names of files in Resources that never get packaged.
+IGNORED_RESOURCES = {
+    ".gitignore",
+    ".directory",
+    ".DS_Store"
+}
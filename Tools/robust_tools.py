@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# One entry point for the Python tooling in Tools/, Schemas/ and native/.
+#
+#   Tools/robust_tools.py <command> [arguments of that command]
+#   Tools/robust_tools.py validate_rsis Resources/Textures
+#
+# Commands are the script names, and take exactly the same arguments as running the script directly.
+# Only the module of the command that's run gets imported, so this starts as fast as the script itself.
+# bench_startup.py checks that it stays that way.
+
+import importlib
+import os
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Command -> (directory, description). The module is the command name.
+COMMANDS: Dict[str, Tuple[str, str]] = {
+    # Packaging and release
+    "package_client_build": ("Tools", "Packages the client for release"),
+    "package_webview": ("Tools", "Packages Robust.Client.WebView for release"),
+    "macos_make_appbundle": ("Tools", "Assembles a macOS app bundle from build output"),
+    "pe_header": ("Tools", "Patches PE headers of Windows executables"),
+    "zip_chunks": ("Tools", "Chunk indexes for release zips, and delta rebuilding from them"),
+    "version": ("Tools", "Commits a version update and tags it"),
+    "native_build": ("native", "Builds and links the native libraries"),
+    # Content downloads
+    "download_manifest_file": ("Tools", "Downloads a file from a server build's manifest"),
+    "zstd_dictionary": ("Tools", "Trains and evaluates a zstd dictionary for resources"),
+    # Asset validation
+    "validate_assets": ("Schemas", "Validates RSIs, map files and attribution files in one pass"),
+    "validate_rsis": ("Schemas", "Validates RSIs"),
+    "validate_rga": ("Schemas", "Validates attribution files"),
+    "validate_mapfile": ("Schemas", "Validates the structure of map files"),
+    "check_map_refs": ("Schemas", "Checks entity references in map files"),
+    # Map and RSI tooling
+    "diff_maps": ("Schemas", "Entity-level diff of two map files"),
+    "map_stats": ("Schemas", "Entity, prototype and component statistics of map files"),
+    "mapfile_binary": ("Schemas", "Converts map files to the binary cache format"),
+    "bake_rsi_atlas": ("Schemas", "Bakes RSIs into texture atlases"),
+    "rsi_atlas_report": ("Schemas", "Reports how RSIs would pack into atlases"),
+    "optimize_pngs": ("Schemas", "Losslessly recompresses PNGs"),
+    # Benchmarks
+    "generate_asset_corpus": ("Schemas", "Generates a synthetic asset corpus"),
+    "bench_validators": ("Schemas", "Benchmarks the asset validators on synthetic corpora"),
+    "bench_map_cache": ("Schemas", "Benchmarks the binary map cache against YAML"),
+    "bench_rsi_schema": ("Schemas", "Benchmarks the compiled rsi.json check"),
+    "bench_startup": ("Tools", "Benchmarks startup time of these commands"),
+    "profiling": ("Tools", "Summarizes the timing reports of these commands across runs"),
+}
+
+# Commands whose module is named differently.
+MODULES = {
+    "native_build": "build",
+}
+
+
+def main() -> int:
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print_usage()
+        return 0
+
+    command = sys.argv[1]
+    if command not in COMMANDS:
+        print(f"Unknown command: {command}\n", file=sys.stderr)
+        print_usage()
+        return 2
+
+    return run(command, sys.argv[2:])
+
+
+def run(command: str, args: List[str]) -> int:
+    directory, _ = COMMANDS[command]
+    # Scripts import their siblings by plain module name.
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    module = importlib.import_module(MODULES.get(command, command))
+
+    sys.argv = [f"{command}.py"] + args
+    result = module.main()
+    return result if isinstance(result, int) else 0
+
+
+def print_usage():
+    print("usage: robust_tools.py <command> [arguments]\n\ncommands:")
+    width = max(map(len, COMMANDS))
+    for command, (_, description) in COMMANDS.items():
+        print(f"  {command:<{width}}  {description}")
+
+
+if __name__ == "__main__":
+    exit(main())
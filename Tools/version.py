@@ -120,4 +120,5 @@ def tag_exists(version: str):
     result = subprocess.run(["git", "tag", "-l", "v" + version], stdout=subprocess.PIPE, encoding="utf-8")
     return bool(result.stdout.strip())
 
-main()
+if __name__ == '__main__':
+    main()
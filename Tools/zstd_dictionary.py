@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Trains a zstd dictionary on a resources tree and evaluates how much it helps per-file blob compression.
+#
+# Content is downloaded as individually compressed blobs, and most of them are tiny (prototypes, locale files,
+# meta.json, shaders), where zstd without a dictionary has almost nothing to work with.
+# This reports total compressed size with and without the dictionary at several compression levels,
+# plus decode throughput, and can write out the dictionary and a dictionary-compressed blob set.
+#
+# Evaluation is done on files held out from training, so the numbers aren't flattered by the dictionary
+# having seen the exact files it's compressing.
+#
+# Blob set layout (--output):
+#   resources.dict      the dictionary
+#   blobs.txt           "zstd-dict <dictionary id>" header line, then "<hash> <compressed size> <path>" per file
+#   blobs/<hash>        blob contents, hash is BLAKE2b-256 of the uncompressed file like manifests use.
+#                       Compressed size 0 means the blob is stored uncompressed (compressing didn't help).
+#                       Blobs only use the dictionary if it makes them smaller.
+
+import argparse
+import hashlib
+import os
+import time
+from resource_files import IGNORED_RESOURCES
+from typing import List, Tuple, TYPE_CHECKING
+
+# zstandard is only imported once there's work to do, --help shouldn't wait on it.
+if TYPE_CHECKING:
+    import zstandard
+
+DEFAULT_DICT_SIZE = 112640
+DEFAULT_LEVELS = "3,9,19"
+DEFAULT_MAX_FILE_SIZE = 64 * 1024
+# Every Nth file is held out of training for evaluation.
+HOLDOUT_EVERY = 5
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Trains and evaluates a zstd dictionary for per-file resource compression.")
+    parser.add_argument("resources", nargs="?", default="Resources", help="Resources directory (default Resources)")
+    parser.add_argument("--dict-size", type=int, default=DEFAULT_DICT_SIZE,
+                        help=f"Maximum dictionary size in bytes (default {DEFAULT_DICT_SIZE}, capped to a tenth of the training data)")
+    parser.add_argument("--levels", default=DEFAULT_LEVELS, help=f"Comma separated compression levels to evaluate (default {DEFAULT_LEVELS})")
+    parser.add_argument("--max-file-size", type=int, default=DEFAULT_MAX_FILE_SIZE,
+                        help=f"Only train on files up to this size in bytes (default {DEFAULT_MAX_FILE_SIZE})")
+    parser.add_argument("-o", "--output", help="Write the dictionary and a dictionary-compressed blob set of all files to this directory")
+    parser.add_argument("--output-level", type=int, default=19, help="Compression level for the written blob set (default 19)")
+    args = parser.parse_args()
+
+    import zstandard
+
+    files = load_files(args.resources)
+    small = [(path, data) for path, data in files if len(data) <= args.max_file_size]
+    training = [data for i, (_, data) in enumerate(small) if i % HOLDOUT_EVERY != 0]
+    holdout = [data for i, (_, data) in enumerate(small) if i % HOLDOUT_EVERY == 0]
+
+    print(f"{len(files)} files, {len(small)} up to {args.max_file_size} bytes "
+          f"({len(training)} for training, {len(holdout)} held out for evaluation)")
+
+    dict_size = min(args.dict_size, max(1024, sum(map(len, training)) // 10))
+    start = time.perf_counter()
+    try:
+        dictionary = zstandard.train_dictionary(dict_size, training)
+    except zstandard.ZstdError as e:
+        print(f"Training failed, too few or too small samples? {e}")
+        exit(1)
+
+    print(f"Trained {len(dictionary.as_bytes())} byte dictionary (id {dictionary.dict_id()}) in {time.perf_counter() - start:.2f}s")
+
+    print()
+    print(f"{'level':>5} {'raw':>12} {'plain':>12} {'with dict':>12} {'saved':>8} {'decode plain':>14} {'decode dict':>14}")
+    for level in (int(level) for level in args.levels.split(",")):
+        report_level(holdout, dictionary, level)
+
+    if args.output:
+        write_blob_set(args.output, files, dictionary, args.output_level)
+
+
+def load_files(resources: str) -> List[Tuple[str, bytes]]:
+    files = []
+    for root, dirs, names in os.walk(resources):
+        dirs.sort()
+        for name in sorted(names):
+            if name in IGNORED_RESOURCES:
+                continue
+
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                files.append((os.path.relpath(path, resources).replace(os.sep, "/"), f.read()))
+
+    return files
+
+
+def report_level(samples: List[bytes], dictionary: "zstandard.ZstdCompressionDict", level: int):
+    import zstandard
+
+    plain = [compress_blob(zstandard.ZstdCompressor(level=level), data) for data in samples]
+    with_dict = [compress_blob(zstandard.ZstdCompressor(level=level, dict_data=dictionary), data) for data in samples]
+
+    raw_size = sum(map(len, samples))
+    plain_size = sum(len(blob) if blob is not None else len(data) for blob, data in zip(plain, samples))
+    dict_size = sum(len(blob) if blob is not None else len(data) for blob, data in zip(with_dict, samples))
+    saved = 1 - dict_size / plain_size if plain_size else 0.0
+
+    plain_speed = decode_throughput(zstandard.ZstdDecompressor(), plain, raw_size)
+    dict_speed = decode_throughput(zstandard.ZstdDecompressor(dict_data=dictionary), with_dict, raw_size)
+
+    print(f"{level:>5} {raw_size:>12} {plain_size:>12} {dict_size:>12} {saved:>8.1%} {plain_speed:>9.1f} MB/s {dict_speed:>9.1f} MB/s")
+
+
+def compress_blob(compressor: "zstandard.ZstdCompressor", data: bytes):
+    """
+    Like the server does it: a blob only gets stored compressed if that actually makes it smaller.
+    Returns None for blobs that are stored uncompressed.
+    """
+
+    compressed = compressor.compress(data)
+    return compressed if len(compressed) < len(data) else None
+
+
+def decode_throughput(decompressor: "zstandard.ZstdDecompressor", blobs: list, raw_size: int) -> float:
+    compressed = [blob for blob in blobs if blob is not None]
+    if not compressed:
+        return 0.0
+
+    # Repeat until there's enough time to measure.
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        for blob in compressed:
+            decompressor.decompress(blob)
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed > 0.2:
+            break
+
+    decoded = raw_size * rounds
+    return decoded / elapsed / 1_000_000
+
+
+def write_blob_set(output: str, files: List[Tuple[str, bytes]], dictionary: "zstandard.ZstdCompressionDict", level: int):
+    import zstandard
+
+    blob_dir = os.path.join(output, "blobs")
+    os.makedirs(blob_dir, exist_ok=True)
+
+    with open(os.path.join(output, "resources.dict"), "wb") as f:
+        f.write(dictionary.as_bytes())
+
+    compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+    plain_compressor = zstandard.ZstdCompressor(level=level)
+    total_raw = 0
+    total_plain = 0
+    total_stored = 0
+    lines = [f"zstd-dict {dictionary.dict_id()}"]
+    for path, data in files:
+        hash = hashlib.blake2b(data, digest_size=32).hexdigest().upper()
+        plain = compress_blob(plain_compressor, data)
+        blob = compress_blob(compressor, data)
+        # Big files don't gain anything from the dictionary and sometimes lose a little.
+        # Frames say whether they need a dictionary, so decoders handle either.
+        if blob is None or (plain is not None and len(plain) <= len(blob)):
+            blob = plain
+
+        with open(os.path.join(blob_dir, hash), "wb") as f:
+            f.write(blob if blob is not None else data)
+
+        total_raw += len(data)
+        total_plain += len(plain) if plain is not None else len(data)
+        total_stored += len(blob) if blob is not None else len(data)
+        lines.append(f"{hash} {len(blob) if blob is not None else 0} {path}")
+
+    with open(os.path.join(output, "blobs.txt"), "w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+
+    print()
+    dict_bytes = len(dictionary.as_bytes())
+    print(f"Wrote {len(files)} blobs to {output}: {total_raw} bytes raw, {total_plain} compressed without dictionary, "
+          f"{total_stored} with (+{dict_bytes} byte dictionary), saved {total_plain - total_stored - dict_bytes} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,13 +8,24 @@
 #
 
 import argparse
+import dataclasses
+import hashlib
+import json
 import os
 import subprocess
 import platform
 import shlex
+import struct
+import sys
 import tempfile
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from typing import Optional
+
+# The profiling helpers are shared with the scripts in Tools/.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "Tools"))
+from profiling import add_profiling_arguments, current_phase, phase, run_profiled
 
 @dataclass
 class LinkerData:
@@ -24,41 +35,112 @@ class LinkerData:
     lib_search_paths: list[str] = field(default_factory=list)
     pkg_config_libs: list[str] = field(default_factory=list)
     export_symbols: list[str] = field(default_factory=list)
-
-os.chdir(os.path.dirname(os.path.realpath(__file__)))
+    lto: bool = False
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--release", action="store_true")
+    parser.add_argument("--force-link", action="store_true", help="Relink even if the link inputs didn't change")
+    parser.add_argument("--lto", action="store_true",
+                        help="Cross-language LTO over the staticlibs on Linux. Needs clang and lld matching rustc's LLVM version")
+    add_profiling_arguments(parser)
 
     args = parser.parse_args()
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))
+    run_profiled("native_build", args, lambda: build(args))
+
+def build(args: argparse.Namespace):
     cmd = ["cargo", "build", "-p", "robust-native-server", "-p", "robust-native-client"]
     if args.release:
         cmd.append("--release")
 
-    subprocess.run(cmd, check=True)
+    env = None
+    if args.lto:
+        # Makes the staticlibs contain LLVM bitcode for the linker to optimize, instead of machine code.
+        env = dict(os.environ)
+        env["RUSTFLAGS"] = (env.get("RUSTFLAGS", "") + " -Clinker-plugin-lto").strip()
+
+    with phase("cargo"):
+        subprocess.run(cmd, check=True, env=env)
 
     target_dir = os.path.join("target", "debug")
     if args.release:
         target_dir = os.path.join("target", "release")
 
-    link(LinkerData(
+    client = LinkerData(
         out_file=os.path.join(target_dir, platform_dylib_name("robust_native_client")),
         inputs=[os.path.join(target_dir, platform_staticlib_name("robust_native_client"))],
         pkg_config_libs=["ogg", "opus", "vorbis"],
         export_symbols=read_symbols_def("ogg")
             + read_symbols_def("vorbis")
             + read_symbols_def("opus")
-            + read_symbols_def("client")))
+            + read_symbols_def("client"),
+        lto=args.lto)
 
-    link(LinkerData(
+    server = LinkerData(
         out_file=os.path.join(target_dir, platform_dylib_name("robust_native_server")),
-        inputs=[os.path.join(target_dir, platform_staticlib_name("robust_native_server"))]))
+        inputs=[os.path.join(target_dir, platform_staticlib_name("robust_native_server"))],
+        lto=args.lto)
+
+    # The linkers are separate processes, so threads are enough to run them side by side.
+    with ThreadPoolExecutor() as executor:
+        futures = [executor.submit(link_if_changed, data, args.force_link, current_phase()) for data in (client, server)]
+        for future in futures:
+            future.result()
+
+def link_if_changed(data: LinkerData, force: bool, parent_phase: Optional[str] = None):
+    """
+    Links unless the output exists and was linked from exactly the same inputs, symbol lists and flags.
+    Runs on a worker thread, parent_phase is what the submitting thread was timing.
+    """
+    hash_file = data.out_file + ".linkhash"
+    with phase("link hash", parent_phase):
+        input_hash = link_input_hash(data)
+
+    if not force and os.path.exists(data.out_file):
+        try:
+            with open(hash_file, "r") as f:
+                if f.read().strip() == input_hash:
+                    print(f"{data.out_file} is up to date")
+                    return
+        except FileNotFoundError:
+            pass
+
+    # Don't leave a matching hash behind if the link fails halfway.
+    if os.path.exists(hash_file):
+        os.remove(hash_file)
+
+    before = library_stats(data.out_file)
+    with phase("link", parent_phase):
+        link(data)
+    report_library_stats(data.out_file, before, library_stats(data.out_file))
+
+    with open(hash_file, "w") as f:
+        f.write(input_hash + "\n")
+
+def link_input_hash(data: LinkerData) -> str:
+    h = hashlib.sha256()
+    h.update(platform.system().encode("utf-8"))
+    h.update(json.dumps(dataclasses.asdict(data), sort_keys=True).encode("utf-8"))
+    h.update(json.dumps(get_pkg_config_linker_flags(data.pkg_config_libs)).encode("utf-8"))
+
+    # The linker flags themselves live in this file.
+    with open(os.path.realpath(__file__), "rb") as f:
+        h.update(f.read())
+
+    for input in data.inputs:
+        with open(input, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                h.update(chunk)
+
+    return h.hexdigest()
 
 def link(data: LinkerData):
     system = platform.system()
     if system == "Darwin":
         link_macos(data)
+    elif system == "Linux":
+        link_linux(data)
     else:
         raise NotImplementedError()
 
@@ -90,6 +172,93 @@ def link_macos(data: LinkerData):
 
     subprocess.run(args, check=True)
 
+def link_linux(data: LinkerData):
+    export_symbols = [n.strip() for n in data.export_symbols if n.strip()]
+
+    # Archive members only get pulled in when something references them,
+    # so mark every exported symbol as undefined up front.
+    inputs = [f"-Wl,--undefined={n}" for n in export_symbols] + data.inputs
+
+    # Same as -exported_symbols_list on macOS: only the listed symbols end up in .dynsym,
+    # everything else becomes local, which also lets --gc-sections drop what they don't reach.
+    # An empty list exports nothing, like on macOS.
+    version_script_file = tempfile.NamedTemporaryFile("w+", suffix=".map")
+    version_script_file.write("{\n")
+    if export_symbols:
+        version_script_file.write("  global:\n")
+        version_script_file.writelines((f"    {n};\n" for n in export_symbols))
+    version_script_file.write("  local: *;\n};\n")
+    version_script_file.flush()
+
+    # Unlike ld64, GNU ld resolves left to right, so the libraries have to come after the inputs.
+    args = [
+        "clang" if data.lto else "cc",
+        "-shared",
+        "-nodefaultlibs",
+        f"-Wl,-soname,{os.path.basename(data.out_file)}",
+        "-Wl,--as-needed",
+        "-Wl,--gc-sections",
+        "-Wl,-z,relro,-z,now",
+        "-o", data.out_file,
+        f"-Wl,--version-script={version_script_file.name}",
+    ]
+
+    if data.lto:
+        args.extend(["-flto", "-fuse-ld=lld", "-O2"])
+
+    args += inputs + get_pkg_config_linker_flags(data.pkg_config_libs)
+
+    args.extend(("-L" + p for p in data.lib_search_paths))
+    args.extend(("-l" + l for l in data.libs))
+    # What rustc reports as native-static-libs for a Linux staticlib.
+    args.extend(["-lgcc_s", "-lutil", "-lrt", "-lpthread", "-lm", "-ldl", "-lc"])
+
+    subprocess.run(args, check=True)
+
+def library_stats(path: str) -> dict | None:
+    """
+    Exported symbol count, .dynsym size and file size of a 64-bit little endian ELF library.
+    None if it doesn't exist or isn't one.
+    """
+    try:
+        with open(path, "rb") as f:
+            elf = f.read()
+    except FileNotFoundError:
+        return None
+
+    if elf[:4] != b"\x7fELF" or elf[4] != 2 or elf[5] != 1:
+        return None
+
+    (shoff,) = struct.unpack_from("<Q", elf, 0x28)
+    shentsize, shnum = struct.unpack_from("<HH", elf, 0x3A)
+
+    exported = 0
+    dynsym_size = 0
+    for i in range(shnum):
+        _, sh_type, _, _, sh_offset, sh_size, _, _, _, sh_entsize = struct.unpack_from("<IIQQQQIIQQ", elf, shoff + i * shentsize)
+        if sh_type != 11: # SHT_DYNSYM
+            continue
+
+        dynsym_size = sh_size
+        for sym_offset in range(sh_offset, sh_offset + sh_size, sh_entsize):
+            _, st_info, st_other, st_shndx = struct.unpack_from("<IBBH", elf, sym_offset)
+            # Defined, global or weak, default or protected visibility.
+            if st_shndx != 0 and (st_info >> 4) in (1, 2) and (st_other & 3) in (0, 3):
+                exported += 1
+
+    return {"exported": exported, "dynsym": dynsym_size, "size": len(elf)}
+
+def report_library_stats(path: str, before: dict | None, after: dict | None):
+    if after is None:
+        return
+
+    def describe(stats: dict) -> str:
+        return f"{stats['exported']} exported symbols, .dynsym {stats['dynsym']} bytes, {stats['size']} bytes"
+
+    print(f"{path}: {describe(after)}")
+    if before is not None:
+        print(f"{' ' * len(path)}  before: {describe(before)}")
+
 def get_pkg_config_linker_flags(names: list[str]) -> list[str]:
     if not names:
         return []
@@ -116,4 +285,5 @@ def platform_dylib_name(name: str) -> str:
 
     return f"lib{name}.so"
 
-main()
+if __name__ == '__main__':
+    main()